@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger('server')
+
+
+class AcceptLimiter:
+    """
+    新连接准入控制 (令牌桶)：平均每秒最多接受 rate 个连接，允许 burst 个突发。
+    令牌不足时接受线程/事件循环暂停 accept，新连接留在内核的 listen 队列中排队
+    """
+    def __init__(self, rate=200, burst=50):
+        self.rate = rate  # 0 表示不限制
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # 取得一个令牌返回 0；否则返回还需等待的秒数
+        if not self.rate:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        if self.rate:
+            with self.lock:
+                self.tokens = min(self.burst, self.tokens + 1)
+
+
+class SessionTable:
+    """
+    可恢复的客户端会话。客户端在 HELLO 中带上次分配的令牌，服务器据此恢复
+    该连接的协议级别和最新状态，客户端无需重新发送完整快照。
+    断开后会话保留 ttl 秒；服务器正常停止时保存到 path，重启后仍可恢复
+    """
+    def __init__(self, path='sessions.json', ttl=600):
+        self.path = path
+        self.ttl = ttl
+        self.active = {}  # 令牌 -> 会话
+        self.suspended = {}  # 令牌 -> (过期时间, 会话)
+        self._next_prune = 0
+        self.lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return 0
+        now = time.time()
+        with self.lock:
+            for token, (expires, session) in saved.items():
+                if expires > now:
+                    self.suspended[token] = (expires, session)
+        return len(self.suspended)
+
+    def save(self):
+        now = time.time()
+        with self.lock:
+            saved = {token: entry for token, entry in self.suspended.items() if entry[0] > now}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(saved, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        return len(saved)
+
+    def open(self, token, ip, level):
+        # 返回 (令牌, 会话, 是否恢复)；令牌无效、过期或 IP 不符时新建会话
+        now = time.time()
+        with self.lock:
+            entry = self.suspended.pop(token, None) if token else None
+            if entry and entry[0] > now and entry[1]['ip'] == ip:
+                session = entry[1]
+                session['level'] = level
+                self.active[token] = session
+                return token, session, True
+            token = os.urandom(16).hex()
+            session = {'ip': ip, 'level': level, 'state': None}
+            self.active[token] = session
+            return token, session, False
+
+    def restore(self, token, ip, level):
+        # 热重启：新进程接管仍在连接中的会话
+        with self.lock:
+            self.active[token] = {'ip': ip, 'level': level, 'state': None}
+
+    def close(self, token, state=None):
+        # 连接断开：记下最新状态，会话在 ttl 秒内可以恢复
+        with self.lock:
+            session = self.active.pop(token, None)
+            if session is not None:
+                if state is not None:
+                    session['state'] = state
+                self.suspended[token] = (time.time() + self.ttl, session)
+            now = time.time()
+            if now >= self._next_prune:
+                self.suspended = {t: e for t, e in self.suspended.items() if e[0] > now}
+                self._next_prune = now + 60
@@ -0,0 +1,1821 @@
+"""
+性能基准测试脚本
+
+用法:
+    python benchmark.py engine --engine selector --clients 2000 --messages 20
+    python benchmark.py protocol --messages 200000
+    python benchmark.py broadcast --engine selector --clients 2000 --slow 5
+    python benchmark.py sweep --hosts 4000 --subprocess 20
+    python benchmark.py telemetry --clients 1000 --days 2
+    python benchmark.py liveness --clients 20000
+    python benchmark.py delta --clients 200 --hours 1
+    python benchmark.py logging --threads 8 --messages 20000 --disk-delay 2
+    python benchmark.py registry --entries 100000 --updates 5000
+    python benchmark.py collectors --repeat 2000
+    python benchmark.py reconnect --clients 500 --downtime 2
+    python benchmark.py fleet --clients 5000 --output fleet_report.json
+    python benchmark.py metrics --messages 200000
+    python benchmark.py select --entries 20000
+    python benchmark.py power --clients 1000 --wave-size 50 --interval 0.5
+    python benchmark.py client --idle 30
+    python benchmark.py content --clients 50 --size 32
+    python benchmark.py handoff --engine selector --clients 1000
+    python benchmark.py shard --shards 4 --clients 2000
+    python benchmark.py logindex --size 1024 --devices 500
+"""
+import argparse
+import collections
+import contextlib
+import io
+import multiprocessing
+import os
+import selectors
+import socket
+import threading
+import time
+
+STATUS_MESSAGE = ("状态信息: IP: 127.0.0.1, 项目名称: 基准测试, CPU: 2.0%, 内存: 47.5%, "
+                  "启动时间: 2024-10-12 11:47:22, 运行时长: 1 day, 5:00:06")
+
+
+def rss_kb():
+    # 读取当前进程常驻内存（KB），仅 Linux 有效
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _load_worker(port, clients, messages, connected, go, done):
+    # 在独立进程里打开 clients 个连接，每个连接发送 messages 条状态信息
+    sockets = []
+    for _ in range(clients):
+        sock = socket.create_connection(('127.0.0.1', port))
+        sockets.append(sock)
+    connected.set()
+    go.wait()
+    payload = STATUS_MESSAGE.encode('utf-8')
+    for _ in range(messages):
+        for sock in sockets:
+            sock.sendall(payload)
+    done.wait()
+    for sock in sockets:
+        sock.close()
+
+
+def _reader_worker(port, clients, slow, connected, done):
+    # 打开 clients 个连接并持续读取，其中前 slow 个连接从不读取，模拟网络很差的展品
+    sockets = [socket.create_connection(('127.0.0.1', port)) for _ in range(clients)]
+    for sock in sockets[:slow]:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    selector = selectors.DefaultSelector()
+    for sock in sockets[slow:]:
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+    connected.set()
+    while not done.is_set():
+        for key, _ in selector.select(timeout=0.1):
+            try:
+                key.fileobj.recv(65536)
+            except OSError:
+                selector.unregister(key.fileobj)
+    for sock in sockets:
+        sock.close()
+
+
+def _reconnect_server(port, engine, accept_rate, stop, crash, result_queue):
+    # 服务器进程：记录每次接受连接的时间；stop 被设置后正常停止 (保存会话) 或直接退出 (模拟崩溃)
+    from server import ControlServer
+
+    accepts = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        server = ControlServer(host='127.0.0.1', port=port, engine=engine, accept_rate=accept_rate)
+        register = server.register_client
+
+        def register_client(client_address, client_socket):
+            accepts.append(time.monotonic())
+            register(client_address, client_socket)
+        server.register_client = register_client
+        server.start()
+        stop.wait()
+        result_queue.put(accepts)
+        if crash:
+            result_queue.close()
+            result_queue.join_thread()  # os._exit 不会等待队列的后台线程把数据写出
+            os._exit(0)
+        server.stop()
+
+
+def _reconnect_clients(port, clients, mode, ready, resumed, attempts, done):
+    # 模拟展项客户端。mode='fixed': 旧版行为，断线立即重连、失败后固定等待 5 秒;
+    # mode='backoff': 指数退避 + 抖动，并在 HELLO 中带会话令牌
+    from network_utils import ReconnectBackoff
+    from protocol import StreamDecoder, MSG_HELLO, encode_hello, decode_hello_session, encode_status
+
+    def count(value):
+        with value.get_lock():
+            value.value += 1
+
+    def run(index):
+        backoff = ReconnectBackoff(1, 30)
+        token = b''
+        delay_first = False
+        status = {'ip': f'10.1.{index // 256}.{index % 256}', 'project_name': f'展品{index}', 'cpu': 2.0,
+                  'memory': 40.0, 'boot_time': time.time() - 3600, 'uptime': 3600}
+        while not done.is_set():
+            if delay_first:
+                time.sleep(backoff.next_delay() if mode == 'backoff' else 5)
+            delay_first = True
+            count(attempts)
+            try:
+                sock = socket.create_connection(('127.0.0.1', port), timeout=30)
+            except OSError:
+                continue
+            try:
+                sock.sendall(encode_hello(token if mode == 'backoff' else b''))
+                decoder = StreamDecoder()
+                frames = []
+                while not frames:
+                    data = sock.recv(4096)
+                    if not data:
+                        raise OSError("连接已关闭")
+                    frames = [p for t, p in decoder.feed(data) if t == MSG_HELLO]
+                _, token, was_resumed = decode_hello_session(frames[0])
+                if not was_resumed:
+                    sock.sendall(encode_status(status))
+                else:
+                    count(resumed)
+                count(ready)
+                backoff.reset()
+                sock.settimeout(None)
+                while sock.recv(4096):
+                    pass
+            except OSError:
+                pass
+            finally:
+                sock.close()
+            delay_first = mode == 'backoff'  # 旧版断线后立即重连
+
+    threads = [threading.Thread(target=run, args=(i,), daemon=True) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    done.wait()
+
+
+def bench_reconnect(clients, mode, accept_rate, downtime, engine, crash):
+    # 所有客户端连上后停止服务器，downtime 秒后在同一端口重启，测量全部恢复所需时间和每 100ms 最多接受的连接数
+    import tempfile
+
+    directory = tempfile.mkdtemp(prefix='bench-reconnect-')
+    os.chdir(directory)
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    ctx = multiprocessing.get_context('fork')
+    ready, resumed, attempts = ctx.Value('i', 0), ctx.Value('i', 0), ctx.Value('i', 0)
+    done = ctx.Event()
+
+    def start_server():
+        stop = ctx.Event()
+        result_queue = ctx.Queue()
+        process = ctx.Process(target=_reconnect_server,
+                              args=(port, engine, accept_rate, stop, crash, result_queue), daemon=True)
+        process.start()
+        return process, stop, result_queue
+
+    def wait_ready(target, timeout=120):
+        start = time.monotonic()
+        while ready.value < target and time.monotonic() - start < timeout:
+            time.sleep(0.01)
+        return time.monotonic() - start
+
+    server, stop, result_queue = start_server()
+    time.sleep(0.5)
+    workers = []
+    per_process = 250
+    for offset in range(0, clients, per_process):
+        worker = ctx.Process(target=_reconnect_clients, daemon=True,
+                             args=(port, min(per_process, clients - offset), mode, ready, resumed, attempts, done))
+        worker.start()
+        workers.append(worker)
+    wait_ready(clients)
+    time.sleep(1)
+
+    stop.set()
+    result_queue.get()
+    server.join()
+    with ready.get_lock():
+        ready.value = 0
+    with attempts.get_lock():
+        attempts.value = 0
+    time.sleep(downtime)
+    server, stop, result_queue = start_server()
+    restarted = time.monotonic()
+    recovery = wait_ready(clients)
+    stop.set()
+    accepts = result_queue.get()
+    server.join()
+    done.set()
+    for worker in workers:
+        worker.join(timeout=5)
+
+    accepts = [t - restarted for t in accepts if t >= restarted]
+    windows = collections.Counter(int(t * 10) for t in accepts)
+    return {
+        'mode': mode,
+        'accept_rate': accept_rate,
+        'restart': 'crash' if crash else 'graceful',
+        'clients': clients,
+        'recovered': ready.value,
+        'recovery_s': round(recovery, 2),
+        'peak_accepts_per_100ms': max(windows.values()) if windows else 0,
+        'connect_attempts': attempts.value,
+        'resumed_sessions': resumed.value,
+    }
+
+
+def _isolated_target(result_queue, func, args):
+    result_queue.put(func(*args))
+
+
+def run_isolated(func, *args):
+    # 每个场景在全新的解释器里运行，避免上一个场景残留的线程和内存影响结果
+    ctx = multiprocessing.get_context('spawn')
+    result_queue = ctx.Queue()
+    process = ctx.Process(target=_isolated_target, args=(result_queue, func, args))
+    process.start()
+    result = result_queue.get()
+    process.join()
+    return result
+
+
+def bench_engine(engine, clients, messages, workers=1):
+    from server import ControlServer
+
+    marker = "状态信息:".encode('utf-8')
+
+    class CountingServer(ControlServer):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.received = 0
+            self.lock = threading.Lock()
+            self.finished = threading.Event()
+            self.expected = clients * messages
+
+        def handle_data(self, client_socket, client_address, data):
+            with self.lock:
+                self.received += data.count(marker)
+                if self.received >= self.expected:
+                    self.finished.set()
+            super().handle_data(client_socket, client_address, data)
+
+    server = CountingServer(host='127.0.0.1', port=0, engine=engine, workers=workers)
+    rss_before = rss_kb()
+    threads_before = threading.active_count()
+    with contextlib.redirect_stdout(io.StringIO()):
+        server.start()
+        connected, go, done = multiprocessing.Event(), multiprocessing.Event(), multiprocessing.Event()
+        worker = multiprocessing.Process(target=_load_worker,
+                                         args=(server.port, clients, messages, connected, go, done),
+                                         daemon=True)
+        worker.start()
+        connected.wait()
+        while len(server.clients) < clients:
+            time.sleep(0.05)
+        rss_connected = rss_kb()
+        threads_connected = threading.active_count()
+        start = time.perf_counter()
+        go.set()
+        completed = server.finished.wait(timeout=300)
+        elapsed = time.perf_counter() - start
+        done.set()
+        worker.join()
+        server.stop()
+
+    return {
+        'engine': engine,
+        'workers': workers,
+        'clients': clients,
+        'messages': server.received,
+        'completed': completed,
+        'seconds': round(elapsed, 3),
+        'msgs_per_sec': round(server.received / elapsed) if elapsed else 0,
+        'threads': threads_connected - threads_before,
+        'rss_per_conn_kb': round((rss_connected - rss_before) / clients, 1),
+    }
+
+
+def bench_protocol(messages):
+    # 对比旧文本协议和帧协议的解析耗时与字节数（不含网络）
+    from server import ControlServer
+    from protocol import StreamDecoder, encode_status, decode_status
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        server = ControlServer(host='127.0.0.1', port=0)
+    text = STATUS_MESSAGE.encode('utf-8')
+    status = {'ip': '127.0.0.1', 'project_name': '基准测试', 'cpu': 2.0, 'memory': 47.5,
+              'boot_time': time.time() - 104406, 'uptime': 104406.0}
+    frame = encode_status(status)
+
+    start = time.perf_counter()
+    for _ in range(messages):
+        message = text.decode('utf-8')
+        server.parse_and_save_client_info(message[5:].strip())
+    text_seconds = time.perf_counter() - start
+
+    # 每 32 帧一批送入解码器，模拟一次 recv 收到多帧
+    batch = frame * 32
+    decoder = StreamDecoder()
+    start = time.perf_counter()
+    for _ in range(messages // 32):
+        for msg_type, payload in decoder.feed(batch):
+            record = decode_status(payload)
+            server.update_client_info(record['ip'], record['project_name'])
+    frame_seconds = time.perf_counter() - start
+
+    return {
+        'text_bytes': len(text),
+        'frame_bytes': len(frame),
+        'text_msgs_per_sec': round(messages / text_seconds),
+        'frame_msgs_per_sec': round((messages // 32) * 32 / frame_seconds),
+    }
+
+
+def _fleet_server(engine, workers, pipe):
+    # 被测服务器进程：按管道中的指令广播、断开连接或返回资源占用统计
+    from server import ControlServer
+
+    counts = {'ingested': 0}
+    with contextlib.redirect_stdout(io.StringIO()):
+        server = ControlServer(host='127.0.0.1', port=0, engine=engine, workers=workers, accept_rate=0,
+                               broadcast_wait=10)
+        ingest_status = server.ingest_status
+        parse = server.parse_and_save_client_info
+
+        def counted_ingest(client_address, status):
+            counts['ingested'] += 1
+            ingest_status(client_address, status)
+
+        def counted_parse(info):
+            counts['ingested'] += 1
+            parse(info)
+        server.ingest_status = counted_ingest
+        server.parse_and_save_client_info = counted_parse
+        server.start()
+        pipe.send(server.port)
+        while True:
+            command, arg = pipe.recv()
+            if command == 'stats':
+                t = os.times()
+                pipe.send({'rss_kb': rss_kb(), 'cpu_s': t.user + t.system, 'ingested': counts['ingested'],
+                           'connections': len(server.client_outboxes), 'threads': threading.active_count()})
+            elif command == 'bocast':
+                started = time.time()
+                result = server.bocast(arg)
+                pipe.send({'started': started, 'total': result.total, 'delivered': result.delivered,
+                           'dropped': result.dropped})
+            elif command == 'command':
+                pending = server.run_command(arg)
+                pipe.send({'elapsed': time.time() - pending.started, 'counts': dict(pending.counts())})
+            elif command == 'metrics':
+                pipe.send(server.metrics.to_json())
+            elif command == 'shed':
+                for client_socket in list(server.client_outboxes)[:arg]:
+                    server.shed_client(client_socket, "基准测试断开")
+                pipe.send(True)
+            elif command == 'stop':
+                server.stop()
+                pipe.send(True)
+                return
+
+
+def bench_fleet(clients, processes, engine, workers, reports, rounds, steady, text_ratio, interval):
+    # 完整负载测试：连接、突发上报吞吐、广播端到端延迟、稳定状态 CPU、部分断线后的恢复
+    import json
+    import platform
+    import subprocess
+    import tempfile
+    from fleet_sim import Fleet
+
+    directory = tempfile.mkdtemp(prefix='bench-fleet-')
+    os.chdir(directory)
+    ctx = multiprocessing.get_context('spawn')
+    pipe, child = ctx.Pipe()
+    server_process = ctx.Process(target=_fleet_server, args=(engine, workers, child), daemon=True)
+    server_process.start()
+    port = pipe.recv()
+
+    def ask(command, arg=None):
+        pipe.send((command, arg))
+        return pipe.recv()
+
+    def percentile(values, p):
+        return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 2) if values else None
+
+    report = {'clients': clients, 'engine': engine, 'workers': workers, 'processes': processes,
+              'text_ratio': text_ratio, 'report_interval': interval}
+    baseline = ask('stats')
+    fleet = Fleet(port, clients, processes, interval, text_ratio)
+    start = time.time()
+    fleet.start()
+    report['all_connected'] = fleet.wait_ready()
+    report['connect_s'] = round(time.time() - start, 2)
+    connected = ask('stats')
+    report['connections'] = connected['connections']
+    report['server_threads'] = connected['threads']
+    report['rss_per_conn_kb'] = round((connected['rss_kb'] - baseline['rss_kb']) / clients, 2)
+    report['cpu_ms_per_connect'] = round((connected['cpu_s'] - baseline['cpu_s']) / clients * 1000, 3)
+
+    # 突发上报：每个客户端连续发送 reports 条状态，测量服务器处理速度
+    before = ask('stats')
+    start = time.time()
+    expected = before['ingested'] + fleet.burst(reports)
+    while True:
+        after = ask('stats')
+        if after['ingested'] >= expected or time.time() - start > 300:
+            break
+        time.sleep(0.05)
+    elapsed = time.time() - start
+    ingested = after['ingested'] - before['ingested']
+    report['ingest_msgs_per_sec'] = round(ingested / elapsed)
+    report['ingest_cpu_us_per_msg'] = round((after['cpu_s'] - before['cpu_s']) / max(1, ingested) * 1e6, 1)
+
+    # 广播 test：以各客户端收到指令的时间计算端到端延迟
+    fleet.stats()
+    latencies = []
+    delivered = dropped = 0
+    for _ in range(rounds):
+        result = ask('bocast', 'test')
+        delivered += result['delivered']
+        dropped += result['dropped']
+        received = []
+        deadline = time.time() + 30
+        while len(received) < result['delivered'] and time.time() < deadline:
+            received += fleet.stats()['test_times']
+            time.sleep(0.05)
+        latencies += [t - result['started'] for t in received]
+    latencies.sort()
+    report['bocast_targets'] = result['total']
+    report['bocast_p50_ms'] = percentile(latencies, 0.5)
+    report['bocast_p99_ms'] = percentile(latencies, 0.99)
+    report['bocast_max_ms'] = percentile(latencies, 1.0)
+    report['bocast_delivered'] = delivered
+    report['bocast_dropped'] = dropped
+
+    # 带编号的 test-all：所有设备回复或到达期限后得到完整的结果表
+    result = ask('command', 'test')
+    report['test_all_s'] = round(result['elapsed'], 3)
+    report['test_all_results'] = result['counts']
+
+    # 稳定状态：只有定期上报时服务器的 CPU 占用
+    before = ask('stats')
+    time.sleep(steady)
+    after = ask('stats')
+    report['steady_cpu_percent'] = round((after['cpu_s'] - before['cpu_s']) / steady * 100, 1)
+    report['steady_msgs_per_sec'] = round((after['ingested'] - before['ingested']) / steady)
+
+    # 断开 10% 的连接，测量客户端全部重连所需时间
+    shed = max(1, clients // 10)
+    ask('shed', shed)
+    start = time.time()
+    time.sleep(0.2)
+    report['reconnected'] = fleet.wait_ready()
+    report['reconnect_10pct_s'] = round(time.time() - start, 2)
+
+    report['server_metrics'] = ask('metrics')
+    fleet.stop()
+    ask('stop')
+    server_process.join(timeout=10)
+    try:
+        version = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        version = None
+    report['version'] = version
+    report['python'] = platform.python_version()
+    report['platform'] = platform.platform()
+    report['cpus'] = os.cpu_count()
+    report['timestamp'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    return json.loads(json.dumps(report))
+
+
+def bench_broadcast(engine, clients, slow, rounds, size):
+    from server import ControlServer
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        server = ControlServer(host='127.0.0.1', port=0, engine=engine,
+                               outbox_max_bytes=size * 4, slow_client_timeout=2, broadcast_wait=5)
+        server.start()
+        connected, done = multiprocessing.Event(), multiprocessing.Event()
+        worker = multiprocessing.Process(target=_reader_worker,
+                                         args=(server.port, clients, slow, connected, done),
+                                         daemon=True)
+        worker.start()
+        connected.wait()
+        while len(server.client_outboxes) < clients:
+            time.sleep(0.05)
+        # 本地所有连接的 IP 相同，直接对每个连接广播
+        server.client_sockets = {f'sim-{i}': sock for i, sock in enumerate(list(server.client_outboxes))}
+        message = 'x' * size
+        latencies = []
+        results = []
+        for _ in range(rounds):
+            result = server.bocast(message)
+            results.append(result)
+            latencies.append(result.latency if result.latency is not None else float('inf'))
+        done.set()
+        worker.join()
+        server.stop()
+
+    latencies.sort()
+    last = results[-1]
+    return {
+        'engine': engine,
+        'clients': clients,
+        'slow': slow,
+        'rounds': rounds,
+        'latency_p50_ms': round(latencies[len(latencies) // 2] * 1000, 1),
+        'latency_max_ms': round(latencies[-1] * 1000, 1),
+        'last_delivered': last.delivered,
+        'last_dropped': last.dropped,
+        'total_dropped': sum(r.dropped for r in results),
+    }
+
+
+def bench_sweep(hosts, subprocess_hosts, timeout):
+    # 一半主机在 127.0.0.0/8 (端口关闭，立即 RST 即可达)，
+    # 一半在基准测试专用的 198.18.0.0/15 (无应答，超时或路由不可达)
+    import shutil
+    from network_utils import sweep, ping_test
+
+    alive = [f'127.{i >> 16 & 255}.{i >> 8 & 255}.{(i & 255)}' for i in range(1, hosts // 2 + 1)]
+    dead = [f'198.{18 + (i >> 16 & 1)}.{i >> 8 & 255}.{i & 255}' for i in range(1, hosts - hosts // 2 + 1)]
+    start = time.perf_counter()
+    results = sweep(alive + dead, timeout=timeout, concurrency=256)
+    sweep_seconds = time.perf_counter() - start
+    report = {
+        'hosts': len(results),
+        'reachable': sum(1 for reachable, _ in results.values() if reachable),
+        'sweep_seconds': round(sweep_seconds, 3),
+    }
+
+    # 旧方式: 每台主机启动一个 ping 进程，按主机数线性外推
+    sample = alive[:subprocess_hosts]
+    if not shutil.which('ping'):
+        report['subprocess'] = '系统中没有 ping 命令，跳过'
+    elif sample:
+        start = time.perf_counter()
+        answered = sum(1 for ip in sample if ping_test(ip))
+        per_host = (time.perf_counter() - start) / len(sample)
+        report['subprocess_answered'] = f'{answered}/{len(sample)}'
+        report['subprocess_seconds_per_host'] = round(per_host, 4)
+    return report
+
+
+def bench_telemetry(clients, days, interval=30):
+    # 写入 clients 个客户端 days 天的模拟数据，然后测量各类查询的耗时
+    import random
+    import shutil
+    import tempfile
+    from telemetry_store import TelemetryStore
+
+    directory = tempfile.mkdtemp(prefix='telemetry-bench-')
+    store = TelemetryStore(directory)
+    keys = [f'展品{i}@10.{i // 256 % 256}.{i % 256}.1' for i in range(clients)]
+    rng = random.Random(1)
+    end = time.time()
+    start = end - days * 86400
+    records = 0
+    t0 = time.perf_counter()
+    ts = start
+    while ts < end:
+        for key in keys:
+            store.append(key, ts, rng.uniform(0, 100), rng.uniform(30, 60))
+        records += clients
+        ts += interval
+        if int(ts - start) % 3600 < interval:
+            store.flush()
+    store.flush(force=True)
+    ingest_seconds = time.perf_counter() - t0
+    disk_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+    def timed(func, repeat=20):
+        t = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return round((time.perf_counter() - t) / repeat * 1000, 3)
+
+    key = keys[clients // 2]
+    report = {
+        'clients': clients,
+        'records': records,
+        'ingest_per_sec': round(records / ingest_seconds),
+        'disk_bytes_per_record': round(disk_bytes / records, 2),
+        'latest_ms': timed(lambda: store.latest(key), 1000),
+        'stats_1h_ms': timed(lambda: store.window_stats(key, 'cpu', end - 3600, end)),
+        'stats_all_ms': timed(lambda: store.window_stats(key, 'cpu', start, end)),
+        'series_all_1h_step_ms': timed(lambda: store.series(key, 'cpu', start, end, 3600)),
+        'top10_5min_ms': timed(lambda: store.top_n(10, 'cpu', 300, end), 5),
+    }
+    # 冷启动：新实例只有磁盘数据
+    cold = TelemetryStore(directory)
+    report['cold_stats_all_ms'] = timed(lambda: cold.window_stats(key, 'cpu', start, end), 1)
+    report['cold_stats_all_cached_ms'] = timed(lambda: cold.window_stats(key, 'cpu', start, end))
+    shutil.rmtree(directory)
+    return report
+
+
+def bench_liveness(clients):
+    # 旧方式每次扫描 client_info 并连接 last_seen；新方式直接读取在线集合
+    from liveness import LivenessTracker
+
+    tracker = LivenessTracker(default_timeout=90)
+    client_info = {}
+    now = time.time()
+    for i in range(clients):
+        ip = f'10.{i // 65536}.{i // 256 % 256}.{i % 256}'
+        client_info[f'展品{i}@{ip}'] = {'ip': ip, 'project_name': f'展品{i}'}
+        if i % 2 == 0:
+            tracker.touch(ip, now)
+    last_seen = tracker.last_seen
+
+    def scan():
+        return sum(1 for info in client_info.values() if time.time() - last_seen.get(info['ip'], 0) < 90)
+
+    def timed(func, repeat=50):
+        t = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return round((time.perf_counter() - t) / repeat * 1000, 4)
+
+    t = time.perf_counter()
+    for i in range(clients):
+        tracker.touch(f'10.{i // 65536}.{i // 256 % 256}.{i % 256}', now + 30)
+    touch_us = (time.perf_counter() - t) / clients * 1e6
+    t = time.perf_counter()
+    expired = tracker.expire(now + 1000)
+    expire_ms = (time.perf_counter() - t) * 1000
+    return {
+        'clients': clients,
+        'scan_count_ms': timed(scan),
+        'tracker_count_ms': timed(tracker.online_count),
+        'tracker_list_ms': timed(tracker.online_ips),
+        'touch_us': round(touch_us, 3),
+        'expire_all_ms': round(expire_ms, 2),
+        'went_offline': len(expired),
+    }
+
+
+def bench_delta(clients, hours, sample_interval=5, heartbeat_interval=60):
+    # 模拟空闲展厅：CPU/内存小幅抖动，偶尔出现负载尖峰；比较三种上报方式的流量和服务器处理耗时
+    import random
+    import tempfile
+    import shutil
+    from server import ControlServer
+    from protocol import (encode_hello, encode_status, encode_delta, encode_heartbeat,
+                          format_status)
+
+    thresholds = {'cpu': 5.0, 'memory': 2.0}
+    rng = random.Random(1)
+    boot_time = time.time() - 3600
+    streams = {'text': [], 'binary': [], 'delta': []}
+    for i in range(clients):
+        ip = f'10.0.{i // 256}.{i % 256}'
+        text, binary, delta = [], [], []
+        last_sent = None
+        last_send_time = 0
+        for step in range(int(hours * 3600 / sample_interval)):
+            now = step * sample_interval
+            spike = rng.random() < 0.01
+            status = {'ip': ip, 'project_name': f'展品{i}', 'boot_time': boot_time, 'uptime': 3600 + now,
+                      'cpu': round((30 if spike else 2) + rng.uniform(-1, 1), 1),
+                      'memory': round(47.5 + rng.uniform(-0.3, 0.3), 1)}
+            if now % 30 == 0:
+                text.append(f"状态信息: {format_status(status)}".encode('utf-8'))
+                binary.append(encode_status(status))
+            if last_sent is None:
+                delta.append(encode_status(status))
+                last_sent = {'cpu': status['cpu'], 'memory': status['memory']}
+                last_send_time = now
+                continue
+            changes = {m: status[m] for m, t in thresholds.items() if abs(status[m] - last_sent[m]) >= t}
+            if changes:
+                delta.append(encode_delta(changes))
+                last_sent.update(changes)
+                last_send_time = now
+            elif now - last_send_time >= heartbeat_interval:
+                delta.append(encode_heartbeat())
+                last_send_time = now
+        streams['text'].append((ip, text))
+        streams['binary'].append((ip, binary))
+        streams['delta'].append((ip, delta))
+
+    report = {'clients': clients, 'hours': hours}
+    for mode, per_client in streams.items():
+        directory = tempfile.mkdtemp(prefix='bench-delta-')
+        with contextlib.redirect_stdout(io.StringIO()):
+            server = ControlServer(host='127.0.0.1', port=0, telemetry_dir=directory)
+        messages = sum(len(m) for _, m in per_client)
+        size = sum(len(b) for _, m in per_client for b in m)
+        sockets = []
+        for ip, _ in per_client:
+            sock = socket.socket()
+            sockets.append(sock)
+            server.register_client(ip, sock)
+            if mode != 'text':
+                server.handle_data(sock, ip, encode_hello())
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for sock, (ip, data) in zip(sockets, per_client):
+                for message in data:
+                    server.handle_data(sock, ip, message)
+        elapsed = time.perf_counter() - start
+        for sock in sockets:
+            sock.close()
+        server.telemetry.close()
+        shutil.rmtree(directory)
+        report[mode] = {'messages': messages, 'bytes': size,
+                        'bytes_per_client_hour': round(size / clients / hours),
+                        'ingest_ms': round(elapsed * 1000, 1)}
+    return report
+
+
+def bench_logging(mode, threads, messages, disk_delay_ms):
+    # 多个线程同时写状态日志，测量调用方看到的吞吐量和单次调用延迟；
+    # disk_delay_ms 模拟每次 flush 的磁盘延迟
+    import tempfile
+    import shutil
+    import logger_config
+
+    directory = tempfile.mkdtemp(prefix='bench-log-')
+    os.chdir(directory)
+    options = {'sync': {'async': False}, 'async': {'async': True}, 'json': {'async': True, 'format': 'json'},
+               'sampled': {'async': True, 'sample': {'收到数据: 状态信息': 10}}}[mode]
+    flush = logger_config.BatchRotatingFileHandler.flush
+    if disk_delay_ms:
+        def slow_flush(self):
+            time.sleep(disk_delay_ms / 1000)
+            flush(self)
+        # 同步模式每条日志 flush 一次；异步模式每批 flush 一次
+        logger_config.BatchRotatingFileHandler.flush = slow_flush
+    try:
+        log = logger_config.setup_logger('bench', 'bench', options=options)
+        message = "收到数据: " + STATUS_MESSAGE
+        latencies = []
+
+        def worker():
+            local = []
+            for _ in range(messages):
+                t = time.perf_counter()
+                log.info(message)
+                local.append(time.perf_counter() - t)
+            latencies.extend(local)
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        call_seconds = time.perf_counter() - start
+        for handler in log.handlers:
+            handler.close()
+        drain_seconds = time.perf_counter() - start
+        size = sum(os.path.getsize(name) for name in os.listdir(directory))
+        os.chdir('/')
+        shutil.rmtree(directory)
+        latencies.sort()
+        total = threads * messages
+        return {
+            'mode': mode,
+            'calls_per_sec': round(total / call_seconds),
+            'p50_us': round(latencies[total // 2] * 1e6, 1),
+            'p99_us': round(latencies[int(total * 0.99)] * 1e6, 1),
+            'all_written_s': round(drain_seconds, 2),
+            'file_kb': size // 1024,
+        }
+    finally:
+        # 恢复原来的 flush，以免拖慢同一进程中之后的测试
+        logger_config.BatchRotatingFileHandler.flush = flush
+
+
+def bench_registry(entries, updates):
+    # 旧方式: 整表 indent=4 重写 / 全量解析；新方式: 追加日志 + 快照 + 重放
+    import json
+    import tempfile
+    import shutil
+    from registry import ClientRegistry
+
+    directory = tempfile.mkdtemp(prefix='bench-registry-')
+    path = os.path.join(directory, 'Proj_Ip_table.json')
+    table = {f'展品{i}@10.{i // 65536}.{i // 256 % 256}.{i % 256}':
+             {'ip': f'10.{i // 65536}.{i // 256 % 256}.{i % 256}', 'project_name': f'展品{i}'}
+             for i in range(entries)}
+
+    t = time.perf_counter()
+    with open(path, 'w') as f:
+        json.dump(table, f, indent=4)
+    old_save_ms = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    with open(path, 'r') as f:
+        json.load(f)
+    old_load_ms = (time.perf_counter() - t) * 1000
+
+    registry = ClientRegistry(path, compact_threshold=updates * 10)
+    registry.load()
+    t = time.perf_counter()
+    for i in range(updates):
+        registry.put(f'新展品{i}@172.16.{i // 256 % 256}.{i % 256}',
+                     {'ip': f'172.16.{i // 256 % 256}.{i % 256}', 'project_name': f'新展品{i}'})
+    put_us = (time.perf_counter() - t) / updates * 1e6
+    registry.journal.close()  # 模拟崩溃：没有保存快照
+
+    recovered = ClientRegistry(path)
+    t = time.perf_counter()
+    snapshot_entries, replayed = recovered.load()
+    recover_ms = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    recovered.compact()
+    compact_ms = (time.perf_counter() - t) * 1000
+    recovered.close()
+    fresh = ClientRegistry(path)
+    t = time.perf_counter()
+    fresh.load()
+    compact_load_ms = (time.perf_counter() - t) * 1000
+    fresh.close()
+    shutil.rmtree(directory)
+    return {
+        'entries': entries,
+        'old_save_ms': round(old_save_ms),
+        'old_load_ms': round(old_load_ms),
+        'journal_put_us': round(put_us, 1),
+        'recover_ms': round(recover_ms),
+        'recovered': len(recovered.data),
+        'replayed': replayed,
+        'compact_ms': round(compact_ms),
+        'load_after_compact_ms': round(compact_load_ms),
+    }
+
+
+def bench_collectors(repeat):
+    # 每个采集插件单次采集的耗时，以及旧版状态上报与插件化上报的单次耗时
+    import json
+    import psutil
+    import system_info
+
+    def timed(func):
+        t = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return round((time.perf_counter() - t) / repeat * 1e6, 1)
+
+    config = system_info.load_config()
+    pssoft_path = config.get('pssoft_path', 'D:\\pssoft')
+    report = {}
+    for collector in system_info.build_collectors(config).collectors:
+        report[f'{collector.name}_collect_us'] = timed(lambda: collector.collect(time.time()))
+
+    def old_project_name():
+        with open(system_info.CONFIG_FILE, 'r') as f:
+            path = json.load(f).get('pssoft_path', 'D:\\pssoft')
+        try:
+            return [f for f in os.listdir(path) if os.path.isdir(os.path.join(path, f))]
+        except OSError:
+            return []
+
+    def old_report():
+        # 旧版每次上报: 重新读配置并扫描目录，boot_time 读取两次
+        old_project_name()
+        psutil.boot_time()
+        return (psutil.cpu_percent(), psutil.virtual_memory().percent, psutil.boot_time())
+
+    metrics = system_info.build_collectors(config)
+    report['project_name_old_us'] = timed(old_project_name)
+    report['project_name_cached_us'] = timed(system_info.get_project_name)
+    report['report_old_us'] = timed(old_report)
+    report['report_new_us'] = timed(lambda: system_info.get_system_status(
+        '127.0.0.1', system_info.get_project_name(), metrics))
+    report['fields_new'] = sorted(system_info.get_system_status('127.0.0.1', '', metrics))
+    report['pssoft_path'] = pssoft_path
+    return report
+
+
+def bench_metrics(messages, clients=100):
+    # 指标采集的开销：单次计数/直方图记录的耗时，以及开启和关闭指标时的状态处理与发送速度
+    import tempfile
+    import shutil
+    from server import ControlServer
+    from server_metrics import Counter, Histogram, DISABLED
+    from broadcast import Outbox
+    from protocol import encode_hello, encode_status
+
+    def per_call_ns(func, repeat=1000000):
+        t = time.perf_counter()
+        for _ in range(repeat):
+            func(1)
+        return round((time.perf_counter() - t) / repeat * 1e9)
+
+    report = {'messages': messages,
+              'counter_inc_ns': per_call_ns(Counter('c', '').inc),
+              'histogram_observe_ns': per_call_ns(Histogram('h', '').observe),
+              'disabled_call_ns': per_call_ns(DISABLED.inc)}
+    boot_time = time.time() - 3600
+    streams = []
+    for i in range(clients):
+        ip = f'10.0.{i // 256}.{i % 256}'
+        streams.append((ip, [encode_status({'ip': ip, 'project_name': f'展品{i}', 'boot_time': boot_time,
+                                            'uptime': 3600, 'cpu': float(n % 50), 'memory': 40.0})
+                             for n in range(messages // clients)]))
+    for enabled in (False, True):
+        label = 'on' if enabled else 'off'
+        directory = tempfile.mkdtemp(prefix='bench-metrics-')
+        with contextlib.redirect_stdout(io.StringIO()):
+            server = ControlServer(host='127.0.0.1', port=0, telemetry_dir=directory, metrics_enabled=enabled)
+        sockets = []
+        for ip, _ in streams:
+            sock = socket.socket()
+            sockets.append(sock)
+            server.register_client(ip, sock)
+            server.handle_data(sock, ip, encode_hello())
+        start = time.perf_counter()
+        for sock, (ip, data) in zip(sockets, streams):
+            for message in data:
+                server.handle_data(sock, ip, message)
+        report[f'ingest_us_per_msg_{label}'] = round((time.perf_counter() - start) / messages * 1e6, 2)
+
+        # 发送路径：放入发送队列再写入本地 socket
+        a, b = socket.socketpair()
+        b.setblocking(False)
+        outbox = Outbox(1 << 20, server.metrics)
+        payload = b'x' * 64
+        start = time.perf_counter()
+        for n in range(messages):
+            outbox.push(payload)
+            outbox.flush(a)
+            if n % 256 == 0:
+                try:
+                    while b.recv(65536):
+                        pass
+                except BlockingIOError:
+                    pass
+        report[f'send_us_per_msg_{label}'] = round((time.perf_counter() - start) / messages * 1e6, 2)
+        a.close()
+        b.close()
+        for sock in sockets:
+            sock.close()
+        server.telemetry.close()
+        server.registry.close()
+        shutil.rmtree(directory)
+    report['ingest_overhead_pct'] = round(
+        (report['ingest_us_per_msg_on'] / report['ingest_us_per_msg_off'] - 1) * 100, 1)
+    report['send_overhead_pct'] = round((report['send_us_per_msg_on'] / report['send_us_per_msg_off'] - 1) * 100, 1)
+    return report
+
+
+def bench_select(entries, repeat=200):
+    # 按项目名称前缀、标签、网段选择设备：索引查询与遍历 client_info 的耗时对比
+    import ipaddress
+    from client_index import ClientIndex
+
+    infos = {}
+    for i in range(entries):
+        ip = f'10.{i // 65536}.{i // 256 % 256}.{i % 256}'
+        name = f'展厅{chr(ord("A") + i % 20)}-{i}'
+        info = {'ip': ip, 'project_name': name}
+        if i % 50 == 0:
+            info['tags'] = ['vip']
+        infos[f'{name}@{ip}'] = info
+    start = time.perf_counter()
+    index = ClientIndex()
+    for key, info in infos.items():
+        index.add(key, info)
+    report = {'entries': entries, 'build_ms': round((time.perf_counter() - start) * 1000, 1)}
+
+    network = ipaddress.ip_network('10.0.7.0/24')
+    scans = {
+        'prefix': ('展厅C-*', lambda: {i['ip'] for i in infos.values() if i['project_name'].startswith('展厅C-')}),
+        'tag': ('tag:vip', lambda: {i['ip'] for i in infos.values() if 'vip' in i.get('tags', ())}),
+        'subnet': ('10.0.7.0/24', lambda: {i['ip'] for i in infos.values()
+                                           if ipaddress.ip_address(i['ip']) in network}),
+    }
+    for name, (selector, scan) in scans.items():
+        assert index.select(selector) == scan()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            index.select(selector)
+        indexed = (time.perf_counter() - start) / repeat
+        start = time.perf_counter()
+        for _ in range(max(1, repeat // 20)):
+            scan()
+        scanned = (time.perf_counter() - start) / max(1, repeat // 20)
+        report[name] = {'matches': len(index.select(selector)), 'index_us': round(indexed * 1e6, 1),
+                        'scan_us': round(scanned * 1e6, 1)}
+    return report
+
+
+def bench_power(clients, wave_size, interval, drop):
+    # 分批关机与网络唤醒：模拟客户端按 drop 比例丢失指令，本地 UDP 端口代替网卡接收唤醒包。
+    # 服务器的各线程会随时输出连接信息，整个测试期间屏蔽标准输出
+    with contextlib.redirect_stdout(io.StringIO()):
+        return _bench_power(clients, wave_size, interval, drop)
+
+
+def _bench_power(clients, wave_size, interval, drop):
+    import random
+    import tempfile
+    from server import ControlServer
+    from fleet_sim import Fleet, sim_address
+    from commands import ANSWERED
+
+    directory = tempfile.mkdtemp(prefix='bench-power-')
+    os.chdir(directory)
+    listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    listener.bind(('127.0.0.1', 0))
+    options = {'wave_size': wave_size, 'interval': interval, 'retries': 3, 'wake_timeout': 1.0,
+               'wol_address': '127.0.0.1', 'wol_port': listener.getsockname()[1]}
+    server = ControlServer(host='127.0.0.1', port=0, engine='selector', accept_rate=0, command_timeout=1.0,
+                           power_options=options)
+    server.start()
+    report = {'clients': clients, 'wave_size': wave_size, 'interval': interval, 'drop': drop}
+
+    def run(action, selector=None):
+        operation = server.power_operation(action, selector)
+        while not operation.finished:
+            time.sleep(0.05)
+        return operation
+
+    # 关机：统计每批发出的指令数和全部确认所需的时间
+    fleet = Fleet(server.port, clients, interval=0, ignore_ratio=drop)
+    fleet.start()
+    fleet.wait_ready()
+    for i in range(clients):
+        server.update_client_info(sim_address(i), f'展厅{i % 4}-{i}')
+    operation = run('shutdown')
+    states = collections.Counter(operation.done.values())
+    report['shutdown'] = {'seconds': round(operation.finished - operation.started, 2), 'waves': operation.waves,
+                          'acknowledged': states[ANSWERED], 'not_acknowledged': clients - states[ANSWERED],
+                          'retried': sum(1 for n in operation.attempts.values() if n > 1),
+                          'max_per_wave': wave_size * len({server.power.group_of(sim_address(i))
+                                                           for i in range(clients)})}
+    fleet.stop()
+    time.sleep(0.5)
+
+    # 唤醒：收到唤醒包的"设备"经过启动时间后上线；按 drop 比例丢失唤醒包
+    for i in range(clients):
+        server.set_mac(sim_address(i), '02:00:%02x:%02x:%02x:%02x' % (i >> 24 & 255, i >> 16 & 255, i >> 8 & 255, i & 255))
+    ip_of_mac = {bytes.fromhex(server.mac_of(sim_address(i)).replace(':', '')): sim_address(i)
+                 for i in range(clients)}
+    received = collections.Counter()
+    arrivals = []
+    rng = random.Random(1)
+
+    def boot(ip):
+        server.liveness.touch(ip)
+
+    def listen():
+        listener.settimeout(0.5)
+        while True:
+            try:
+                packet = listener.recv(200)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            ip = ip_of_mac.get(packet[6:12])
+            if ip is None or packet[:6] != b'\xff' * 6 or packet[6:] != packet[6:12] * 16:
+                continue
+            received[ip] += 1
+            arrivals.append(time.time())
+            if received[ip] % options.get('wol_repeat', 2) == 1 and rng.random() >= drop:
+                threading.Timer(0.2, boot, (ip,)).start()
+
+    threading.Thread(target=listen, daemon=True).start()
+    for i in range(clients):
+        server.liveness.mark_offline(sim_address(i))
+    operation = run('wake')
+    states = collections.Counter(operation.done.values())
+    per_interval = collections.Counter(int((t - operation.started) / interval) for t in arrivals)
+    report['wake'] = {'seconds': round(operation.finished - operation.started, 2), 'waves': operation.waves,
+                      'online': states['已上线'], 'not_online': clients - states['已上线'],
+                      'packets': len(arrivals), 'macs_reached': len(received),
+                      'max_packets_per_interval': max(per_interval.values(), default=0)}
+    listener.close()
+    server.stop()
+    return report
+
+
+def bench_client(runtime, idle, sample_interval):
+    # 启动真实的 client.py 子进程连接本地服务器：测量从启动到服务器收到第一条状态的时间，
+    # 以及空闲 idle 秒内的 CPU 时间、主动让出 CPU 的次数 (唤醒次数)、常驻内存和线程数
+    with contextlib.redirect_stdout(io.StringIO()):
+        return _bench_client(runtime, idle, sample_interval)
+
+
+def _bench_client(runtime, idle, sample_interval):
+    import json
+    import subprocess
+    import sys
+    import tempfile
+    import psutil
+    from server import ControlServer
+
+    directory = tempfile.mkdtemp(prefix='bench-client-')
+    os.chdir(directory)
+    server = ControlServer(host='127.0.0.1', port=0, engine='selector', accept_rate=0)
+    first_status = threading.Event()
+    ingest = server.ingest_status
+
+    def ingest_status(client_address, status):
+        first_status.set()
+        ingest(client_address, status)
+    server.ingest_status = ingest_status
+    server.start()
+
+    client_dir = os.path.join(directory, 'client')
+    os.mkdir(client_dir)
+    config = {'server_ip': '127.0.0.1', 'server_port': server.port, 'pssoft_path': client_dir,
+              'runtime': runtime, 'telemetry': 'delta', 'sample_interval': sample_interval}
+    with open(os.path.join(client_dir, 'client_config.json'), 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'client.py')
+    start = time.perf_counter()
+    child = subprocess.Popen([sys.executable, script], cwd=client_dir,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    report = {'runtime': runtime, 'idle_s': idle, 'sample_interval': sample_interval}
+    try:
+        if not first_status.wait(30):
+            report['error'] = "30 秒内没有收到状态"
+            return report
+        report['startup_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        process = psutil.Process(child.pid)
+        time.sleep(1)  # 等首次上报的收尾工作完成
+        cpu = process.cpu_times()
+        switches = process.num_ctx_switches()
+        time.sleep(idle)
+        cpu_after = process.cpu_times()
+        switches_after = process.num_ctx_switches()
+        report['idle_cpu_ms'] = round((cpu_after.user + cpu_after.system - cpu.user - cpu.system) * 1000, 1)
+        report['wakeups_per_s'] = round((switches_after.voluntary - switches.voluntary) / idle, 2)
+        report['rss_kb'] = process.memory_info().rss // 1024
+        report['threads'] = process.num_threads()
+    finally:
+        child.kill()
+        child.wait()
+        server.stop()
+    return report
+
+
+def _content_client(index, port, directory, ready):
+    # 模拟一台展项: 以独立的源地址连接，用 ContentUpdater 把推送应用到 directory
+    from fleet_sim import sim_address
+    from content_sync import ContentUpdater
+    from protocol import StreamDecoder, MSG_HELLO, encode_hello
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind((sim_address(index), 0))
+    sock.connect(('127.0.0.1', port))
+    lock = threading.Lock()
+
+    def send(data):
+        with lock:
+            sock.sendall(data)
+
+    updater = ContentUpdater(send, lambda name: directory)
+    decoder = StreamDecoder()
+    send(encode_hello())
+    while True:
+        try:
+            data = sock.recv(256 * 1024)
+        except OSError:
+            return
+        if not data:
+            return
+        for msg_type, payload in decoder.feed(data):
+            if msg_type == MSG_HELLO:
+                ready.release()
+            else:
+                updater.handle(msg_type, payload)
+
+
+def bench_content(clients, size_mb, files):
+    # 内容推送: 替换整个视频、修改视频中的 1MB、再推送一次未变化的目录，
+    # 统计服务器推送阶段的磁盘读取量、发送量和耗时，并与逐台完整复制对比
+    with contextlib.redirect_stdout(io.StringIO()):
+        return _bench_content(clients, size_mb, files)
+
+
+def _bench_content(clients, size_mb, files):
+    import hashlib
+    import random
+    import tempfile
+    from server import ControlServer
+    from fleet_sim import sim_address
+
+    rng = random.Random(1)
+    directory = tempfile.mkdtemp(prefix='bench-content-')
+    os.chdir(directory)
+    size = size_mb * 1024 * 1024
+
+    def write(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    # 设备上的旧版本: 旧视频和 files 个小文件；各设备目录用硬链接共享同一份数据
+    write('old/video.mp4', rng.randbytes(size))
+    for i in range(files):
+        write(f'old/images/{i}.png', rng.randbytes(200 * 1024))
+    write('old/config.json', b'{"volume": 50}')
+    write('source/video.mp4', rng.randbytes(size))
+    for i in range(files):
+        os.makedirs('source/images', exist_ok=True)
+        os.link(f'old/images/{i}.png', f'source/images/{i}.png')
+    write('source/config.json', b'{"volume": 80}')
+    targets = []
+    for i in range(clients):
+        target = os.path.join(directory, f'client{i}', 'pssoft', '展厅')
+        for root, _, names in os.walk('old'):
+            for name in names:
+                path = os.path.join(target, os.path.relpath(os.path.join(root, name), 'old'))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.link(os.path.join(root, name), path)
+        targets.append(target)
+
+    server = ControlServer(host='127.0.0.1', port=0, engine='selector', accept_rate=0)
+    server.start()
+    ready = threading.Semaphore(0)
+    for i in range(clients):
+        threading.Thread(target=_content_client, args=(i, server.port, targets[i], ready), daemon=True).start()
+    for _ in range(clients):
+        ready.acquire()
+    ips = [sim_address(i) for i in range(clients)]
+    total = sum(os.path.getsize(os.path.join(root, name))
+                for root, _, names in os.walk('source') for name in names)
+    report = {'clients': clients, 'directory_mb': round(total / 1048576, 1)}
+
+    def push(name):
+        start = time.perf_counter()
+        operation = server.content.push('source', ips)
+        while not operation.finished:
+            time.sleep(0.02)
+        report[name] = {
+            'seconds': round(time.perf_counter() - start, 2),
+            'server_send_seconds': round(operation.send_seconds, 2),
+            'results': dict(collections.Counter(operation.results.values())),
+            'server_read_mb': round(operation.bytes_read / 1048576, 1),
+            'sent_mb': round(operation.bytes_sent / 1048576, 1),
+            'sent_per_client_mb': round(operation.bytes_sent / clients / 1048576, 2),
+        }
+
+    def digest(path):
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    push('replace_video')
+    # 修改视频中间的 1MB (同时插入 100 字节，使后面的数据整体偏移)
+    with open('source/video.mp4', 'rb') as f:
+        video = f.read()
+    middle = len(video) // 2
+    write('source/video.mp4', video[:middle] + rng.randbytes(1024 * 1024 + 100) + video[middle + 1024 * 1024:])
+    push('edit_1mb')
+    push('unchanged')
+    expected = digest('source/video.mp4')
+    report['verified'] = all(digest(os.path.join(target, 'video.mp4')) == expected for target in targets)
+    # 对比: 逐台完整复制需要读取和发送 clients 倍的目录大小
+    report['full_copy_mb'] = round(total * clients / 1048576, 1)
+    server.stop()
+    return report
+
+
+class _ServerProcess:
+    # 以子进程运行 server.py，通过标准输入发送控制台命令，后台线程收集输出
+    def __init__(self, directory, *args):
+        import subprocess
+        import sys
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+        self.lines = []
+        self.cond = threading.Condition()
+        self.process = subprocess.Popen([sys.executable, script, *args], cwd=directory, text=True,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT)
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            with self.cond:
+                self.lines.append(line.rstrip('\n'))
+                self.cond.notify_all()
+
+    def wait_for(self, pattern, timeout=60, start=0):
+        # 返回第一行匹配 pattern 的输出的 re.Match，超时返回 None
+        import re
+        deadline = time.time() + timeout
+        with self.cond:
+            while True:
+                for line in self.lines[start:]:
+                    match = re.search(pattern, line)
+                    if match:
+                        return match
+                remaining = deadline - time.time()
+                if remaining <= 0 or self.process.poll() is not None:
+                    return None
+                self.cond.wait(remaining)
+
+    def command(self, text):
+        mark = len(self.lines)
+        self.process.stdin.write(text + '\n')
+        self.process.stdin.flush()
+        return mark
+
+    def kill(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+
+def bench_handoff(engine, clients, processes):
+    # 热重启与冷重启对比: 客户端断线数、服务器不收发的时间、重启后 test-all 的回复情况
+    import json
+    import tempfile
+    from fleet_sim import Fleet
+
+    directory = tempfile.mkdtemp(prefix='bench-handoff-')
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    config = {'host': '127.0.0.1', 'port': port, 'engine': engine, 'accept_rate': 0, 'metrics_port': None,
+              'handoff_socket': 'server.handoff', 'slow_client_timeout': 2}
+    with open(os.path.join(directory, 'server_config.json'), 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+    report = {'engine': engine, 'clients': clients}
+    old = _ServerProcess(directory)
+    new = None
+    fleet = Fleet(port, clients, processes, interval=1)
+    try:
+        if not old.wait_for('服务器正在监听'):
+            report['error'] = "旧进程没有启动"
+            return report
+        fleet.start()
+        report['all_connected'] = fleet.wait_ready()
+        time.sleep(2)  # 稳定上报一段时间
+        before = fleet.stats()
+
+        # 热重启: 新进程接管监听 socket 和所有连接
+        start = time.time()
+        new = _ServerProcess(directory, '--takeover')
+        match = new.wait_for(r'已接管 (\d+) 个连接')
+        report['hot_restart_s'] = round(time.time() - start, 2)
+        report['hot_adopted'] = int(match.group(1)) if match else 0
+        paused = old.wait_for(r'暂停收发 (\d+)ms', timeout=10)
+        report['hot_io_pause_ms'] = int(paused.group(1)) if paused else None
+        old.process.wait(timeout=10)
+        report['hot_old_exited'] = old.process.returncode == 0
+        time.sleep(2)
+        after = fleet.stats()
+        report['hot_disconnects'] = after['disconnects'] - before['disconnects']
+        report['hot_reports_during'] = after['reports'] - before['reports']
+        mark = new.command('test-all')
+        result = new.wait_for(r"指令 #\d+ 'test': (.*)", start=mark)
+        report['hot_test_all'] = result.group(1) if result else None
+
+        # 冷重启: quit 之后重新启动，所有客户端断线重连
+        before = fleet.stats()
+        start = time.time()
+        new.command('quit')
+        new.process.wait(timeout=30)
+        new = _ServerProcess(directory)
+        new.wait_for('服务器正在监听')
+        deadline = time.time() + 120
+        while time.time() < deadline:
+            stats = fleet.stats()
+            if stats['disconnects'] - before['disconnects'] >= clients and stats['ready'] >= clients:
+                break
+            time.sleep(0.1)
+        report['cold_restart_s'] = round(time.time() - start, 2)
+        report['cold_disconnects'] = stats['disconnects'] - before['disconnects']
+    finally:
+        fleet.stop()
+        old.kill()
+        if new:
+            new.kill()
+    return report
+
+
+def bench_shard(shards, clients, processes):
+    # 本机启动 shards 个分片进程和协调器：设备分布、经协调器转发/广播/汇总的耗时，
+    # 以及一个分片故障和恢复时改变归属的设备数 (与取模分配对比)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return _bench_shard(shards, clients, processes)
+
+
+def _bench_shard(shards, clients, processes):
+    import json
+    import tempfile
+    from fleet_sim import Fleet, sim_address
+    from sharding import HashRing
+
+    root = tempfile.mkdtemp(prefix='bench-shard-')
+    os.chdir(root)
+    probes = []
+    for _ in range(shards * 2):
+        probe = socket.socket()
+        probe.bind(('127.0.0.1', 0))
+        probes.append(probe)
+    free = [probe.getsockname()[1] for probe in probes]
+    for probe in probes:
+        probe.close()
+    ports, admin_ports = free[:shards], free[shards:]
+    names = [f'127.0.0.1:{port}' for port in ports]
+    directories = []
+    for i in range(shards):
+        directory = os.path.join(root, f'shard{i}')
+        os.mkdir(directory)
+        config = {'host': '127.0.0.1', 'port': ports[i], 'engine': 'selector', 'accept_rate': 0,
+                  'metrics_port': None, 'handoff_socket': None,
+                  'shard': {'name': names[i], 'servers': names, 'admin_port': admin_ports[i]}}
+        with open(os.path.join(directory, 'server_config.json'), 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+        directories.append(directory)
+    from coordinator import ShardCoordinator
+    servers = [_ServerProcess(directory) for directory in directories]
+    coordinator = ShardCoordinator([{'name': names[i], 'admin': f'127.0.0.1:{admin_ports[i]}'}
+                                    for i in range(shards)], poll_interval=0.5)
+    fleet = Fleet(ports, clients, processes, interval=5)
+    report = {'shards': shards, 'clients': clients}
+
+    def distribution():
+        stats = fleet.stats()
+        return [stats[f'ready@{port}'] for port in ports]
+
+    def wait_stable(timeout=60):
+        # 所有设备就绪且分布连续 1 秒不变
+        start = time.time()
+        last = None
+        stable_since = None
+        while time.time() - start < timeout:
+            current = distribution()
+            if sum(current) == clients and current == last:
+                if time.time() - stable_since >= 1:
+                    return current, round(stable_since - start, 2)
+            else:
+                stable_since = time.time()
+            last = current
+            time.sleep(0.1)
+        return last, None
+
+    try:
+        for server in servers:
+            server.wait_for('管理端口')
+        coordinator.start()
+        fleet.start()
+        before, report['connect_s'] = wait_stable()
+        report['distribution'] = before
+        report['max_over_mean'] = round(max(before) / (clients / shards), 2)
+
+        start = time.perf_counter()
+        online = coordinator.online_clients()
+        report['merge_online_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        report['merged_online'] = len(online)
+        start = time.perf_counter()
+        sample = [sim_address(i) for i in range(0, clients, max(1, clients // 50))]
+        sent = sum(coordinator.send_to_client(ip, 'hello') for ip in sample)
+        report['routed_send_ms'] = round((time.perf_counter() - start) * 1000 / len(sample), 2)
+        report['routed_sent'] = f'{sent}/{len(sample)}'
+        fleet.stats()
+        result = coordinator.bocast('test')
+        time.sleep(1)
+        report['bocast_delivered'] = result['delivered']
+        report['bocast_received'] = len(fleet.stats()['test_times'])
+
+        # 分片 0 故障: 只有它的设备移动到环上的下一个分片
+        servers[0].kill()
+        start = time.time()
+        after, report['failover_s'] = wait_stable()
+        report['failover_distribution'] = after
+        report['failover_moved'] = before[0]
+        report['failover_others_lost'] = sum(max(0, b - a) for b, a in zip(before[1:], after[1:]))
+
+        # 分片 0 恢复: 协调器下发分片列表，原属于它的设备回来
+        servers[0] = _ServerProcess(directories[0])
+        restored, report['restore_s'] = wait_stable()
+        report['restore_distribution'] = restored
+        report['restore_moved_back'] = restored[0]
+
+        # 对比: 按 hash % 分片数 分配时，减少一个分片需要移动的设备比例
+        ring = HashRing(names)
+        keys = [f'模拟展项{i}@{sim_address(i)}' for i in range(clients)]
+        modulo_moved = sum(1 for key in keys if HashRing._hash(key) % shards != HashRing._hash(key) % (shards - 1))
+        ring_moved = sum(1 for key in keys if ring.owner(key) != ring.owner(key, set(names[1:])))
+        report['ring_moved_pct'] = round(ring_moved * 100 / clients, 1)
+        report['modulo_moved_pct'] = round(modulo_moved * 100 / clients, 1)
+    finally:
+        fleet.stop()
+        coordinator.stop()
+        for server in servers:
+            server.kill()
+    return report
+
+
+def _write_server_logs(directory, devices, start, days, interval, rng):
+    # 生成 days 天的模拟服务器日志：每台设备每 interval 秒一条状态，偶尔异常断开和重启
+    import datetime
+    exhibits = [(f'展厅{i % 8}-展品{i}', f'10.{i // 256 % 256}.{i % 256}.{i % 7 + 1}') for i in range(devices)]
+    uptimes = [rng.randrange(3600, 30 * 86400) for _ in range(devices)]
+    status_lines = disconnects = 0
+    for day in range(days):
+        day_start = start + day * 86400
+        name = datetime.datetime.fromtimestamp(day_start).strftime('server_%Y-%m-%d.log')
+        with open(os.path.join(directory, name), 'w', encoding='utf-8') as f:
+            for ts in range(day_start, day_start + 86400, interval):
+                stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))
+                lines = []
+                for i, (project, ip) in enumerate(exhibits):
+                    if rng.random() < 0.0005:
+                        lines.append(f"{stamp} ERROR: Client {ip} 异常退出: [Errno 104] Connection reset by peer\n")
+                        disconnects += 1
+                        uptimes[i] = rng.randrange(60, 600)  # 断开后重启
+                        continue
+                    uptimes[i] += interval
+                    lines.append(f"{stamp} INFO: 收到数据: 状态信息: IP: {ip}, 项目名称: {project}, "
+                                 f"CPU: {rng.random() * 60:.1f}%, 内存: {40 + rng.random() * 20:.1f}%, "
+                                 f"启动时间: 2024-10-12 11:47:22, "
+                                 f"运行时长: {datetime.timedelta(seconds=uptimes[i])}\n")
+                    status_lines += 1
+                f.write(''.join(lines))
+    return status_lines, disconnects
+
+
+def _scan_logs(directory):
+    # 对照组：逐行读取并用正则解析全部日志，按展项计算 CPU 均值和 P95
+    import array
+    import glob
+    import re
+    pattern = re.compile(r'状态信息: IP: ([^,]+), 项目名称: ([^,]*), CPU: ([\d.]+)%')
+    cpu = {}
+    for path in sorted(glob.glob(os.path.join(directory, 'server_*.log*'))):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                match = pattern.search(line)
+                if match:
+                    key = f'{match.group(2)}@{match.group(1)}'
+                    values = cpu.get(key)
+                    if values is None:
+                        values = cpu[key] = array.array('f')
+                    values.append(float(match.group(3)))
+    result = {}
+    for key, values in cpu.items():
+        values = sorted(values)
+        result[key] = (sum(values) / len(values), values[int(0.95 * (len(values) - 1))])
+    return result
+
+
+def bench_logindex(size_mb, devices, workers, interval=30):
+    # 生成约 size_mb MB 的服务器日志：首次建立索引、追加日志后的增量更新、报表查询的耗时，
+    # 与每次全量逐行扫描对比
+    import random
+    import shutil
+    import tempfile
+    from log_index import LogIndex
+
+    directory = tempfile.mkdtemp(prefix='bench-logindex-')
+    index_dir = os.path.join(directory, 'log_index')
+    rng = random.Random(1)
+    # 每行约 190 字节
+    days = max(1, round(size_mb * 1024 * 1024 / (devices * 86400 / interval * 190)))
+    start = int(time.mktime(time.strptime('2026-09-01', '%Y-%m-%d')))
+    t = time.perf_counter()
+    status_lines, disconnects = _write_server_logs(directory, devices, start, days, interval, rng)
+    generate_seconds = time.perf_counter() - t
+    log_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+    report = {'devices': devices, 'days': days, 'log_mb': round(log_bytes / 1048576, 1),
+              'status_lines': status_lines, 'generate_seconds': round(generate_seconds, 1),
+              'cpu_count': os.cpu_count(), 'workers': workers or os.cpu_count()}
+    t = time.perf_counter()
+    baseline = _scan_logs(directory)
+    report['full_scan_seconds'] = round(time.perf_counter() - t, 2)
+
+    index = LogIndex(index_dir)
+    stats = index.update(directory, workers)
+    report['build_seconds'] = stats['seconds']
+    report['build_parse_seconds'] = stats['parse_seconds']
+    report['build_mb_per_sec'] = round(stats['bytes'] / 1048576 / stats['seconds'], 1)
+    report['indexed_rows'] = stats['rows']
+    report['index_mb'] = round(sum(os.path.getsize(os.path.join(index_dir, name))
+                                   for name in os.listdir(index_dir)) / 1048576, 2)
+
+    # 最后一天的日志文件继续写入 (跨过午夜)，追加量相当于一小时的日志
+    last_day = time.strftime('server_%Y-%m-%d.log', time.localtime(start + (days - 1) * 86400))
+    appended = os.path.getsize(os.path.join(directory, last_day))
+    extra_dir = tempfile.mkdtemp(prefix='bench-logindex-extra-')
+    _, extra_disconnects = _write_server_logs(extra_dir, devices, start + days * 86400, 1, interval * 24, rng)
+    extra = os.path.join(extra_dir, os.listdir(extra_dir)[0])
+    with open(extra, 'rb') as src, open(os.path.join(directory, last_day), 'ab') as dst:
+        shutil.copyfileobj(src, dst)
+    shutil.rmtree(extra_dir)
+    appended = os.path.getsize(os.path.join(directory, last_day)) - appended
+    stats = index.update(directory, workers)
+    report['append_mb'] = round(appended / 1048576, 1)
+    report['incremental_seconds'] = stats['seconds']
+    report['noop_update_seconds'] = index.update(directory, workers)['seconds']
+
+    def timed(func, repeat=5):
+        t = time.perf_counter()
+        for _ in range(repeat):
+            result = func()
+        return round((time.perf_counter() - t) / repeat * 1000, 1), result
+
+    cold = LogIndex(index_dir)  # 新实例，模拟命令行每次启动
+    report['report_all_ms'], result = timed(lambda: LogIndex(index_dir).report(), 3)
+    report['report_one_day_ms'], _ = timed(
+        lambda: cold.report(since=time.strftime('%Y-%m-%d', time.localtime(start)),
+                            until=time.strftime('%Y-%m-%d', time.localtime(start))))
+    report['report_exhibit_ms'], _ = timed(lambda: cold.report(exhibit='展厅3-'))
+    report['exhibits'] = len(result)
+    report['disconnects'] = sum(item['disconnects'] for item in result.values())
+    report['disconnect_lines'] = disconnects + extra_disconnects
+    # 与全量扫描的结果对比 (P95 按 1% 一档的直方图估算)
+    errors = [(abs(result[key]['cpu_avg'] - avg), abs(result[key]['cpu_p95'] - p95))
+              for key, (avg, p95) in baseline.items()]
+    report['max_avg_error'] = round(max(e[0] for e in errors), 2)
+    report['max_p95_error'] = round(max(e[1] for e in errors), 2)
+    report['speedup_vs_scan'] = round(report['full_scan_seconds'] * 1000 / report['report_all_ms'])
+    shutil.rmtree(directory)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ControlServer 性能基准测试")
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    p = sub.add_parser('engine', help="比较线程模式与事件循环模式的连接数和吞吐量")
+    p.add_argument('--engine', choices=['thread', 'selector', 'both'], default='both')
+    p.add_argument('--clients', type=int, default=1000)
+    p.add_argument('--messages', type=int, default=20)
+    p.add_argument('--workers', type=int, default=1)
+
+    p = sub.add_parser('protocol', help="比较文本协议与帧协议的解析速度和报文大小")
+    p.add_argument('--messages', type=int, default=200000)
+
+    p = sub.add_parser('broadcast', help="测量广播完成耗时以及慢速客户端的隔离效果")
+    p.add_argument('--engine', choices=['thread', 'selector', 'both'], default='both')
+    p.add_argument('--clients', type=int, default=1000)
+    p.add_argument('--slow', type=int, default=5)
+    p.add_argument('--rounds', type=int, default=20)
+    p.add_argument('--size', type=int, default=16384)
+
+    p = sub.add_parser('sweep', help="比较并发 TCP 探测与逐台 ping 子进程的耗时")
+    p.add_argument('--hosts', type=int, default=4000)
+    p.add_argument('--subprocess', type=int, default=20, help="用 ping 子进程探测的样本主机数")
+    p.add_argument('--timeout', type=float, default=1.0)
+
+    p = sub.add_parser('telemetry', help="遥测时序存储的写入速度、磁盘占用和查询耗时")
+    p.add_argument('--clients', type=int, default=1000)
+    p.add_argument('--days', type=float, default=2)
+
+    p = sub.add_parser('liveness', help="比较扫描式在线判断与在线状态跟踪器")
+    p.add_argument('--clients', type=int, default=20000)
+
+    p = sub.add_parser('delta', help="比较定期完整上报与增量+心跳上报的流量和服务器处理耗时")
+    p.add_argument('--clients', type=int, default=200)
+    p.add_argument('--hours', type=float, default=1)
+
+    p = sub.add_parser('logging', help="比较同步与异步批量日志的调用吞吐量和延迟")
+    p.add_argument('--mode', choices=['sync', 'async', 'json', 'sampled', 'all'], default='all')
+    p.add_argument('--threads', type=int, default=8)
+    p.add_argument('--messages', type=int, default=20000, help="每个线程写入的日志条数")
+    p.add_argument('--disk-delay', type=float, default=0, help="模拟每次 flush 的磁盘延迟 (毫秒)")
+
+    p = sub.add_parser('registry', help="客户端登记表的保存、恢复和启动耗时")
+    p.add_argument('--entries', type=int, default=100000)
+    p.add_argument('--updates', type=int, default=5000, help="上次保存后发生的变更数")
+
+    p = sub.add_parser('collectors', help="各采集插件的单次耗时，以及旧版与插件化状态上报的对比")
+    p.add_argument('--repeat', type=int, default=2000)
+
+    p = sub.add_parser('reconnect', help="服务器重启时的重连风暴：恢复时间和接受连接的峰值")
+    p.add_argument('--clients', type=int, default=500)
+    p.add_argument('--downtime', type=float, default=2)
+    p.add_argument('--engine', choices=['thread', 'selector'], default='selector')
+    p.add_argument('--accept-rate', type=int, default=200)
+    p.add_argument('--crash', action='store_true', help="直接杀掉服务器进程，不保存会话")
+
+    p = sub.add_parser('fleet', help="模拟大量客户端的完整负载测试，输出 JSON 报告")
+    p.add_argument('--clients', type=int, default=2000)
+    p.add_argument('--processes', type=int, default=4, help="模拟客户端的工作进程数")
+    p.add_argument('--engine', choices=['thread', 'selector'], default='selector')
+    p.add_argument('--workers', type=int, default=1)
+    p.add_argument('--reports', type=int, default=10, help="突发阶段每个客户端连续上报的条数")
+    p.add_argument('--rounds', type=int, default=10, help="广播轮数")
+    p.add_argument('--steady', type=float, default=10, help="稳定状态测量秒数")
+    p.add_argument('--text-ratio', type=float, default=0.0, help="使用旧文本协议的客户端比例")
+    p.add_argument('--interval', type=float, default=30, help="定期上报间隔 (秒)")
+    p.add_argument('--output', help="把 JSON 报告写入该文件")
+
+    p = sub.add_parser('metrics', help="开启与关闭运行指标时的处理耗时对比")
+    p.add_argument('--messages', type=int, default=200000)
+
+    p = sub.add_parser('select', help="按前缀/标签/网段选择设备：索引与遍历的耗时对比")
+    p.add_argument('--entries', type=int, default=20000)
+
+    p = sub.add_parser('power', help="分批关机与网络唤醒的耗时、每批数量和重试")
+    p.add_argument('--clients', type=int, default=1000)
+    p.add_argument('--wave-size', type=int, default=50)
+    p.add_argument('--interval', type=float, default=0.5)
+    p.add_argument('--drop', type=float, default=0.05, help="丢失指令/唤醒包的比例")
+
+    p = sub.add_parser('client', help="线程模式与事件驱动客户端的启动时间、空闲 CPU、唤醒次数和内存")
+    p.add_argument('--runtime', choices=['thread', 'event', 'both'], default='both')
+    p.add_argument('--idle', type=float, default=30, help="空闲测量秒数")
+    p.add_argument('--sample-interval', type=float, default=5)
+
+    p = sub.add_parser('content', help="内容推送: 服务器磁盘读取量、发送量和耗时，与逐台完整复制对比")
+    p.add_argument('--clients', type=int, default=50)
+    p.add_argument('--size', type=int, default=32, help="视频大小 (MB)")
+    p.add_argument('--files', type=int, default=20, help="不变的小文件数")
+
+    p = sub.add_parser('handoff', help="热重启 (交接监听 socket 和连接) 与冷重启的断线数和中断时间")
+    p.add_argument('--engine', choices=['thread', 'selector', 'both'], default='both')
+    p.add_argument('--clients', type=int, default=500)
+    p.add_argument('--processes', type=int, default=4)
+
+    p = sub.add_parser('shard', help="分片模式: 设备分布、协调器转发耗时、分片故障与恢复时移动的设备数")
+    p.add_argument('--shards', type=int, default=4)
+    p.add_argument('--clients', type=int, default=2000)
+    p.add_argument('--processes', type=int, default=4)
+
+    p = sub.add_parser('logindex', help="历史日志索引: 建立/增量更新耗时、索引大小、报表查询与全量扫描对比")
+    p.add_argument('--size', type=int, default=256, help="生成的日志大小 (MB)")
+    p.add_argument('--devices', type=int, default=500)
+    p.add_argument('--workers', type=int, default=None)
+
+    args = parser.parse_args()
+    if args.bench == 'engine':
+        engines = ['thread', 'selector'] if args.engine == 'both' else [args.engine]
+        for engine in engines:
+            print(run_isolated(bench_engine, engine, args.clients, args.messages, args.workers))
+    elif args.bench == 'broadcast':
+        engines = ['thread', 'selector'] if args.engine == 'both' else [args.engine]
+        for engine in engines:
+            print(run_isolated(bench_broadcast, engine, args.clients, args.slow, args.rounds, args.size))
+    elif args.bench == 'sweep':
+        print(bench_sweep(args.hosts, args.subprocess, args.timeout))
+    elif args.bench == 'telemetry':
+        print(bench_telemetry(args.clients, args.days))
+    elif args.bench == 'liveness':
+        print(bench_liveness(args.clients))
+    elif args.bench == 'logging':
+        modes = ['sync', 'async', 'json', 'sampled'] if args.mode == 'all' else [args.mode]
+        for mode in modes:
+            print(run_isolated(bench_logging, mode, args.threads, args.messages, args.disk_delay))
+    elif args.bench == 'registry':
+        print(bench_registry(args.entries, args.updates))
+    elif args.bench == 'fleet':
+        import json
+        report = run_isolated(bench_fleet, args.clients, args.processes, args.engine, args.workers, args.reports,
+                              args.rounds, args.steady, args.text_ratio, args.interval)
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        print(text)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(text)
+    elif args.bench == 'reconnect':
+        print(run_isolated(bench_reconnect, args.clients, 'fixed', 0, args.downtime, args.engine, args.crash))
+        print(run_isolated(bench_reconnect, args.clients, 'backoff', args.accept_rate, args.downtime,
+                           args.engine, args.crash))
+    elif args.bench == 'power':
+        print(run_isolated(bench_power, args.clients, args.wave_size, args.interval, args.drop))
+    elif args.bench == 'client':
+        runtimes = ['thread', 'event'] if args.runtime == 'both' else [args.runtime]
+        for runtime in runtimes:
+            print(run_isolated(bench_client, runtime, args.idle, args.sample_interval))
+    elif args.bench == 'content':
+        print(run_isolated(bench_content, args.clients, args.size, args.files))
+    elif args.bench == 'handoff':
+        engines = ['thread', 'selector'] if args.engine == 'both' else [args.engine]
+        for engine in engines:
+            print(bench_handoff(engine, args.clients, args.processes))
+    elif args.bench == 'shard':
+        print(bench_shard(args.shards, args.clients, args.processes))
+    elif args.bench == 'logindex':
+        print(bench_logindex(args.size, args.devices, args.workers))
+    elif args.bench == 'select':
+        print(bench_select(args.entries))
+    elif args.bench == 'metrics':
+        print(run_isolated(bench_metrics, args.messages))
+    elif args.bench == 'collectors':
+        print(bench_collectors(args.repeat))
+    elif args.bench == 'delta':
+        print(bench_delta(args.clients, args.hours))
+    elif args.bench == 'protocol':
+        print(bench_protocol(args.messages))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import collections
+import queue
+import socket
+import threading
+import time
+import logging
+
+logger = logging.getLogger('server')
+
+
+class BroadcastResult:
+    """
+    一次广播的投递统计。delivered: 已全部写入 socket; queued: 仍在发送队列中;
+    dropped: 队列已满、连接被断开或发送出错而放弃。
+    """
+    def __init__(self, message, total):
+        self.message = message
+        self.total = total
+        self.delivered = 0
+        self.queued = 0
+        self.dropped = 0
+        self.started = time.perf_counter()
+        self.latency = None  # 全部送达或放弃所用的秒数
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if total == 0:
+            self._finish()
+
+    def _finish(self):
+        self.latency = time.perf_counter() - self.started
+        self._done.set()
+
+    def add_queued(self):
+        with self._lock:
+            self.queued += 1
+
+    def mark_delivered(self):
+        with self._lock:
+            self.queued -= 1
+            self.delivered += 1
+            self._check_done()
+
+    def mark_dropped(self, was_queued=True):
+        with self._lock:
+            if was_queued:
+                self.queued -= 1
+            self.dropped += 1
+            self._check_done()
+
+    def _check_done(self):
+        if self.delivered + self.dropped == self.total and not self._done.is_set():
+            self._finish()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def summary(self):
+        latency = f"{self.latency * 1000:.1f}ms" if self.latency is not None else "未完成"
+        return (f"广播 '{self.message}': 共 {self.total} 个客户端, 已送达 {self.delivered}, "
+                f"排队中 {self.queued}, 已丢弃 {self.dropped}, 完成耗时 {latency}")
+
+
+class Outbox:
+    """
+    单个客户端的有界发送队列。多个线程可以同时 push，同一时刻只有一个线程负责 flush。
+    """
+    def __init__(self, max_bytes, metrics=None):
+        self.max_bytes = max_bytes
+        self.metrics = metrics  # ServerMetrics，记录发送字节数和排队到写完的延迟
+        self.items = collections.deque()  # [memoryview, 已发送字节数, BroadcastResult 或 None, 入队时间]
+        self.size = 0
+        self.stalled_since = None  # 队列中开始有数据积压的时间
+        self.closed = False
+        self.scheduled = False  # 线程模式下是否已交给发送线程
+        self.lock = threading.Lock()
+        self.drained = threading.Condition(self.lock)  # 写出数据或关闭时通知，见 wait_for_room
+
+    def push(self, data, tracker=None):
+        # 返回 False 表示队列已满或连接已关闭，调用方应将该客户端视为慢速连接
+        with self.lock:
+            if self.closed or self.size + len(data) > self.max_bytes:
+                return False
+            if not self.items:
+                self.stalled_since = time.monotonic()
+            if tracker:
+                tracker.add_queued()
+            self.items.append([memoryview(data), 0, tracker, time.perf_counter()])
+            self.size += len(data)
+        return True
+
+    def pending(self):
+        return bool(self.items)
+
+    def pending_bytes(self):
+        # 尚未写出的数据，热重启时交给新进程继续发送
+        with self.lock:
+            return b''.join(bytes(view[sent:]) for view, sent, _, _ in self.items)
+
+    def flush(self, sock):
+        # 尽可能多地写出数据；非阻塞 socket 写满时抛出 BlockingIOError，
+        # 带超时的 socket 超时时抛出 socket.timeout，由调用方决定如何处理
+        while True:
+            with self.lock:
+                if not self.items:
+                    self.stalled_since = None
+                    return True
+                item = self.items[0]
+                view = item[0][item[1]:]
+            sent = sock.send(view)
+            tracker = None
+            done = False
+            with self.lock:
+                if self.closed or not self.items or self.items[0] is not item:
+                    return True  # 发送期间队列已被清空
+                item[1] += sent
+                self.size -= sent
+                self.stalled_since = time.monotonic()
+                self.drained.notify_all()
+                if item[1] >= len(item[0]):
+                    self.items.popleft()
+                    tracker = item[2]
+                    done = True
+            if self.metrics:
+                self.metrics.bytes_sent.inc(sent)
+                if done:
+                    self.metrics.send_latency.observe(time.perf_counter() - item[3])
+            if tracker:
+                tracker.mark_delivered()
+
+    def close(self):
+        # 关闭队列并放弃所有未发送的数据
+        with self.lock:
+            self.closed = True
+            items, self.items = self.items, collections.deque()
+            self.size = 0
+            self.drained.notify_all()
+        for _, _, tracker, _ in items:
+            if tracker:
+                tracker.mark_dropped()
+
+    def wait_for_room(self, nbytes, timeout):
+        # 等到队列能再放入 nbytes 字节或已关闭；超时返回 False
+        with self.lock:
+            return self.drained.wait_for(lambda: self.closed or self.size + nbytes <= self.max_bytes, timeout)
+
+    def is_stalled(self, timeout, now=None):
+        since = self.stalled_since
+        return since is not None and (now or time.monotonic()) - since > timeout
+
+
+class SenderPool:
+    """
+    线程模式下的发送线程池：固定数量的线程并行清空各客户端的发送队列，
+    单个慢速客户端最多占用一个线程 slow_client_timeout 秒。
+    """
+    def __init__(self, server, threads=8):
+        self.server = server
+        self.queue = queue.Queue()
+        self.threads = [threading.Thread(target=self._run, name=f'sender-{i}', daemon=True)
+                        for i in range(threads)]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def kick(self, client_socket, outbox):
+        with outbox.lock:
+            if outbox.scheduled:
+                return
+            outbox.scheduled = True
+        self.queue.put((client_socket, outbox))
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            client_socket, outbox = job
+            try:
+                outbox.flush(client_socket)
+            except socket.timeout:
+                self.server.shed_client(client_socket, "发送超时")
+            except OSError as e:
+                self.server.shed_client(client_socket, f"发送出错: {e}")
+            with outbox.lock:
+                outbox.scheduled = False
+                again = bool(outbox.items) and not outbox.closed
+            if again:
+                self.kick(client_socket, outbox)
+
+    def stop(self):
+        for _ in self.threads:
+            self.queue.put(None)
+
+    def join(self, timeout=None):
+        # 等待发送线程写完手头的数据后退出
+        for thread in self.threads:
+            if thread.is_alive():
+                thread.join(timeout)
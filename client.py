@@ -1,82 +1,264 @@
 import socket
 import threading
-import schedule
 import time
 import subprocess
-import ctypes
 import os
-from logger_config import setup_logger
-from system_info import get_project_name, get_system_info, load_config
+import heapq
+import itertools
+import selectors
+import glob
+import zlib
+from logger_config import setup_logger, load_logging_config
+from network_utils import ReconnectBackoff
+from system_info import (get_project_name, get_system_info, get_system_status, load_config, build_collectors,
+                         get_mac_address)
+from protocol import (StreamDecoder, MSG_HELLO, MSG_TEXT, MSG_LOG_REQUEST, MSG_LOG_CREDIT, MSG_COMMAND,
+                      MSG_CONTENT_OFFER, MSG_CONTENT_CHUNK, MSG_CONTENT_END,
+                      encode_hello, decode_command, encode_reply, decode_hello_session, encode_text, encode_status, encode_delta,
+                      encode_heartbeat, decode_log_request, decode_log_credit, encode_log_chunk,
+                      encode_log_end, encode_metrics, STATUS_FIELDS, format_status)
 
-logger = setup_logger('client', 'client')
+logger = setup_logger('client', 'client', options=load_logging_config('client_config.json'))
 
 class Client:
     def __init__(self):
         self.config = load_config()
         self.host = self.config.get('server_ip', 'localhost')
         self.port = self.config.get('server_port', 5000)
+        # 分片模式: "servers" 列出所有分片 ('host:port')，按 project@ip 的一致性哈希选择服务器，
+        # 归属的分片连不上时依次尝试环上的下一个
+        self.ring = None
+        if self.config.get('servers'):
+            from sharding import HashRing  # 只有分片模式使用，延迟导入
+            self.ring = HashRing(self.config['servers'], self.config.get('shard_replicas', 64))
+        self.connect_timeout = self.config.get('connect_timeout', 5)
         self.client_socket = None
         self.connected = False
         self.running = True
         self.client_ip = None
         self.project_name = get_project_name()
         self.shutdown_scheduled = False
+        self.shutdown_delay = self.config.get('shutdown_delay', 60)  # 收到关机/重启指令后等待的秒数
+        self.protocol = self.config.get('protocol', 'auto')  # 'auto': 尝试帧协议; 'text': 只用旧文本协议
+        self.decoder = StreamDecoder()
+        self.framed = False  # 服务器确认帧协议后为 True
+        self.server_level = 0  # 服务器在 HELLO 中声明的消息集级别
+        self.session_token = b''  # 服务器分配的会话令牌，重连时用于恢复会话
+        self.resumed = False  # 本次连接是否恢复了之前的会话
+        # 断线重连: 指数退避 + 随机抖动，避免服务器重启时所有展项同时重连
+        self.backoff = ReconnectBackoff(self.config.get('reconnect_min', 1), self.config.get('reconnect_max', 30))
+        self.conn_lock = threading.Lock()
+        self.lost = threading.Event()  # 连接断开时通知主循环重连
+        # 'delta': 连接后发送一次完整快照，之后只在指标变化超过阈值时发送增量，否则定期发送心跳;
+        # 'periodic': 每 30 秒发送完整状态 (旧服务器或文本协议时总是使用)
+        self.telemetry_mode = self.config.get('telemetry', 'delta')
+        self.sample_interval = self.config.get('sample_interval', 5)
+        self.heartbeat_interval = self.config.get('heartbeat_interval', 60)
+        self.delta_thresholds = self.config.get('delta_thresholds', {'cpu': 5.0, 'memory': 2.0})
+        self.last_sent = None  # 最近一次发给服务器的指标值
+        self.last_send_time = 0
+        # 采集插件按各自的间隔采样；附加指标每 metrics_interval 秒随状态上报一次
+        self.metrics = build_collectors(self.config)
+        self.metrics_interval = self.config.get('metrics_interval', 60)
+        self.last_metrics_time = 0
+        # 日志上传在单独线程中分块进行，每块之间都可以插入其他消息；发送加锁保证帧不被拆开
+        self.send_lock = threading.RLock()
+        self.log_chunk_size = self.config.get('log_chunk_size', 64 * 1024)
+        self.log_credit = 0  # 服务器授予的剩余上传额度
+        self.log_cond = threading.Condition()
+        self.log_generation = 0  # 每次上传请求加一，旧的上传线程据此退出
+        self.content = None  # 第一次收到内容推送时创建的 ContentUpdater
 
-        logger.info(f"已加载配置: 服务器 IP {self.host}, 端口 {self.port}, pssoft路径 {self.config.get('pssoft_path', 'D:\\pssoft')}")
-        print(f"已加载配置: 服务器 IP {self.host}, 端口 {self.port}, pssoft路径 {self.config.get('pssoft_path', 'D:\\pssoft')}")
+        pssoft_path = self.config.get('pssoft_path', 'D:\\pssoft')
+        logger.info(f"已加载配置: 服务器 IP {self.host}, 端口 {self.port}, pssoft路径 {pssoft_path}")
+        print(f"已加载配置: 服务器 IP {self.host}, 端口 {self.port}, pssoft路径 {pssoft_path}")
 
-    def connect(self):
+    def connect(self, delay_first=False):
+        # 只由主线程调用；delay_first 为 True 时 (断线重连) 第一次尝试前也先等待一个随机间隔
+        import schedule  # 只有线程模式使用，延迟导入
         while self.running and not self.connected:
+            if delay_first:
+                delay = self.backoff.next_delay()
+                print(f"{delay:.1f}秒后重试...")
+                time.sleep(delay)
+            delay_first = True
             try:
-                self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.client_socket.connect((self.host, self.port))
-                self.connected = True
-                self.client_ip = self.client_socket.getsockname()[0]  # 获取客户端IP
-                logger.info(f"成功连接到服务器，客户端IP: {self.client_ip}")
-                print(f"成功连接到服务器，客户端IP: {self.client_ip}")
-                
-                receive_thread = threading.Thread(target=self.receive_messages)
+                sock = self.open_connection()
+                receive_thread = threading.Thread(target=self.receive_messages, args=(sock,), daemon=True)
                 receive_thread.start()
-
-                # 设置定时任务，每60秒发送一次状态信息
-                schedule.every(30).seconds.do(self.send_status)
+                self.send_initial_status()
+                # 按上报模式设置定时任务（替换上一个连接的任务）
+                schedule.clear('telemetry')
+                schedule.every(self.telemetry_interval()).seconds.do(self.telemetry_task()).tag('telemetry')
             except Exception as e:
                 logger.error(f"连接失败: {e}")
                 print(f"连接失败: {e}")
-                print("5秒后重试...")
-                time.sleep(5)
+                self.connected = False
+
+    def server_candidates(self):
+        # 依次尝试的服务器地址；分片模式下按哈希环排列
+        if self.ring is None:
+            return [(self.host, self.port)]
+        from sharding import parse_address
+        client_ip = self.client_ip
+        if client_ip is None:
+            # 还没连接过：用 UDP socket 确定连往服务器时使用的本机地址 (不发送数据)
+            probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                probe.connect(parse_address(self.ring.nodes[0]))
+                client_ip = probe.getsockname()[0]
+            finally:
+                probe.close()
+        return [parse_address(name) for name in self.ring.preference(f"{self.get_project_name()}@{client_ip}")]
+
+    def open_connection(self):
+        # 连接服务器并协商协议，返回 socket；失败时关闭 socket 并抛出异常
+        candidates = self.server_candidates()
+        for index, (host, port) in enumerate(candidates):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                if self.ring is not None:
+                    sock.settimeout(self.connect_timeout)
+                sock.connect((host, port))
+                sock.settimeout(None)
+                break
+            except OSError as e:
+                sock.close()
+                if index == len(candidates) - 1:
+                    raise
+                logger.warning(f"无法连接分片 {host}:{port} ({e})，尝试下一个")
+                print(f"无法连接分片 {host}:{port} ({e})，尝试下一个")
+        self.host, self.port = host, port
+        self.client_socket = sock
+        try:
+            self.client_ip = sock.getsockname()[0]  # 获取客户端IP
+            logger.info(f"成功连接到服务器，客户端IP: {self.client_ip}")
+            print(f"成功连接到服务器，客户端IP: {self.client_ip}")
 
-    def receive_messages(self):
+            # 每个连接重新协商协议
+            self.decoder = StreamDecoder()
+            self.framed = False
+            self.resumed = False
+            if self.protocol != 'text':
+                self.negotiate_protocol()
+        except Exception:
+            sock.close()
+            raise
+        self.lost.clear()
+        self.connected = True
+        self.backoff.reset()
+        return sock
+
+    def send_initial_status(self):
+        # 恢复了会话时服务器仍保留着完整状态，不必重新发送快照；否则先发送一次完整状态
+        if self.resumed and self.last_sent is not None:
+            logger.info("已恢复会话，跳过完整状态上报")
+            print("已恢复会话，跳过完整状态上报")
+        else:
+            self.send_status()
+
+    def telemetry_interval(self):
+        return self.sample_interval if self.use_delta() else 30
+
+    def telemetry_task(self):
+        return self.sample_telemetry if self.use_delta() else self.send_status
+
+    def receive_messages(self, sock):
+        # 每个连接一个接收线程；连接断开后线程结束，由主线程负责重连
         while self.running:
             try:
-                message = self.client_socket.recv(1024).decode('utf-8')
-                if not message:
+                data = sock.recv(65536)  # 内容推送的数据块较大
+                if not data:
                     raise Exception("连接已关闭")
-                print('recv from server raw msg :',message)
-                
-                # 处理特殊指令
-                self.handle_command(message)
+                self.handle_data(data)
             except Exception as e:
                 logger.error(f"接收消息时出错: {e}")
                 print(f"接收消息时出错: {e}")
-                self.connected = False
-                self.reconnect()
+                self.connection_lost(sock)
                 break
 
-    def handle_command(self, action):
+    def connection_lost(self, sock):
+        # 接收线程、发送出错的线程都可能调用；只处理当前连接一次
+        with self.conn_lock:
+            if sock is not self.client_socket or not self.connected:
+                return
+            self.connected = False
+        try:
+            sock.close()
+        except OSError:
+            pass
+        with self.log_cond:
+            self.log_cond.notify_all()  # 让等待额度的日志上传线程退出
+        self.lost.set()
+
+    def negotiate_protocol(self):
+        # 发送 HELLO 后等待服务器确认再发其他数据；旧服务器不会回复，超时后继续使用文本协议。
+        # 服务器限制接受速率时连接可能在队列中等待几秒，因此超时时间较长
+        self.client_socket.send(encode_hello(self.session_token))
+        self.client_socket.settimeout(self.config.get('hello_timeout', 10))
+        try:
+            data = self.client_socket.recv(1024)
+        except socket.timeout:
+            data = b''
+        finally:
+            self.client_socket.settimeout(None)
+        if data:
+            self.handle_data(data)
+        if not self.framed:
+            logger.info("服务器未确认帧协议，使用文本协议")
+            print("服务器未确认帧协议，使用文本协议")
+
+    def handle_data(self, data):
+        for msg_type, payload in self.decoder.feed(data):
+            if msg_type == MSG_HELLO:
+                self.framed = True
+                self.server_level, token, self.resumed = decode_hello_session(payload)
+                if token:
+                    self.session_token = token
+                logger.info("服务器支持帧协议，切换到二进制状态上报")
+                print("服务器支持帧协议，切换到二进制状态上报")
+            elif msg_type == MSG_LOG_REQUEST:
+                self.start_log_upload(decode_log_request(payload))
+            elif msg_type == MSG_LOG_CREDIT:
+                with self.log_cond:
+                    self.log_credit += decode_log_credit(payload)
+                    self.log_cond.notify_all()
+            elif msg_type == MSG_TEXT:
+                message = payload.decode('utf-8')
+                print('recv from server raw msg :',message)
+
+                # 处理特殊指令
+                self.handle_command(message)
+            elif msg_type == MSG_COMMAND:
+                command_id, message = decode_command(payload)
+                print('recv from server command :', command_id, message)
+                self.handle_command(message, command_id)
+            elif msg_type in (MSG_CONTENT_OFFER, MSG_CONTENT_CHUNK, MSG_CONTENT_END):
+                if self.content is None:
+                    from content_sync import ContentUpdater  # 很少用到，延迟导入
+                    self.content = ContentUpdater(self.send_data, self.project_dir)
+                self.content.handle(msg_type, payload)
+
+    def handle_command(self, action, command_id=None):
+        # 带编号的指令执行后总是回复同一编号；旧的文本指令只有 test / hello 回复 OK
+        reply = "OK"
+        # 关机/重启可以带等待秒数，如 "shutdown 30"，否则使用配置中的 shutdown_delay
+        action, _, argument = action.partition(' ')
+        delay = int(argument) if argument.strip().isdigit() else self.shutdown_delay
         if action == "shutdown":
-            logger.info("收到关机指令，系统将在60秒后关机...")
-            print("收到关机指令，系统将在60秒后关机...")
+            logger.info(f"收到关机指令，系统将在{delay}秒后关机...")
+            print(f"收到关机指令，系统将在{delay}秒后关机...")
             self.shutdown_scheduled = True
-            subprocess.run(["shutdown", "/s", "/t", "60"])
+            subprocess.run(["shutdown", "/s", "/t", str(delay)])
         elif action == "reboot":
-                    logger.info("收到重启指令，系统将在60秒后重启...")
-                    print("收到重启指令，系统将在60秒后重启...")
+                    logger.info(f"收到重启指令，系统将在{delay}秒后重启...")
+                    print(f"收到重启指令，系统将在{delay}秒后重启...")
                     self.shutdown_scheduled = True
-                    subprocess.run(["shutdown", "/r", "/t", "60"])
+                    subprocess.run(["shutdown", "/r", "/t", str(delay)])
         elif action == "sleep":
                     logger.info("收到锁屏指令，系统将立即锁屏...")
                     print("收到锁屏指令，系统将立即锁屏...")
+                    import ctypes
                     ctypes.windll.user32.LockWorkStation()
         elif action == "cancel":
                     if self.shutdown_scheduled:
@@ -87,6 +269,7 @@ class Client:
                     else:
                         logger.info("没有待执行的关机/重启指令")
                         print("没有待执行的关机/重启指令")
+                        reply = "没有待执行的关机/重启指令"
         elif action == "get":
                     logger.info("收到get指令，立即发送状态信息...")
                     print("收到get指令，立即发送状态信息...")
@@ -94,49 +277,165 @@ class Client:
         elif action == "test":
                     logger.info("收到test指令，立即响应...")
                     print("收到test指令，立即响应...")
-                    self.send_message("OK")
         elif action == "hello":
                     logger.info("收到hello指令，立即响应...")
                     print("收到hello指令，立即响应...")
-                    self.send_message("OK") 
+        elif action == "rebalance":
+                    # 分片变化：本机改由其他分片负责，回复后断开，重连时按哈希环重新选择服务器
+                    logger.info("收到rebalance指令，重新选择服务器...")
+                    print("收到rebalance指令，重新选择服务器...")
+        elif action == "mac":
+                    # 服务器记录 MAC 地址，用于网络唤醒
+                    reply = get_mac_address(self.client_ip) or "未知"
+                    logger.info(f"收到mac指令，本机 MAC: {reply}")
         else:
             logger.info(f"收到未知指令: {action}")
             print(f"收到未知指令: {action}")
-
-    def reconnect(self):
-        logger.info("尝试重新连接...")
-        print("尝试重新连接...")
-        self.connect()
+            reply = f"未知指令: {action}"
+        if command_id is not None:
+            self.send_data(encode_reply(command_id, reply))
+        elif action in ("test", "hello"):
+            self.send_message("OK")
+        if action == "rebalance" and self.ring is not None:
+            self.connection_lost(self.client_socket)
 
     def send_message(self, message):
+        if self.framed:
+            self.send_data(encode_text(message))
+        else:
+            self.send_data(message.encode('utf-8'))
+
+    def send_data(self, data):
         if self.connected:
+            sock = self.client_socket
             try:
-                self.client_socket.send(message.encode('utf-8'))
+                with self.send_lock:
+                    sock.sendall(data)
             except Exception as e:
                 logger.error(f"发送消息时出错: {e}")
                 print(f"发送消息时出错: {e}")
-                self.connected = False
-                self.reconnect()
+                self.connection_lost(sock)
 
     def get_project_name(self):
         return get_project_name()
 
+    def project_dir(self, name=''):
+        # 内容推送的目标目录；name 为空时为当前项目，没有项目时返回 None
+        name = name or get_project_name()
+        if name == "NoProjects":
+            return None
+        return os.path.join(load_config().get('pssoft_path', 'D:\\pssoft'), name)
+
     def get_system_info(self):
         return get_system_info(self.client_ip, self.project_name)
 
+    def get_status(self):
+        # 项目名称只在配置或 pssoft 目录变化时才重新读取
+        self.project_name = get_project_name()
+        return get_system_status(self.client_ip, self.project_name, self.metrics)
+
+    def send_metrics(self, status, force=False):
+        now = time.time()
+        if self.server_level < 4 or (not force and now - self.last_metrics_time < self.metrics_interval):
+            return
+        extra = {name: value for name, value in status.items() if name not in STATUS_FIELDS}
+        if extra:
+            self.send_data(encode_metrics(extra))
+        self.last_metrics_time = now
+
     def send_status(self):
-        status_info = self.get_system_info()
+        status = self.get_status()
+        status_info = format_status(status)
         logger.info(f"发送状态信息: {status_info}")
         print(f"发送状态信息: {status_info}")
-        self.send_message(f"状态信息: {status_info}")
+        if self.framed:
+            self.send_data(encode_status(status))
+        else:
+            self.send_message(f"状态信息: {status_info}")
+        self.last_sent = {'cpu': status['cpu'], 'memory': status['memory']}
+        self.last_send_time = time.time()
+        if self.framed:
+            self.send_metrics(status, force=True)
+
+    def use_delta(self):
+        return self.telemetry_mode == 'delta' and self.framed and self.server_level >= 2
 
+    def sample_telemetry(self):
+        # 本地采样；只有指标变化超过阈值才发送增量，否则到心跳间隔时发送心跳
+        project_name = self.project_name
+        status = self.get_status()
+        if status['project_name'] != project_name:
+            self.send_status()  # 项目变化时增量无法表达，重新发送完整快照
+            return
+        changes = {metric: status[metric] for metric, threshold in self.delta_thresholds.items()
+                   if abs(status[metric] - self.last_sent[metric]) >= threshold}
+        now = time.time()
+        if changes:
+            logger.info(f"发送状态增量: {changes}")
+            self.send_data(encode_delta(changes))
+            self.last_sent.update(changes)
+            self.last_send_time = now
+        elif now - self.last_send_time >= self.heartbeat_interval:
+            self.send_data(encode_heartbeat())
+            self.last_send_time = now
+        self.send_metrics(status)
+
+    def start_log_upload(self, offsets):
+        with self.log_cond:
+            self.log_generation += 1
+            self.log_credit = 0
+            self.log_cond.notify_all()
+            generation = self.log_generation
+        threading.Thread(target=self.upload_logs, args=(offsets, generation), daemon=True).start()
+
+    def upload_logs(self, offsets, generation):
+        # offsets 是服务器已保存的各文件字节数，从这些位置继续上传
+        logger.info("收到日志上传请求，开始上传日志...")
+        print("收到日志上传请求，开始上传日志...")
+        total = 0
+        for path in sorted(glob.glob('client_*.log*') + glob.glob('client_*.jsonl*')):
+            name = os.path.basename(path)
+            size = os.path.getsize(path)
+            offset = offsets.get(name, 0)
+            if offset > size:
+                offset = 0  # 文件已被轮转重写，从头上传
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                while offset < size:
+                    raw = f.read(min(self.log_chunk_size, size - offset))
+                    if not raw:
+                        break
+                    compressed = zlib.compress(raw)
+                    if not self.wait_log_credit(len(compressed), generation):
+                        logger.info("日志上传已中断")
+                        return
+                    self.send_data(encode_log_chunk(name, offset, compressed))
+                    offset += len(raw)
+                    total += len(raw)
+            self.send_data(encode_log_end(name, offset))
+        self.send_data(encode_log_end())
+        logger.info(f"日志上传完成，共 {total} 字节")
+        print(f"日志上传完成，共 {total} 字节")
+
+    def wait_log_credit(self, nbytes, generation):
+        with self.log_cond:
+            while self.log_credit <= 0 and self.log_generation == generation and self.connected:
+                self.log_cond.wait(1)
+            if self.log_generation != generation or not self.connected:
+                return False
+            self.log_credit -= nbytes
+            return True
 
     def run(self):
+        import schedule
         self.connect()
-        self.send_status()
         while self.running:
+            if not self.connected:
+                logger.info("尝试重新连接...")
+                print("尝试重新连接...")
+                self.connect(delay_first=True)
             schedule.run_pending()
-            time.sleep(1)
+            self.lost.wait(1)
 
     def stop(self):
         self.running = False
@@ -144,8 +443,110 @@ class Client:
             self.client_socket.close()
         logger.info("客户端已停止")
 
+
+class EventClient(Client):
+    """
+    单线程事件驱动的客户端 (配置 "runtime": "event")：一个 selectors 循环负责接收，
+    定时上报和重连放在按到期时间排序的堆中，select 只在收到数据或最近的任务到期时返回，
+    空闲时没有轮询，也没有单独的接收线程。日志上传仍在需要时另开线程。
+    """
+    def __init__(self):
+        super().__init__()
+        self.selector = selectors.DefaultSelector()
+        self.timers = []  # [到期时间, 序号, 任务]，任务为 None 表示已取消
+        self.sequence = itertools.count()
+        self.telemetry_timer = None
+        self.loop_thread = None
+
+    def call_later(self, delay, callback):
+        entry = [time.monotonic() + delay, next(self.sequence), callback]
+        heapq.heappush(self.timers, entry)
+        return entry
+
+    def run(self):
+        self.loop_thread = threading.current_thread()
+        self.call_later(0, self.try_connect)
+        while self.running:
+            timeout = None
+            if self.timers:
+                timeout = max(0, self.timers[0][0] - time.monotonic())
+            if self.selector.get_map():
+                for key, _ in self.selector.select(timeout):
+                    self.on_readable(key.fileobj)
+            elif timeout:
+                time.sleep(timeout)  # 未连接时只等待重连；Windows 上不能 select 空集合
+            now = time.monotonic()
+            while self.timers and self.timers[0][0] <= now:
+                _, _, callback = heapq.heappop(self.timers)
+                if callback is not None:
+                    callback()
+            if not self.running:
+                break
+
+    def try_connect(self):
+        try:
+            sock = self.open_connection()
+        except Exception as e:
+            logger.error(f"连接失败: {e}")
+            print(f"连接失败: {e}")
+            delay = self.backoff.next_delay()
+            print(f"{delay:.1f}秒后重试...")
+            self.call_later(delay, self.try_connect)
+            return
+        self.selector.register(sock, selectors.EVENT_READ)
+        self.send_initial_status()
+        if self.connected:
+            self.telemetry_timer = self.call_later(self.telemetry_interval(), self.run_telemetry)
+
+    def run_telemetry(self):
+        # 按固定间隔重复；连接断开时定时任务被取消
+        interval = self.telemetry_interval()
+        self.telemetry_task()()
+        if self.connected:
+            self.telemetry_timer = self.call_later(interval, self.run_telemetry)
+
+    def on_readable(self, sock):
+        # 与 receive_messages 相同：解码或处理指令出错时断开并重连，不让异常结束事件循环
+        try:
+            data = sock.recv(65536)
+            if not data:
+                raise Exception("连接已关闭")
+            self.handle_data(data)
+        except Exception as e:
+            logger.error(f"接收消息时出错: {e}")
+            print(f"接收消息时出错: {e}")
+            self.connection_lost(sock)
+
+    def connection_lost(self, sock):
+        if threading.current_thread() is not self.loop_thread:
+            # 日志上传线程发送出错：关闭读写，事件循环收到连接断开后统一处理
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            return
+        current = sock is self.client_socket and self.connected
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+        super().connection_lost(sock)
+        if not current:
+            return
+        if self.telemetry_timer is not None:
+            self.telemetry_timer[2] = None
+            self.telemetry_timer = None
+        if self.running:
+            logger.info("尝试重新连接...")
+            print("尝试重新连接...")
+            delay = self.backoff.next_delay()
+            print(f"{delay:.1f}秒后重试...")
+            self.call_later(delay, self.try_connect)
+
+
 if __name__ == "__main__":
-    client = Client()
+    # "runtime": "thread" 为原来的接收线程 + 定时轮询；"event" 为单线程事件驱动
+    client = EventClient() if load_config().get('runtime', 'thread') == 'event' else Client()
     try:
         client.run()
     except KeyboardInterrupt:
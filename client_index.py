@@ -0,0 +1,123 @@
+import bisect
+import ipaddress
+import threading
+
+
+class ClientIndex:
+    """
+    client_info 的二级索引，按目标选择器找出设备而不必遍历全部登记的设备。
+    项目名称和 IP 各保存一个有序列表，前缀和网段查询都是二分查找出的一段连续区间。
+    接收线程/事件循环更新索引，控制台线程查询，所有方法都在 lock 内进行
+    """
+    def __init__(self):
+        self.lock = threading.RLock()  # add 内部调用 remove，select 内部调用 by_*
+        self.infos = {}  # key -> 信息
+        self.names = []  # 有序的 (项目名称, key)
+        self.addresses = []  # 有序的 (IP 整数值, ip)，每个 IP 只出现一次
+        self.ip_keys = {}  # ip -> 该 IP 上登记的 key 集合
+        self.tags = {}  # 标签 -> key 集合
+
+    def add(self, key, info):
+        with self.lock:
+            old = self.infos.get(key)
+            if old == info:
+                return
+            if old is not None:
+                self.remove(key)
+            self.infos[key] = info
+            bisect.insort(self.names, (info['project_name'], key))
+            ip = info['ip']
+            if ip not in self.ip_keys:
+                self.ip_keys[ip] = set()
+                address = _address(ip)
+                if address is not None:
+                    bisect.insort(self.addresses, (address, ip))
+            self.ip_keys[ip].add(key)
+            for tag in info.get('tags', ()):
+                self.tags.setdefault(tag, set()).add(key)
+
+    def remove(self, key):
+        with self.lock:
+            info = self.infos.pop(key, None)
+            if info is None:
+                return
+            entry = (info['project_name'], key)
+            i = bisect.bisect_left(self.names, entry)
+            if i < len(self.names) and self.names[i] == entry:
+                del self.names[i]
+            ip = info['ip']
+            keys = self.ip_keys.get(ip)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.ip_keys[ip]
+                    address = _address(ip)
+                    if address is not None:
+                        i = bisect.bisect_left(self.addresses, (address, ip))
+                        if i < len(self.addresses) and self.addresses[i] == (address, ip):
+                            del self.addresses[i]
+            for tag in info.get('tags', ()):
+                tagged = self.tags.get(tag)
+                if tagged is not None:
+                    tagged.discard(key)
+                    if not tagged:
+                        del self.tags[tag]
+
+    def by_prefix(self, prefix):
+        # 以 prefix 开头的名称都不小于 prefix，且小于 prefix 后接最大字符
+        with self.lock:
+            start = bisect.bisect_left(self.names, (prefix,))
+            end = bisect.bisect_left(self.names, (prefix + chr(0x10ffff),), start)
+            return [key for _, key in self.names[start:end]]
+
+    def by_name(self, name):
+        with self.lock:
+            return [key for key in self.by_prefix(name) if self.infos[key]['project_name'] == name]
+
+    def by_tag(self, tag):
+        with self.lock:
+            return list(self.tags.get(tag, ()))
+
+    def by_subnet(self, network):
+        # 返回网段内已登记的 IP
+        with self.lock:
+            start = bisect.bisect_left(self.addresses, (int(network.network_address),))
+            end = bisect.bisect_right(self.addresses, (int(network.broadcast_address), chr(0x10ffff)))
+            return [ip for _, ip in self.addresses[start:end]]
+
+    def select(self, selector):
+        """
+        按选择器返回目标 IP 集合，多个选择器用逗号分隔取并集:
+        IP 地址; 网段如 10.0.1.0/24; tag:标签; 以 * 结尾的项目名称前缀如 展厅A-*; 其他按项目名称精确匹配
+        """
+        with self.lock:
+            ips = set()
+            for part in selector.split(','):
+                part = part.strip()
+                if not part:
+                    continue
+                if part.startswith('tag:'):
+                    keys = self.by_tag(part[4:])
+                elif part.endswith('*'):
+                    keys = self.by_prefix(part[:-1])
+                elif '/' in part:
+                    try:
+                        network = ipaddress.ip_network(part, strict=False)
+                    except ValueError:
+                        raise ValueError(f"网段格式错误: {part}")
+                    ips.update(self.by_subnet(network))
+                    continue
+                elif _address(part) is not None:
+                    ips.add(part)
+                    continue
+                else:
+                    keys = self.by_name(part)
+                ips.update(self.infos[key]['ip'] for key in keys)
+            return ips
+
+
+def _address(ip):
+    try:
+        return int(ipaddress.IPv4Address(ip))
+    except ValueError:
+        return None
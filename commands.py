@@ -0,0 +1,128 @@
+import collections
+import itertools
+import threading
+import time
+
+# 旧版客户端不回复指令编号：test / hello 回复文本 OK，get 回复一条状态，其他指令没有回复
+LEGACY_REPLIES = {'test': 'OK', 'hello': 'OK', 'get': 'status'}
+
+ANSWERED = '已响应'
+TIMED_OUT = '超时'
+OFFLINE = '离线'
+SEND_FAILED = '发送失败'
+NO_REPLY = '已发送'  # 旧版客户端对该指令不回复，只能确认已发出
+
+
+class PendingCommand:
+    """
+    一条发往多台设备的指令及其回复。所有等待回复的设备都已回复或到达期限后结束
+    """
+    def __init__(self, command_id, command, timeout):
+        self.id = command_id
+        self.command = command
+        self.started = time.time()
+        self.deadline = self.started + timeout
+        self.results = {}  # ip -> (结果, 回复, 延迟秒)
+        self.waiting = set()  # 尚未回复的 ip
+        self.lock = threading.Lock()
+        self._done = threading.Event()
+        self._done.set()
+
+    def expect(self, ip):
+        with self.lock:
+            self.waiting.add(ip)
+            self._done.clear()
+
+    def finish(self, ip, state, reply=None):
+        # 同一设备只记录第一次结果
+        with self.lock:
+            if ip in self.results:
+                return False
+            latency = time.time() - self.started if state == ANSWERED else None
+            self.results[ip] = (state, reply, latency)
+            self.waiting.discard(ip)
+            if not self.waiting:
+                self._done.set()
+        return True
+
+    def wait(self):
+        # 最多等到期限；返回时把仍未回复的设备记为超时
+        self._done.wait(max(0, self.deadline - time.time()))
+        with self.lock:
+            waiting, self.waiting = self.waiting, set()
+            for ip in waiting:
+                self.results[ip] = (TIMED_OUT, None, None)
+            self._done.set()
+        return self.results
+
+    def counts(self):
+        return collections.Counter(state for state, _, _ in self.results.values())
+
+
+class CommandTracker:
+    """
+    为指令分配编号并把回复关联到对应指令。帧协议级别 5 以上的客户端回复时带编号；
+    旧版客户端的 OK / 状态按发送顺序归给该设备上最早一条等待同类回复的指令
+    """
+    def __init__(self, timeout=5):
+        self.timeout = timeout  # 默认等待回复的期限 (秒)
+        self.pending = {}  # 指令编号 -> PendingCommand
+        self.legacy = {}  # ip -> deque[(PendingCommand, 期望的回复)]
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def issue(self, command, timeout=None):
+        pending = PendingCommand(next(self._ids) & 0xffffffff, command,
+                                 self.timeout if timeout is None else timeout)
+        with self.lock:
+            self.pending[pending.id] = pending
+        return pending
+
+    def expect_legacy(self, pending, ip):
+        # 旧版客户端: 有对应回复的指令等待回复并返回 True；否则返回 False，由调用方在发出后记为已发送
+        kind = LEGACY_REPLIES.get(pending.command)
+        if kind is None:
+            return False
+        pending.expect(ip)
+        with self.lock:
+            self.legacy.setdefault(ip, collections.deque()).append((pending, kind))
+        return True
+
+    def on_reply(self, ip, command_id, reply):
+        pending = self.pending.get(command_id)
+        if pending is not None and ip in pending.waiting:
+            pending.finish(ip, ANSWERED, reply)
+
+    def on_legacy_reply(self, ip, kind):
+        # 状态上报很频繁，没有等待中的指令时只是一次字典查询
+        if ip not in self.legacy:
+            return
+        with self.lock:
+            queue = self.legacy.get(ip)
+            if not queue:
+                return
+            for entry in queue:
+                if entry[1] == kind:
+                    queue.remove(entry)
+                    break
+            else:
+                return
+            if not queue:
+                del self.legacy[ip]
+        entry[0].finish(ip, ANSWERED, 'OK' if kind == 'OK' else '状态已上报')
+
+    def close(self, pending):
+        # 指令结束 (或被取消) 后丢弃其编号和旧版客户端的等待记录，迟到的回复会被忽略
+        with self.lock:
+            self.pending.pop(pending.id, None)
+            with pending.lock:
+                ips = set(pending.results) | pending.waiting
+            for ip in ips:
+                queue = self.legacy.get(ip)
+                if not queue:
+                    continue
+                queue = collections.deque(entry for entry in queue if entry[0] is not pending)
+                if queue:
+                    self.legacy[ip] = queue
+                else:
+                    del self.legacy[ip]
@@ -0,0 +1,497 @@
+import hashlib
+import itertools
+import os
+import shutil
+import threading
+import time
+import logging
+
+from commands import OFFLINE, SEND_FAILED, TIMED_OUT
+from protocol import (MSG_CONTENT_OFFER, MSG_CONTENT_CHUNK, MSG_CONTENT_END, encode_content_offer,
+                      decode_content_offer, encode_content_want, decode_content_want, encode_content_chunk_header,
+                      decode_content_chunk, encode_content_end, decode_content_end, encode_content_done,
+                      decode_command)
+
+logger = logging.getLogger('server')
+client_logger = logging.getLogger('client')
+
+# 按内容切分数据块: 每个字节按固定的表映射为 '0' 或 '1'，连续 ANCHOR_RUN 个 '1' 处为块边界。
+# 边界只取决于附近的几个字节，文件中间插入或删除数据后其余的块不变。
+# 映射和查找都由 bytes.translate / bytes.find 完成，切分速度接近磁盘读取速度。
+# 两端必须使用相同的参数，修改后已有的块全部失效
+ANCHOR_RUN = 15  # 随机数据上平均约 64KB 出现一次
+ANCHOR = b'1' * ANCHOR_RUN
+_anchor_bits = int.from_bytes(hashlib.sha256(b'content-sync-anchor').digest(), 'big')
+ANCHOR_TABLE = bytes(0x31 if _anchor_bits >> value & 1 else 0x30 for value in range(256))
+MIN_CHUNK = 16 * 1024
+MAX_CHUNK = 128 * 1024  # 加上帧头后仍小于默认的发送队列上限 (256KB)
+READ_BLOCK = 1024 * 1024
+
+UPDATED = '已更新'
+UNCHANGED = '无变化'
+FAILED = '失败'
+DISCONNECTED = '连接断开'
+UNSUPPORTED = '不支持'
+
+
+class ContentError(Exception):
+    pass
+
+
+def chunk_digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _boundary(anchors, start, size):
+    if size - start <= MIN_CHUNK:
+        return size
+    end = min(start + MAX_CHUNK, size)
+    index = anchors.find(ANCHOR, start + MIN_CHUNK - ANCHOR_RUN, end)
+    return index + ANCHOR_RUN if index >= 0 else end
+
+
+def chunk_file(path):
+    # 返回 [(摘要, 偏移, 长度)]；每次读入 READ_BLOCK 字节，不足一个最大块的尾部留到下一轮
+    chunks = []
+    base = 0
+    pending = b''
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(READ_BLOCK)
+            eof = not block
+            buffer = pending + block if pending else block
+            anchors = buffer.translate(ANCHOR_TABLE)
+            size = len(buffer)
+            start = 0
+            with memoryview(buffer) as view:
+                while size - start > (0 if eof else MAX_CHUNK):
+                    end = _boundary(anchors, start, size)
+                    chunks.append((chunk_digest(view[start:end]), base + start, end - start))
+                    start = end
+            pending = buffer[start:]
+            base += start
+            if eof:
+                return chunks
+
+
+def scan_directory(root, cache=None):
+    """
+    切分目录下的所有文件，返回 [(相对路径, 大小, 绝对路径, [(摘要, 偏移, 长度)])]，
+    相对路径用 '/' 分隔。cache 为 {绝对路径: ((大小, mtime), 块列表)}，未修改的文件不再重新切分
+    """
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            stat = os.stat(path)
+            stamp = (stat.st_size, stat.st_mtime_ns)
+            cached = cache.get(path) if cache is not None else None
+            if cached is not None and cached[0] == stamp:
+                chunks = cached[1]
+            else:
+                chunks = chunk_file(path)
+                if cache is not None:
+                    cache[path] = (stamp, chunks)
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            files.append((relative, stat.st_size, path, chunks))
+    return files
+
+
+def chunk_locations(files):
+    # 摘要 -> (绝对路径, 偏移, 长度)；相同内容的块只记录第一次出现的位置
+    locations = {}
+    for _, _, path, chunks in files:
+        for digest, offset, length in chunks:
+            locations.setdefault(digest, (path, offset, length))
+    return locations
+
+
+class ContentPush:
+    """
+    一次内容推送: 把服务器上的一个目录同步到多台设备的项目目录
+    """
+    def __init__(self, transfer_id, source, target, ips):
+        self.id = transfer_id
+        self.source = source
+        self.target = target  # 设备上的项目名称，空字符串表示设备当前的项目
+        self.targets = set(ips)
+        self.files = 0
+        self.total_bytes = 0  # 目录中文件的总大小
+        self.locations = {}  # 摘要 -> (路径, 偏移, 长度)
+        self.offered = {}  # ip -> socket，已发出清单的设备
+        self.wants = {}  # ip -> 设备缺少的摘要集合
+        self.served = set()  # 已发完所需数据块的设备
+        self.results = {}  # ip -> 结果
+        self.errors = {}  # ip -> 设备报告的错误
+        self.bytes_read = 0  # 推送阶段从磁盘读取的字节数
+        self.chunks_read = 0
+        self.bytes_sent = 0  # 放入各设备发送队列的字节数合计
+        self.send_seconds = 0.0  # 读取并发送数据块所用的时间
+        self.started = time.time()
+        self.finished = None
+        self.lock = threading.Lock()
+        self.changed = threading.Event()  # 收到设备的请求或结果时唤醒推送线程
+
+    def summary(self):
+        counts = {}
+        for state in self.results.values():
+            counts[state] = counts.get(state, 0) + 1
+        elapsed = (self.finished or time.time()) - self.started
+        state = "已完成" if self.finished else "进行中"
+        return (f"推送 #{self.id} {self.source} -> {self.target or '当前项目'} {state}: 共 {len(self.targets)} 台, "
+                + ", ".join(f"{name} {n}" for name, n in sorted(counts.items()))
+                + f", 目录 {self.files} 个文件 {self.total_bytes / 1048576:.1f} MB, "
+                  f"读取 {self.bytes_read / 1048576:.1f} MB, 发送 {self.bytes_sent / 1048576:.1f} MB, "
+                  f"已用 {elapsed:.1f} 秒")
+
+
+class ContentDistributor:
+    """
+    服务器端的内容分发。目录按内容切分成数据块，设备收到清单后只请求本地没有的块；
+    所有设备缺少的块合并后按文件顺序读取，每块只从磁盘读一次，编码好的帧
+    同时放入所有需要它的设备的发送队列 (各队列共享同一块内存，不复制)。
+    更新同一个视频到 200 台设备只读取一次视频文件
+    """
+    def __init__(self, server, want_timeout=30, apply_timeout=600, poll=1.0):
+        self.server = server
+        self.want_timeout = want_timeout  # 等待设备回复所缺数据块的期限 (秒)
+        self.apply_timeout = apply_timeout  # 数据块发完后等待设备应用更新的期限 (秒)
+        self.poll = poll  # 发送队列已满时等待其写出数据，每隔这么多秒重新检查一次
+        self.manifests = {}  # 源文件切分结果的缓存，见 scan_directory
+        self.pushes = {}  # 传输编号 -> ContentPush
+        self._ids = itertools.count(1)
+
+    def push(self, source, ips, target=''):
+        if not os.path.isdir(source):
+            print(f"目录不存在: {source}")
+            return None
+        push = ContentPush(next(self._ids) & 0xffffffff, source, target, ips)
+        self.pushes[push.id] = push
+        threading.Thread(target=self._run, args=(push,), name='content-push', daemon=True).start()
+        return push
+
+    def _run(self, push):
+        try:
+            self._distribute(push)
+        except (OSError, ContentError) as e:
+            logger.error(f"推送 #{push.id} 出错: {e}")
+            print(f"推送 #{push.id} 出错: {e}")
+        with push.lock:
+            for ip in push.targets:
+                push.results.setdefault(ip, TIMED_OUT)
+            push.finished = time.time()
+        logger.info(push.summary())
+        print(push.summary())
+
+    def _distribute(self, push):
+        start = time.perf_counter()
+        files = scan_directory(push.source, self.manifests)
+        push.files = len(files)
+        push.total_bytes = sum(size for _, size, _, _ in files)
+        push.locations = chunk_locations(files)
+        logger.info(f"推送 #{push.id}: {push.files} 个文件, {len(push.locations)} 个不同的数据块, "
+                    f"切分耗时 {time.perf_counter() - start:.2f} 秒")
+        offer = encode_content_offer(push.id, push.target, [
+            (relative, size, [(digest, length) for digest, _, length in chunks])
+            for relative, size, _, chunks in files])
+        for ip in sorted(push.targets):
+            client_socket = self.server.client_sockets.get(ip)
+            if client_socket is None:
+                push.results[ip] = OFFLINE
+            elif self.server.client_levels.get(client_socket, 0) < 6:
+                push.results[ip] = UNSUPPORTED
+            elif not self.server.send_bytes(client_socket, offer):
+                push.results[ip] = SEND_FAILED
+            else:
+                push.offered[ip] = client_socket
+
+        # 尽量等所有设备都回复后再一起发送；want_timeout 到达后先发给已回复的设备。
+        # 之后开始计算 apply_timeout，期间迟到的回复随到随发，同时等待各设备应用更新；
+        # 到期仍未回复或未应用的设备由 _run 记为超时
+        want_deadline = time.time() + self.want_timeout
+        apply_deadline = None
+        while True:
+            with push.lock:
+                ready = {ip: wants for ip, wants in push.wants.items()
+                         if ip not in push.served and ip not in push.results}
+                waiting = [ip for ip in push.offered if ip not in push.wants and ip not in push.results]
+                applying = [ip for ip in push.served if ip not in push.results]
+            now = time.time()
+            if ready and (apply_deadline is not None or not waiting or now >= want_deadline):
+                self._send_chunks(push, ready)
+                continue
+            if apply_deadline is None and (not waiting or now >= want_deadline):
+                apply_deadline = now + self.apply_timeout
+            if apply_deadline is not None and (now >= apply_deadline or not (waiting or applying)):
+                break
+            push.changed.wait(max(0, (apply_deadline or want_deadline) - now))
+            push.changed.clear()
+
+    def _send_chunks(self, push, ready):
+        needed = {}  # 摘要 -> 需要它的设备
+        for ip, digests in ready.items():
+            for digest in digests:
+                needed.setdefault(digest, []).append(ip)
+        current = None
+        source = None
+        start = time.perf_counter()
+        try:
+            for digest in sorted(needed, key=lambda digest: push.locations[digest][:2]):
+                path, offset, length = push.locations[digest]
+                if path != current:
+                    if source:
+                        source.close()
+                    source = open(path, 'rb')
+                    current = path
+                header = encode_content_chunk_header(push.id, digest, length)
+                frame = bytearray(len(header) + length)
+                frame[:len(header)] = header
+                source.seek(offset)
+                with memoryview(frame) as view:
+                    data = view[len(header):]
+                    if source.readinto(data) != length or chunk_digest(data) != digest:
+                        raise ContentError(f"{path} 在推送期间被修改")
+                push.bytes_read += length
+                push.chunks_read += 1
+                for ip in needed[digest]:
+                    if self._send_shared(push.offered[ip], frame):
+                        push.bytes_sent += len(frame)
+        finally:
+            if source:
+                source.close()
+        end = encode_content_end(push.id)
+        for ip in ready:
+            self.server.send_bytes(push.offered[ip], end)
+            with push.lock:
+                push.served.add(ip)
+        push.send_seconds += time.perf_counter() - start
+
+    def _send_shared(self, client_socket, frame):
+        # 等到发送队列有空间再放入，不因推送占满队列而被当作慢速客户端断开；
+        # 真正停止接收的连接由慢速客户端检测断开，之后跳过该设备
+        outbox = self.server.client_outboxes.get(client_socket)
+        if outbox is None:
+            return False
+        while not outbox.wait_for_room(len(frame), self.poll):
+            if self.server.client_outboxes.get(client_socket) is not outbox:
+                return False  # 连接已注销
+        if outbox.closed:
+            return False
+        return self.server.send_bytes(client_socket, frame)
+
+    def on_want(self, client_socket, ip, payload):
+        transfer_id, digests = decode_content_want(payload)
+        push = self.pushes.get(transfer_id)
+        if push is None or push.offered.get(ip) is not client_socket:
+            logger.warning(f"设备 {ip} 请求了未知推送 #{transfer_id} 的数据块，已忽略")
+            return
+        with push.lock:
+            if ip in push.wants or ip in push.results:
+                return
+            push.wants[ip] = {digest for digest in digests if digest in push.locations}
+        push.changed.set()
+
+    def on_done(self, client_socket, ip, payload):
+        transfer_id, result = decode_command(payload)
+        push = self.pushes.get(transfer_id)
+        if push is None:
+            return
+        with push.lock:
+            if ip in push.results:
+                return
+            if result == 'OK':
+                push.results[ip] = UPDATED
+            elif result == 'UNCHANGED':
+                push.results[ip] = UNCHANGED
+            else:
+                push.results[ip] = FAILED
+                push.errors[ip] = result
+        if result not in ('OK', 'UNCHANGED'):
+            logger.warning(f"设备 {ip} 应用推送 #{transfer_id} 失败: {result}")
+        push.changed.set()
+
+    def forget(self, client_socket):
+        # 连接断开：进行中的推送不再等待该设备
+        for push in list(self.pushes.values()):
+            if push.finished:
+                continue
+            with push.lock:
+                for ip, offered in push.offered.items():
+                    if offered is client_socket and ip not in push.results:
+                        push.results[ip] = DISCONNECTED
+            push.changed.set()
+
+
+class ContentTransfer:
+    def __init__(self, transfer_id, directory, files):
+        self.id = transfer_id
+        self.directory = directory  # 要更新的项目目录
+        self.staging = os.path.join(os.path.dirname(directory), '.sync', os.path.basename(directory))
+        self.files = files  # 服务器清单
+        self.local = {}  # 相对路径 -> (绝对路径, [(摘要, 偏移, 长度)])
+        self.index = {}  # 摘要 -> (绝对路径, 偏移, 长度)，本地已有的块
+        self.wanted = set()
+        self.received = {}  # 摘要 -> (暂存文件中的偏移, 长度)
+        self.pack = None  # 收到的块依次追加到暂存文件
+        self.error = None
+
+
+class ContentUpdater:
+    """
+    客户端应用服务器推送的内容。收到清单后在后台线程切分本地文件，只请求本地没有的块；
+    收到的块追加到暂存文件，全部到齐后在 <pssoft>/.sync/ 下组装出完整的新目录
+    (未变化的文件用硬链接，不复制)，再用两次重命名换下项目目录，失败时恢复原目录。
+    展项程序占用着目录中的文件时 Windows 上无法重命名，更新失败并报告给服务器
+    """
+    def __init__(self, send, project_dir):
+        self.send = send
+        self.project_dir = project_dir  # 项目名称 (空字符串为当前项目) -> 目录，没有项目时返回 None
+        self.transfer = None
+
+    def handle(self, msg_type, payload):
+        if msg_type == MSG_CONTENT_OFFER:
+            transfer_id, target, files = decode_content_offer(payload)
+            threading.Thread(target=self.prepare, args=(transfer_id, target, files), daemon=True).start()
+        elif msg_type == MSG_CONTENT_CHUNK:
+            self.on_chunk(payload)
+        elif msg_type == MSG_CONTENT_END:
+            transfer = self.transfer
+            if transfer is not None and transfer.id == decode_content_end(payload):
+                self.transfer = None
+                threading.Thread(target=self.apply, args=(transfer,), daemon=True).start()
+
+    def prepare(self, transfer_id, target, files):
+        try:
+            if os.sep in target or '/' in target or target in ('.', '..'):
+                raise ContentError(f"项目名称无效: {target}")
+            directory = self.project_dir(target)
+            if directory is None:
+                raise ContentError("没有可更新的项目目录")
+            for relative, _, _ in files:
+                parts = relative.split('/')
+                if relative.startswith('/') or ':' in relative or '..' in parts or '' in parts:
+                    raise ContentError(f"清单中的路径无效: {relative}")
+            transfer = ContentTransfer(transfer_id, directory, files)
+            start = time.perf_counter()
+            if os.path.isdir(directory):
+                for relative, _, path, chunks in scan_directory(directory):
+                    transfer.local[relative] = (path, chunks)
+                transfer.index = chunk_locations([(None, None, path, chunks)
+                                                  for path, chunks in transfer.local.values()])
+            transfer.wanted = {digest for _, _, chunks in files for digest, _ in chunks
+                               if digest not in transfer.index}
+            shutil.rmtree(transfer.staging, ignore_errors=True)
+            os.makedirs(transfer.staging)
+            transfer.pack = open(os.path.join(transfer.staging, 'chunks.pack'), 'w+b')
+        except (OSError, ContentError) as e:
+            client_logger.error(f"无法接收推送 #{transfer_id}: {e}")
+            self.send(encode_content_done(transfer_id, str(e)))
+            return
+        old = self.transfer
+        if old is not None and old.pack:
+            old.pack.close()
+        self.transfer = transfer
+        message = (f"收到内容推送 #{transfer_id}: {len(files)} 个文件, 需要下载 "
+                   f"{len(transfer.wanted)} 个数据块, 本地切分耗时 {time.perf_counter() - start:.2f} 秒")
+        client_logger.info(message)
+        print(message)
+        self.send(encode_content_want(transfer_id, list(transfer.wanted)))
+
+    def on_chunk(self, payload):
+        transfer_id, digest, data = decode_content_chunk(payload)
+        transfer = self.transfer
+        if transfer is None or transfer.id != transfer_id or digest not in transfer.wanted:
+            return
+        if digest in transfer.received or transfer.error:
+            return
+        if chunk_digest(data) != digest:
+            transfer.error = "数据块校验失败"
+            return
+        try:
+            offset = transfer.pack.seek(0, os.SEEK_END)
+            transfer.pack.write(data)
+        except OSError as e:
+            transfer.error = f"写入暂存文件失败: {e}"
+            return
+        transfer.received[digest] = (offset, len(data))
+
+    def apply(self, transfer):
+        try:
+            if transfer.error:
+                raise ContentError(transfer.error)
+            missing = len(transfer.wanted) - len(transfer.received)
+            if missing:
+                raise ContentError(f"缺少 {missing} 个数据块")
+            if self._unchanged(transfer):
+                result = 'UNCHANGED'
+            else:
+                self._build(transfer)
+                self._swap(transfer)
+                result = 'OK'
+        except (OSError, ContentError) as e:
+            result = str(e) or type(e).__name__
+        finally:
+            transfer.pack.close()
+            shutil.rmtree(transfer.staging, ignore_errors=True)
+            try:
+                os.rmdir(os.path.dirname(transfer.staging))  # 没有其他进行中的更新时一并删除 .sync
+            except OSError:
+                pass
+        if result == 'OK':
+            client_logger.info(f"内容推送 #{transfer.id} 已应用到 {transfer.directory}")
+            print(f"内容推送 #{transfer.id} 已应用到 {transfer.directory}")
+        elif result != 'UNCHANGED':
+            client_logger.error(f"内容推送 #{transfer.id} 应用失败: {result}")
+            print(f"内容推送 #{transfer.id} 应用失败: {result}")
+        self.send(encode_content_done(transfer.id, result))
+
+    def _unchanged(self, transfer):
+        local = {relative: [digest for digest, _, _ in chunks] for relative, (_, chunks) in transfer.local.items()}
+        offered = {relative: [digest for digest, _ in chunks] for relative, _, chunks in transfer.files}
+        return local == offered
+
+    def _build(self, transfer):
+        # 在暂存区组装完整的新目录
+        new_dir = os.path.join(transfer.staging, 'new')
+        os.makedirs(new_dir)
+        sources = {}
+        try:
+            for relative, size, chunks in transfer.files:
+                destination = os.path.join(new_dir, *relative.split('/'))
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                local = transfer.local.get(relative)
+                if local and [digest for digest, _, _ in local[1]] == [digest for digest, _ in chunks]:
+                    try:
+                        os.link(local[0], destination)
+                    except OSError:
+                        shutil.copy2(local[0], destination)
+                    continue
+                with open(destination, 'wb') as out:
+                    for digest, length in chunks:
+                        if digest in transfer.received:
+                            source, offset = transfer.pack, transfer.received[digest][0]
+                        else:
+                            path, offset, _ = transfer.index[digest]
+                            source = sources.get(path)
+                            if source is None:
+                                source = sources[path] = open(path, 'rb')
+                        source.seek(offset)
+                        out.write(source.read(length))
+                    if out.tell() != size:
+                        raise ContentError(f"{relative} 组装后大小不符")
+        finally:
+            for source in sources.values():
+                source.close()
+
+    def _swap(self, transfer):
+        new_dir = os.path.join(transfer.staging, 'new')
+        old_dir = os.path.join(transfer.staging, 'old')
+        if os.path.isdir(transfer.directory):
+            os.rename(transfer.directory, old_dir)
+        try:
+            os.rename(new_dir, transfer.directory)
+        except OSError:
+            if os.path.isdir(old_dir):
+                os.rename(old_dir, transfer.directory)
+            raise
@@ -0,0 +1,281 @@
+import select
+import socket
+import threading
+import json
+import time
+import datetime
+from logger_config import setup_logger, load_logging_config
+from sharding import parse_address, send_json, recv_json
+
+
+logger = setup_logger('coordinator', 'coordinator', options=load_logging_config('coordinator_config.json'))
+
+
+def load_coordinator_config():
+    try:
+        with open('coordinator_config.json', 'r') as config_file:
+            return json.load(config_file)
+    except FileNotFoundError:
+        print("未找到 coordinator_config.json 文件，使用默认设置")
+        return {}
+    except json.JSONDecodeError:
+        print("coordinator_config.json 文件格式错误，使用默认设置")
+        return {}
+
+
+class ShardLink:
+    """
+    到一个分片管理端口的长连接，请求串行发送；连接断开时下一次请求自动重连
+    """
+    def __init__(self, name, admin, timeout=2.0):
+        self.name = name  # 客户端连接的地址，也是哈希环上的名称
+        self.admin = parse_address(admin)
+        self.timeout = timeout
+        self.sock = None
+        self.stream = None
+        self.lock = threading.Lock()
+
+    def request(self, op, timeout=None, **args):
+        """
+        失败时抛出 OSError / ValueError。只在请求发出之前失败 (旧连接已被分片关闭，例如热重启) 时重连重试；
+        请求发出后等待回复超时或出错都不再重发，避免广播、关机等指令在分片上执行两次。
+        timeout: 本次请求等待回复的秒数，默认 self.timeout
+        """
+        with self.lock:
+            if self.sock is not None and self._stale():
+                self.close()
+            for attempt in range(2):
+                reused = self.sock is not None
+                try:
+                    if self.sock is None:
+                        self.sock = socket.create_connection(self.admin, timeout=self.timeout)
+                        self.stream = self.sock.makefile('rwb')
+                    self.sock.settimeout(self.timeout)
+                    send_json(self.stream, dict(args, op=op))
+                except (OSError, ValueError):
+                    self.close()
+                    if not reused or attempt:
+                        raise
+                    continue
+                try:
+                    self.sock.settimeout(timeout or self.timeout)
+                    return recv_json(self.stream)
+                except (OSError, ValueError):
+                    self.close()
+                    raise
+
+    def _stale(self):
+        # 空闲的连接上不应有数据；可读说明分片已关闭连接 (或残留了超时请求的迟到回复)
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.stream.close()
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+        self.stream = None
+
+
+class ShardCoordinator:
+    """
+    分片模式的协调器：不接受客户端连接，只通过各分片的管理端口转发指令和汇总结果。
+    后台定期检查各分片，分片上下线时把可用分片列表下发给所有分片，
+    分片据此让改变归属的设备 (只有故障分片恢复后应回到它的那部分) 重新连接
+    """
+    def __init__(self, shards, poll_interval=5, timeout=2.0, bocast_timeout=10.0):
+        self.links = [ShardLink(shard['name'], shard['admin'], timeout) for shard in shards]
+        self.poll_interval = poll_interval
+        self.bocast_timeout = bocast_timeout  # 分片广播后要等待投递 (broadcast_wait)，必须明显更长
+        self.alive = set()  # 当前可用的分片
+        self.health = {}  # 分片 -> 最近一次 ping 的结果或错误信息
+        self.locations = {}  # ip -> 最近一次发现该设备所在的分片
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.check_shards()
+        self._thread = threading.Thread(target=self._run, name='shard-poll', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        for link in self.links:
+            link.close()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            self.check_shards()
+
+    def fan_out(self, op, links=None, timeout=None, **args):
+        # 并发向多个分片发送同一请求，返回 {分片: 回复}，失败的分片回复为 None
+        links = self.links if links is None else links
+        results = {}
+
+        def ask(link):
+            try:
+                results[link.name] = link.request(op, timeout, **args)
+            except (OSError, ValueError) as e:
+                logger.warning(f"分片 {link.name} 请求 {op} 失败: {e}")
+                results[link.name] = None
+        threads = [threading.Thread(target=ask, args=(link,)) for link in links]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def check_shards(self):
+        results = self.fan_out('ping')
+        alive = {name for name, result in results.items() if result is not None}
+        self.health = results
+        if alive == self.alive:
+            return
+        went_down = sorted(self.alive - alive)
+        came_up = sorted(alive - self.alive)
+        self.alive = alive
+        for name in went_down:
+            logger.warning(f"分片 {name} 不可用，其设备由哈希环上的下一个分片接管")
+            print(f"分片 {name} 不可用，其设备由哈希环上的下一个分片接管")
+        for name in came_up:
+            logger.info(f"分片 {name} 可用")
+            print(f"分片 {name} 可用")
+        results = self.fan_out('members', [link for link in self.links if link.name in alive],
+                               alive=sorted(alive))
+        moved = sum(result['moved'] for result in results.values() if result and 'moved' in result)
+        if moved:
+            logger.info(f"分片变化，通知 {moved} 台设备重新连接到归属分片")
+            print(f"分片变化，通知 {moved} 台设备重新连接到归属分片")
+
+    def online_clients(self):
+        # 汇总各分片的在线设备 [(分片, 设备)]，同时更新 ip -> 分片 的位置表
+        merged = []
+        for name, result in self.fan_out('online').items():
+            if result is None:
+                continue
+            for client in result['clients']:
+                self.locations[client['ip']] = name
+                merged.append((name, client))
+        merged.sort(key=lambda item: item[1]['ip'])
+        return merged
+
+    def show_online_clients(self):
+        print("\n当前在线客户端信息:")
+        print("--------------------")
+        online = self.online_clients()
+        for shard, client in online:
+            for name in client['names'] or ['未登记']:
+                print(f"IP地址: {client['ip']}")
+                print(f"展品名称: {name}")
+                print(f"所在分片: {shard}")
+                print(f"最后活动时间: "
+                      f"{datetime.datetime.fromtimestamp(client['last_seen']).strftime('%Y-%m-%d %H:%M:%S')}")
+                print("--------------------")
+        if not online:
+            print("当前没有在线的客户端")
+        else:
+            print(f"共有 {len(online)} 个客户端在线 ({len(self.alive)}/{len(self.links)} 个分片可用)")
+        print()
+
+    def send_to_client(self, ip, message):
+        # 先发往上次发现该设备的分片，不在那里时再同时询问其他分片
+        known = self.locations.get(ip)
+        first = [link for link in self.links if link.name == known]
+        for links in (first, [link for link in self.links if link.name != known]):
+            if not links:
+                continue
+            for name, result in self.fan_out('send', links, ip=ip, message=message).items():
+                if result and result.get('sent'):
+                    self.locations[ip] = name
+                    logger.info(f"已通过分片 {name} 发送消息到客户端 {ip}: {message}")
+                    print(f"已通过分片 {name} 发送消息到客户端 {ip}: {message}\n")
+                    return True
+        self.locations.pop(ip, None)
+        logger.warning(f"客户端 {ip} 不在任何分片上在线")
+        print(f"客户端 {ip} 不在任何分片上在线")
+        return False
+
+    def bocast(self, message):
+        # 各分片并发广播，合并投递统计
+        start = time.perf_counter()
+        totals = {'total': 0, 'delivered': 0, 'queued': 0, 'dropped': 0}
+        failed = []
+        for name, result in self.fan_out('bocast', timeout=self.bocast_timeout, message=message).items():
+            if result is None or 'error' in result:
+                failed.append(name)
+                continue
+            for field in totals:
+                totals[field] += result[field]
+        summary = (f"广播 '{message}': {len(self.links) - len(failed)} 个分片, 共 {totals['total']} 个客户端, "
+                   f"已送达 {totals['delivered']}, 排队中 {totals['queued']}, 已丢弃 {totals['dropped']}, "
+                   f"耗时 {(time.perf_counter() - start) * 1000:.1f}ms"
+                   + (f", 不可用的分片: {', '.join(failed)}" if failed else ""))
+        logger.info(summary)
+        print(summary)
+        return totals
+
+    def show_shards(self):
+        print("\n分片状态:")
+        print("--------------------")
+        for link in self.links:
+            result = self.health.get(link.name)
+            if result is None:
+                print(f"{link.name:<22}不可用")
+            else:
+                print(f"{link.name:<22}连接 {result['connections']}, 在线 {result['online']}")
+        print()
+
+
+def main():
+    config = load_coordinator_config()
+    coordinator = ShardCoordinator(config.get('shards', []), config.get('poll_interval', 5),
+                                   config.get('timeout', 2.0), config.get('bocast_timeout', 10.0))
+    coordinator.start()
+
+    help_message = """
+可用命令:
+quit - 停止协调器
+shards - 显示各分片的状态
+show-online - 汇总显示所有分片的在线客户端
+send <IP> <消息> - 把消息转发到设备所在的分片
+bocast <消息> - 在所有分片上广播消息
+help - 显示此帮助信息
+"""
+    print(help_message)
+
+    try:
+        while True:
+            command = input("输入命令: ")
+            if command.lower() == 'quit':
+                break
+            elif command.lower() == 'shards':
+                coordinator.show_shards()
+            elif command.lower() == 'show-online':
+                coordinator.show_online_clients()
+            elif command.lower().startswith('send '):
+                parts = command.split(' ', 2)
+                if len(parts) == 3:
+                    coordinator.send_to_client(parts[1], parts[2])
+                else:
+                    print("格式错误。正确格式: send <IP> <消息>")
+            elif command.lower().startswith('bocast '):
+                coordinator.bocast(command.split(' ', 1)[1])
+            elif command.lower() == 'help':
+                print(help_message)
+            else:
+                print("未知命令。输入 'help' 查看可用命令列表。")
+    except KeyboardInterrupt:
+        print("\n接收到中断信号，正在关闭协调器...")
+    finally:
+        coordinator.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+展项客户端模拟器
+
+在本机启动大量轻量的模拟客户端，使用与 client.Client 相同的协议：连接后协商帧协议
+(或按比例使用旧文本协议)，定期上报状态，回复带编号的指令、对文本 test / hello 回复 OK，断线后退避重连。
+每个工作进程用一个 selectors 事件循环驱动数千个连接，由 Fleet 通过管道下发指令、收集统计。
+每个模拟客户端绑定 127.0.0.0/8 中不同的源地址，服务器看到的是不同的 IP。
+port 为端口列表时模拟分片模式：按 project@ip 的一致性哈希选择分片，连不上时尝试环上的下一个，
+收到 rebalance 指令后断开重新选择。
+"""
+import heapq
+import multiprocessing
+import random
+import selectors
+import socket
+import time
+
+from network_utils import ReconnectBackoff
+from sharding import HashRing
+from protocol import (StreamDecoder, MSG_HELLO, MSG_TEXT, MSG_COMMAND, encode_hello, decode_hello_session,
+                      encode_text, encode_status, format_status, decode_command, encode_reply)
+
+
+def sim_address(index):
+    # 第 index 个模拟客户端的源地址: 127.1.0.0, 127.1.0.1, ...
+    return f'127.{1 + index // 65536}.{index // 256 % 256}.{index % 256}'
+
+
+class SimClient:
+    def __init__(self, index, text_protocol):
+        self.index = index
+        self.ip = sim_address(index)
+        self.text = text_protocol
+        self.sock = None
+        self.decoder = None
+        self.framed = False
+        self.ready = False
+        self.token = b''
+        self.port = None  # 当前连接的服务器端口
+        self.candidates = []  # 分片模式: 按哈希环排列的端口
+        self.attempt = 0  # 本轮重连正在尝试的分片
+        self.out = bytearray()
+        self.backoff = ReconnectBackoff(0.5, 10)
+        self.status = {'ip': self.ip, 'project_name': f'模拟展项{index}', 'cpu': 2.0, 'memory': 40.0,
+                       'boot_time': time.time() - 3600, 'uptime': 3600}
+
+    def status_bytes(self):
+        self.status['cpu'] = round(random.uniform(0, 20), 1)
+        if self.framed:
+            return encode_status(self.status)
+        return f"状态信息: {format_status(self.status)}".encode('utf-8')
+
+    def reply(self, text):
+        return encode_text(text) if self.framed else text.encode('utf-8')
+
+
+class FleetWorker:
+    """
+    一个工作进程中的一组模拟客户端
+    """
+    def __init__(self, port, indexes, pipe, interval, text_ratio, bind_source, ignore_ratio=0.0):
+        self.ports = port if isinstance(port, (list, tuple)) else [port]
+        self.ignore_ratio = ignore_ratio  # 模拟丢失：按该比例忽略带编号的指令
+        self.pipe = pipe
+        self.interval = interval  # 定期上报间隔 (秒)，0 表示不定期上报
+        self.bind_source = bind_source
+        self.selector = selectors.DefaultSelector()
+        self.clients = [SimClient(i, random.random() < text_ratio) for i in indexes]
+        self.timers = []  # (到期时间, 序号, 回调, 客户端)
+        self.sequence = 0
+        self.running = True
+        self.stats = {'connects': 0, 'disconnects': 0, 'reports': 0, 'replies': 0, 'ready': 0}
+        self.test_times = []  # 收到 test 指令的时间
+        if len(self.ports) > 1:
+            ring = HashRing([f'127.0.0.1:{port}' for port in self.ports])
+            for client in self.clients:
+                key = f"{client.status['project_name']}@{client.ip}"
+                client.candidates = [int(name.rsplit(':', 1)[1]) for name in ring.preference(key)]
+            for port in self.ports:
+                self.stats[f'ready@{port}'] = 0
+
+    def later(self, delay, callback, client):
+        self.sequence += 1
+        heapq.heappush(self.timers, (time.time() + delay, self.sequence, callback, client))
+
+    def run(self):
+        self.selector.register(self.pipe, selectors.EVENT_READ, None)
+        for client in self.clients:
+            self.later(random.uniform(0, 0.5), self.connect, client)
+        while self.running:
+            timeout = 0.2
+            if self.timers:
+                timeout = max(0, min(timeout, self.timers[0][0] - time.time()))
+            for key, mask in self.selector.select(timeout):
+                if key.data is None:
+                    self.on_command(self.pipe.recv())
+                    continue
+                client = key.data
+                if mask & selectors.EVENT_READ:
+                    self.on_readable(client)
+                if mask & selectors.EVENT_WRITE and client.sock is not None:
+                    self.flush(client)
+            now = time.time()
+            while self.timers and self.timers[0][0] <= now:
+                _, _, callback, client = heapq.heappop(self.timers)
+                callback(client)
+        for client in self.clients:
+            if client.sock is not None:
+                client.sock.close()
+
+    def connect(self, client):
+        client.port = client.candidates[client.attempt] if client.candidates else self.ports[0]
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            if self.bind_source:
+                sock.bind((client.ip, 0))
+            sock.connect_ex(('127.0.0.1', client.port))
+        except OSError:
+            sock.close()
+            self.later(client.backoff.next_delay(), self.connect, client)
+            return
+        client.sock = sock
+        client.decoder = StreamDecoder()
+        client.framed = False
+        client.ready = False
+        client.out = bytearray(client.status_bytes() if client.text else encode_hello(client.token))
+        self.selector.register(sock, selectors.EVENT_READ | selectors.EVENT_WRITE, client)
+        self.stats['connects'] += 1
+        if client.text:
+            self.on_ready(client)
+
+    def on_ready(self, client):
+        client.ready = True
+        client.backoff.reset()
+        self.stats['ready'] += 1
+        if client.candidates:
+            self.stats[f'ready@{client.port}'] += 1
+        if self.interval:
+            self.later(random.uniform(0, self.interval), self.report, client)
+
+    def disconnect(self, client):
+        if client.sock is None:
+            return
+        self.selector.unregister(client.sock)
+        client.sock.close()
+        client.sock = None
+        self.stats['disconnects'] += 1
+        if client.ready:
+            self.stats['ready'] -= 1
+            if client.candidates:
+                self.stats[f'ready@{client.port}'] -= 1
+            client.attempt = 0
+        elif client.candidates and client.attempt + 1 < len(client.candidates):
+            # 没有连上：立即尝试环上的下一个分片
+            client.attempt += 1
+            self.later(0, self.connect, client)
+            return
+        else:
+            client.attempt = 0
+        client.ready = False
+        self.later(client.backoff.next_delay(), self.connect, client)
+
+    def send(self, client, data):
+        if client.sock is None:
+            return
+        client.out += data
+        self.flush(client)
+
+    def flush(self, client):
+        try:
+            if client.out:
+                sent = client.sock.send(client.out)
+                del client.out[:sent]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.disconnect(client)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.out else 0)
+        self.selector.modify(client.sock, events, client)
+
+    def on_readable(self, client):
+        try:
+            data = client.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.disconnect(client)
+            return
+        for msg_type, payload in client.decoder.feed(data):
+            if msg_type == MSG_HELLO:
+                client.framed = True
+                _, token, resumed = decode_hello_session(payload)
+                client.token = token or b''
+                if not resumed:
+                    self.send(client, client.status_bytes())
+                self.on_ready(client)
+            elif msg_type == MSG_TEXT:
+                self.on_text(client, payload.decode('utf-8', 'replace'))
+            elif msg_type == MSG_COMMAND:
+                if random.random() >= self.ignore_ratio:
+                    self.on_text(client, *reversed(decode_command(payload)))
+
+    def on_text(self, client, message, command_id=None):
+        # 带编号的指令总是回复同一编号，旧的文本指令只有 test / hello 回复 OK
+        if message == 'test':
+            self.test_times.append(time.time())
+        if message == 'rebalance' and client.candidates:
+            self.disconnect(client)
+            return
+        if message == 'get':
+            self.send(client, client.status_bytes())
+            self.stats['reports'] += 1
+        if command_id is not None:
+            self.send(client, encode_reply(command_id, "OK"))
+            self.stats['replies'] += 1
+        elif message in ('test', 'hello'):
+            self.send(client, client.reply("OK"))
+            self.stats['replies'] += 1
+
+    def report(self, client):
+        if not client.ready:
+            return
+        self.send(client, client.status_bytes())
+        self.stats['reports'] += 1
+        self.later(self.interval, self.report, client)
+
+    def on_command(self, command):
+        name, arg = command
+        if name == 'stats':
+            self.pipe.send(dict(self.stats, test_times=self.test_times))
+            self.test_times = []
+        elif name == 'burst':
+            # 每个已就绪的客户端立即连续上报 arg 条状态，返回服务器应处理的消息数：
+            # 旧文本协议没有分帧，连续发送的多条状态会被服务器当作一条
+            expected = 0
+            for client in self.clients:
+                if client.ready:
+                    self.send(client, b''.join(client.status_bytes() for _ in range(arg)))
+                    self.stats['reports'] += arg
+                    expected += arg if client.framed else 1
+            self.pipe.send(expected)
+        elif name == 'stop':
+            self.running = False
+
+
+def _worker_main(port, indexes, pipe, interval, text_ratio, bind_source, ignore_ratio):
+    FleetWorker(port, indexes, pipe, interval, text_ratio, bind_source, ignore_ratio).run()
+
+
+class Fleet:
+    """
+    在 processes 个工作进程中运行 clients 个模拟客户端。
+    interval: 定期上报状态的间隔 (秒)；text_ratio: 使用旧文本协议的客户端比例；
+    ignore_ratio: 忽略带编号指令的比例，用于测试重试
+    """
+    def __init__(self, port, clients, processes=4, interval=30, text_ratio=0.0, bind_source=True, ignore_ratio=0.0):
+        self.port = port
+        self.clients = clients
+        self.interval = interval
+        self.text_ratio = text_ratio
+        self.bind_source = bind_source
+        self.ignore_ratio = ignore_ratio
+        self.workers = []
+        self.processes = max(1, min(processes, clients))
+
+    def start(self):
+        ctx = multiprocessing.get_context('spawn')
+        for i in range(self.processes):
+            parent, child = ctx.Pipe()
+            indexes = range(i, self.clients, self.processes)
+            process = ctx.Process(target=_worker_main, daemon=True,
+                                  args=(self.port, indexes, child, self.interval, self.text_ratio,
+                                        self.bind_source, self.ignore_ratio))
+            process.start()
+            self.workers.append((process, parent))
+
+    def _ask(self, command, arg=None):
+        for _, pipe in self.workers:
+            pipe.send((command, arg))
+        return [pipe.recv() for _, pipe in self.workers]
+
+    def stats(self):
+        # 合并各进程的计数；test_times 为自上次调用以来收到 test 指令的时间
+        merged = {'test_times': []}
+        for stats in self._ask('stats'):
+            merged['test_times'] += stats.pop('test_times')
+            for name, value in stats.items():
+                merged[name] = merged.get(name, 0) + value
+        return merged
+
+    def wait_ready(self, count=None, timeout=120):
+        count = self.clients if count is None else count
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.stats()['ready'] >= count:
+                return True
+            time.sleep(0.1)
+        return False
+
+    def burst(self, reports):
+        return sum(self._ask('burst', reports))
+
+    def stop(self):
+        for process, pipe in self.workers:
+            try:
+                pipe.send(('stop', None))
+            except OSError:
+                pass
+        for process, _ in self.workers:
+            process.join(timeout=5)
+        self.workers = []
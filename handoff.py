@@ -0,0 +1,180 @@
+import json
+import os
+import socket
+import struct
+import threading
+import time
+import logging
+
+logger = logging.getLogger('server')
+
+# Unix socket 上的消息: 4 字节长度 + JSON；附带的文件描述符随长度头一起发送 (SCM_RIGHTS)
+LENGTH = struct.Struct('!I')
+FDS_PER_MESSAGE = 200  # Linux 单条消息最多可带 253 个描述符
+REQUEST = b'TAKEOVER\n'
+
+
+def supported():
+    # 需要 Unix socket 和 socket.send_fds (Python 3.9+)，Windows 上不可用
+    return hasattr(socket, 'AF_UNIX') and hasattr(socket, 'send_fds')
+
+
+def send_message(sock, message, fds=()):
+    body = json.dumps(message, ensure_ascii=False).encode('utf-8')
+    header = LENGTH.pack(len(body))
+    if fds:
+        socket.send_fds(sock, [header], list(fds))
+    else:
+        sock.sendall(header)
+    sock.sendall(body)
+
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("交接连接已断开")
+        data += chunk
+    return bytes(data)
+
+
+def recv_message(sock):
+    # 返回 (消息, 描述符列表)
+    header, fds, _, _ = socket.recv_fds(sock, LENGTH.size, FDS_PER_MESSAGE)
+    if not header:
+        raise ConnectionError("交接连接已断开")
+    if len(header) < LENGTH.size:
+        header += _recv_exact(sock, LENGTH.size - len(header))
+    (length,) = LENGTH.unpack(header)
+    return json.loads(_recv_exact(sock, length).decode('utf-8')), fds
+
+
+def send_state(sock, state, listener, clients):
+    """
+    旧进程: 发送全局状态和监听 socket，再分批发送客户端连接；
+    clients 为 [(socket, 连接状态)]，每批的描述符与连接状态按顺序一一对应
+    """
+    send_message(sock, dict(state, clients=len(clients)), [listener.fileno()])
+    for i in range(0, len(clients), FDS_PER_MESSAGE):
+        batch = clients[i:i + FDS_PER_MESSAGE]
+        send_message(sock, [info for _, info in batch], [client.fileno() for client, _ in batch])
+
+
+class Takeover:
+    """
+    新进程一侧的交接: 从旧进程接收监听 socket、客户端连接和内存状态。
+    adopt 完成后调用 confirm，旧进程收到确认后停止并退出，之后新进程再开始收发
+    """
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self.sock = None
+        self.state = None
+        self.listener = None
+        self.clients = []  # [(socket, 连接状态)]
+        self.started = None
+
+    def receive(self):
+        # 没有旧进程在等待交接时抛出 OSError
+        self.started = time.perf_counter()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+            sock.sendall(REQUEST)
+            self.state, fds = recv_message(sock)
+            if len(fds) != 1:
+                raise ConnectionError("没有收到监听 socket")
+            self.listener = socket.socket(fileno=fds[0])
+            while len(self.clients) < self.state['clients']:
+                infos, fds = recv_message(sock)
+                if len(fds) != len(infos):
+                    raise ConnectionError("连接状态与描述符数量不符")
+                self.clients += [(socket.socket(fileno=fd), info) for fd, info in zip(fds, infos)]
+        except (OSError, ValueError):
+            sock.close()
+            self.close()
+            raise
+        self.sock = sock
+
+    def confirm(self):
+        # 告诉旧进程已接管，等它停止后台任务 (写完登记表、遥测等文件) 后返回
+        try:
+            send_message(self.sock, {'type': 'ready'})
+            recv_message(self.sock)
+        except (OSError, ValueError) as e:
+            logger.warning(f"等待旧进程退出时出错: {e}")
+        finally:
+            self.sock.close()
+            self.sock = None
+
+    def close(self):
+        # 接管失败时关闭已收到的描述符；旧进程超时后恢复服务，连接不受影响
+        if self.listener is not None:
+            self.listener.close()
+        for client, _ in self.clients:
+            client.close()
+        self.clients = []
+
+
+class HandoffListener:
+    """
+    旧进程一侧: 在 Unix socket 上等待新进程接管 (python server.py --takeover)。
+    新进程连接后由 server.hand_off 完成交接，成功时退出本进程
+    """
+    def __init__(self, server, path, exit_on_handoff=True):
+        self.server = server
+        self.path = path
+        self.exit_on_handoff = exit_on_handoff
+        self.sock = None
+        self._thread = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                os.unlink(self.path)  # 上次异常退出留下的文件
+            else:
+                logger.error(f"{self.path} 已有服务器在监听，不启用热重启")
+                print(f"{self.path} 已有服务器在监听，不启用热重启")
+                return False
+            finally:
+                probe.close()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(1)
+        self._thread = threading.Thread(target=self._run, name='handoff', daemon=True)
+        self._thread.start()
+        logger.info(f"热重启: 新进程可通过 {self.path} 接管")
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return  # 已关闭
+            try:
+                conn.settimeout(30)
+                if _recv_exact(conn, len(REQUEST)) != REQUEST:
+                    conn.close()
+                    continue
+            except OSError:
+                conn.close()
+                continue
+            if self.server.hand_off(conn) and self.exit_on_handoff:
+                logging.shutdown()
+                os._exit(0)
+
+    def close(self):
+        if self.sock is None:
+            return
+        self.sock.close()
+        self.sock = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
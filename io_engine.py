@@ -0,0 +1,256 @@
+import selectors
+import socket
+import threading
+import collections
+import logging
+import time
+
+# 与 server.py 共用同一个日志记录器
+logger = logging.getLogger('server')
+
+
+class Connection:
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.ip = addr[0]
+        self.outbox = None  # 由服务器在 register_client 时创建的发送队列
+        self.events = selectors.EVENT_READ
+
+
+class EventLoop:
+    """
+    单个事件循环：在一个线程里用 selectors 复用一组客户端 socket
+    """
+    def __init__(self, engine, index):
+        self.engine = engine
+        self.server = engine.server
+        self.index = index
+        self.selector = selectors.DefaultSelector()
+        self.connections = {}  # socket -> Connection
+        self.backlogged = set()  # 发送队列中还有数据的连接
+        self._pending = collections.deque()  # 其他线程投递过来的回调
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, self._on_wakeup)
+        self.thread = threading.Thread(target=self.run, name=f'io-loop-{index}', daemon=True)
+
+    def call_soon(self, callback, *args):
+        # 线程安全：把回调交给事件循环线程执行
+        self._pending.append((callback, args))
+        try:
+            self._wake_w.send(b'\0')
+        except OSError:
+            pass  # 唤醒缓冲区已满，循环肯定会被唤醒
+
+    def run(self):
+        while self.engine.running:
+            timeout = 1.0
+            if self.index == 0 and self.engine.accept_paused_until:
+                timeout = max(0, min(timeout, self.engine.accept_paused_until - time.monotonic()))
+            for key, mask in self.selector.select(timeout=timeout):
+                if isinstance(key.data, Connection):
+                    self._on_connection_event(key.data, mask)
+                else:
+                    key.data()
+            while self._pending:
+                callback, args = self._pending.popleft()
+                callback(*args)
+            if self.backlogged:
+                self._shed_slow_connections()
+            if self.index == 0 and self.engine.accept_paused_until:
+                self.engine.resume_accept()
+        if self.engine.detaching:
+            self._release()  # 热重启交接：连接留给新进程
+        else:
+            self._close_all()
+
+    def _on_wakeup(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def add_connection(self, sock, addr):
+        conn = Connection(sock, addr)
+        self.connections[sock] = conn
+        self.selector.register(sock, conn.events, conn)
+        self.server.register_client(conn.ip, sock)
+        conn.outbox = self.server.client_outboxes[sock]
+
+    def attach(self, sock, ip):
+        # 接管已登记的连接 (热重启)，发送队列中交接过来的数据在可写时继续发送
+        conn = Connection(sock, (ip,))
+        conn.outbox = self.server.client_outboxes[sock]
+        if conn.outbox.pending():
+            conn.events |= selectors.EVENT_WRITE
+            self.backlogged.add(conn)
+        self.connections[sock] = conn
+        self.selector.register(sock, conn.events, conn)
+
+    def _on_connection_event(self, conn, mask):
+        if mask & selectors.EVENT_READ:
+            try:
+                data = conn.sock.recv(65536)
+            except BlockingIOError:
+                data = None
+            except OSError as e:
+                self.close_connection(conn, e)
+                return
+            if data is not None:
+                if not data:
+                    self.close_connection(conn)
+                    return
+                try:
+                    self.server.handle_data(conn.sock, conn.ip, data)
+                except Exception as e:
+                    self.close_connection(conn, e)
+                    return
+        if mask & selectors.EVENT_WRITE:
+            self._flush(conn)
+
+    def flush_socket(self, sock):
+        conn = self.connections.get(sock)
+        if conn is not None:
+            self._flush(conn)
+
+    def _flush(self, conn):
+        try:
+            conn.outbox.flush(conn.sock)
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            logger.error(f"向客户端 {conn.ip} 发送消息时出错: {e}")
+            self.close_connection(conn, e)
+            return
+        if conn.outbox.pending():
+            self.backlogged.add(conn)
+            events = selectors.EVENT_READ | selectors.EVENT_WRITE
+        else:
+            self.backlogged.discard(conn)
+            events = selectors.EVENT_READ
+        if events != conn.events:
+            conn.events = events
+            self.selector.modify(conn.sock, events, conn)
+
+    def _shed_slow_connections(self):
+        now = time.monotonic()
+        timeout = self.server.slow_client_timeout
+        for conn in [c for c in self.backlogged if c.outbox.is_stalled(timeout, now)]:
+            self.close_connection(conn, f"发送队列积压超过 {timeout} 秒，断开慢速客户端")
+
+    def close_connection(self, conn, error=None):
+        if self.connections.pop(conn.sock, None) is None:
+            return
+        self.backlogged.discard(conn)
+        if error is not None:
+            logger.error(f"Client {conn.ip} 异常退出: {error}")
+            print(f"Client {conn.ip} 异常退出: {error}")
+        try:
+            self.selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        self.engine.forget(conn.sock)
+        self.server.unregister_client(conn.ip, conn.sock)
+        conn.sock.close()
+
+    def _close_all(self):
+        for conn in list(self.connections.values()):
+            self.close_connection(conn)
+        self._release()
+
+    def _release(self):
+        self.selector.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+
+class SelectorEngine:
+    """
+    事件循环连接引擎：所有客户端 socket 复用在 workers 个事件循环上，
+    不再为每个客户端创建线程。监听 socket 挂在第一个循环上，新连接轮询分配。
+    """
+    def __init__(self, server, workers=1):
+        self.server = server
+        self.running = False
+        self.loops = [EventLoop(self, i) for i in range(max(1, workers))]
+        self._owners = {}  # socket -> EventLoop
+        self._next_loop = 0
+        self.accept_paused_until = None  # 超过准入速率时暂停监听到该时间
+        self.detaching = False
+
+    def start(self, connections=()):
+        # connections: 热重启时从旧进程接管的 [(ip, socket)]，已由服务器登记
+        self.running = True
+        listener = self.server.server_socket
+        listener.setblocking(False)
+        self.loops[0].selector.register(listener, selectors.EVENT_READ, self._on_accept)
+        for ip, sock in connections:
+            sock.setblocking(False)
+            self._assign(sock).attach(sock, ip)
+        for loop in self.loops:
+            loop.thread.start()
+
+    def _on_accept(self):
+        listener = self.server.server_socket
+        while True:
+            wait = self.server.admission.acquire()
+            if wait:
+                # 暂时不再监听新连接，由第一个事件循环到时恢复
+                self.loops[0].selector.unregister(listener)
+                self.accept_paused_until = time.monotonic() + wait
+                return
+            try:
+                client_socket, addr = listener.accept()
+            except BlockingIOError:
+                self.server.admission.refund()  # 没有等待中的连接，归还令牌
+                return
+            except OSError:
+                return
+            client_socket.setblocking(False)
+            print(f"新客户端连接: {addr}")
+            self.server.clients.append(client_socket)
+            loop = self._assign(client_socket)
+            if loop is self.loops[0]:
+                loop.add_connection(client_socket, addr)
+            else:
+                loop.call_soon(loop.add_connection, client_socket, addr)
+
+    def _assign(self, sock):
+        loop = self.loops[self._next_loop]
+        self._next_loop = (self._next_loop + 1) % len(self.loops)
+        self._owners[sock] = loop
+        return loop
+
+    def resume_accept(self):
+        if time.monotonic() < self.accept_paused_until:
+            return
+        self.accept_paused_until = None
+        self.loops[0].selector.register(self.server.server_socket, selectors.EVENT_READ, self._on_accept)
+        self._on_accept()
+
+    def kick(self, sock):
+        # 通知所属事件循环发送队列中有新数据
+        loop = self._owners.get(sock)
+        if loop is not None:
+            loop.call_soon(loop.flush_socket, sock)
+
+    def forget(self, sock):
+        self._owners.pop(sock, None)
+
+    def connection_count(self):
+        return sum(len(loop.connections) for loop in self.loops)
+
+    def detach(self):
+        # 停止事件循环但不关闭客户端连接，用于把连接交给新进程
+        self.detaching = True
+        self.stop()
+
+    def stop(self):
+        self.running = False
+        for loop in self.loops:
+            loop.call_soon(lambda: None)
+        for loop in self.loops:
+            if loop.thread.is_alive() and loop.thread is not threading.current_thread():
+                loop.thread.join(timeout=5)
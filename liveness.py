@@ -0,0 +1,137 @@
+import heapq
+import threading
+import time
+import logging
+
+logger = logging.getLogger('server')
+
+
+class LivenessTracker:
+    """
+    事件驱动的在线状态跟踪。每台设备 (按 IP) 在截止时间堆中最多有一项，
+    收到消息只更新 last_seen；到期时若期间有新消息就顺延，否则转为离线并触发事件。
+    在线集合和在线数量随时可用，无需扫描所有设备。
+    """
+    def __init__(self, default_timeout=90, group_timeouts=None):
+        self.default_timeout = default_timeout
+        self.group_timeouts = dict(group_timeouts or {})  # 分组名 -> 超时秒数
+        self.last_seen = {}  # ip -> 最后一次收到消息的时间
+        self.groups = {}  # ip -> 分组名
+        self.online = set()
+        self.listeners = []  # callback(ip, online, timestamp)
+        self._heap = []  # (截止时间, ip)
+        self._scheduled = set()  # 在堆中已有一项的 ip
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='liveness', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def on_transition(self, callback):
+        self.listeners.append(callback)
+
+    def timeout_for(self, ip):
+        return self.group_timeouts.get(self.groups.get(ip), self.default_timeout)
+
+    def set_group(self, ip, group):
+        with self._cond:
+            if group is None:
+                self.groups.pop(ip, None)
+            else:
+                self.groups[ip] = group
+
+    def touch(self, ip, now=None):
+        # 收到设备消息时调用
+        now = time.time() if now is None else now
+        with self._cond:
+            self.last_seen[ip] = now
+            if ip in self.online:
+                return
+            self.online.add(ip)
+            if ip not in self._scheduled:
+                self._scheduled.add(ip)
+                heapq.heappush(self._heap, (now + self.timeout_for(ip), ip))
+                if self._heap[0][1] == ip:
+                    self._cond.notify()  # 新的截止时间最早，唤醒后台线程重新计时
+        self._emit(ip, True, now)
+
+    def restore(self, last_seen, online):
+        # 热重启：沿用旧进程的最后消息时间和在线集合，不触发上线事件
+        with self._cond:
+            self.last_seen.update(last_seen)
+            for ip in online:
+                if ip in self.online or ip not in self.last_seen:
+                    continue
+                self.online.add(ip)
+                if ip not in self._scheduled:
+                    self._scheduled.add(ip)
+                    heapq.heappush(self._heap, (self.last_seen[ip] + self.timeout_for(ip), ip))
+            self._cond.notify()
+
+    def mark_offline(self, ip, now=None):
+        # 连接断开等明确信号，立即转为离线
+        now = time.time() if now is None else now
+        with self._cond:
+            if ip not in self.online:
+                return
+            self.online.discard(ip)  # 堆中的旧项到期时再移除
+        self._emit(ip, False, now)
+
+    def is_online(self, ip):
+        return ip in self.online
+
+    def online_count(self):
+        return len(self.online)
+
+    def online_ips(self):
+        with self._cond:
+            return list(self.online)
+
+    def expire(self, now=None):
+        # 处理所有已到期的设备，返回转为离线的 IP 列表；由后台线程调用，也可直接调用
+        now = time.time() if now is None else now
+        went_offline = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                _, ip = heapq.heappop(self._heap)
+                if ip not in self.online:
+                    self._scheduled.discard(ip)  # 已经离线，旧项作废
+                    continue
+                deadline = self.last_seen[ip] + self.timeout_for(ip)
+                if deadline > now:
+                    heapq.heappush(self._heap, (deadline, ip))  # 期间收到过消息，顺延
+                else:
+                    self.online.discard(ip)
+                    self._scheduled.discard(ip)
+                    went_offline.append(ip)
+        for ip in went_offline:
+            self._emit(ip, False, now)
+        return went_offline
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                delay = self._heap[0][0] - time.time() if self._heap else None
+                if delay is None or delay > 0:
+                    self._cond.wait(delay)
+                    continue
+            self.expire()
+
+    def _emit(self, ip, online, timestamp):
+        for callback in self.listeners:
+            try:
+                callback(ip, online, timestamp)
+            except Exception as e:
+                logger.error(f"在线状态回调出错: {e}")
@@ -0,0 +1,505 @@
+"""
+服务器 / 客户端历史日志的离线索引与统计
+
+扫描 server_*.log* 和 clientlog/<IP>/client_*.log* (包括轮转出的 .1 .2 ... 和 .jsonl)，
+用 mmap 读取、多进程解析其中的状态行 (收到数据: 状态信息 / 发送状态信息) 和 "异常退出" 行，
+按天写成列式索引 log_index/YYYY-MM-DD.<来源>.<代>.day：
+  - 列: 时间戳、IP、项目、CPU、内存 (0.1% 为单位)、运行时长 (秒)，按 (项目, IP, 时间) 排序后 zlib 压缩
+  - 每个展项每天一条汇总: 上报数、CPU/内存总和与最大值、CPU 直方图 (1% 一档)、
+    在线秒数 (相邻上报间隔不超过 gap 秒的部分)、重启次数 (运行时长变小)、首末时间
+  - 当天的异常退出事件 (时间, IP)
+查询只读取汇总部分，不解压列数据。日志文件按 (设备号, inode) 识别并记录已处理到的位置，
+轮转改名不会重复解析，再次运行时只解析新增的部分；日志删除后索引中的历史仍然保留。
+
+用法:
+    python log_index.py update
+    python log_index.py report --since 2026-09-01 --sort cpu_p95 --top 20
+    python log_index.py report --exhibit 展厅A- --json
+"""
+import argparse
+import array
+import collections
+import datetime
+import glob
+import hashlib
+import json
+import mmap
+import multiprocessing
+import operator
+import os
+import re
+import struct
+import time
+import zlib
+
+DAY_MAGIC = b'LGIX'
+DAY_VERSION = 1
+# 魔数, 版本, 行数, 汇总条数, 异常退出事件数, 字符串表长度, 压缩列数据长度
+DAY_HEADER = struct.Struct('!4sHIIIII')
+HIST_BINS = 101  # CPU 直方图: 0%, 1%, ... 100%
+# 项目, IP, 首行, 行数, 首末时间, 首末运行时长, CPU/内存总和, 在线秒数, 重启次数, CPU/内存最大值, 直方图
+GROUP = struct.Struct(f'!IIIIIIIIQQIIHH{HIST_BINS}I')
+EVENT = struct.Struct('!II')  # 时间, IP
+COLUMNS = (('ts', 'I'), ('ip', 'I'), ('project', 'I'), ('cpu', 'H'), ('mem', 'H'), ('uptime', 'I'))
+
+# 一行中的时间 (文本或 JSON 格式日志的行首) 加上状态信息或异常退出；状态信息的格式见 protocol.format_status，
+# 运行时长是 str(timedelta): "5:00:06" 或 "3 days, 5:00:06"
+LINE = re.compile(
+    r'^(?:\{"time": ")?(\d{4}-\d\d-\d\d \d\d):(\d\d):(\d\d)[^\n]*?(?:'
+    r'状态信息: IP: ([^,\n]+), 项目名称: ([^,\n]*), CPU: ([\d.]+)%, 内存: ([\d.]+)%, 启动时间: [^,\n]*, '
+    r'运行时长: (?:(\d+) days?, )?(\d+):(\d\d):(\d\d)'
+    r'|Client (\S+) 异常退出)'.encode('utf-8'), re.MULTILINE)
+
+FINGERPRINT_BYTES = 256  # 用文件开头多少字节的摘要识别同一个日志文件
+CHUNK_SIZE = 16 * 1024 * 1024  # 大文件按行边界切成多段并行解析
+LOG_PATTERNS = {'server': ('server_*.log*', 'server_*.jsonl*'),
+                'client': ('clientlog/*/client_*.log*', 'clientlog/*/client_*.jsonl*', 'client_*.log*')}
+
+
+class _Partial:
+    """
+    一段日志中属于同一天的解析结果；ip / project 列是 ips / projects 字符串表中的下标
+    """
+    def __init__(self):
+        self.columns = {name: array.array(code) for name, code in COLUMNS}
+        self.events = array.array('I')  # 时间, IP 交替存放
+
+
+def parse_chunk(path, start, end):
+    # 解析文件 [start, end) 范围内的完整行，返回 (ips, projects, {日期: _Partial})
+    ips, projects = {}, {}
+    days = {}
+    hours = {}  # b'YYYY-MM-DD HH' -> (该小时开始的时间戳 (本地时间), 当天的 _Partial)
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for match in LINE.finditer(data, start, end):
+            (hour, minute, second, ip, project, cpu, memory, up_days, up_hours, up_minutes, up_seconds,
+             lost) = match.groups()
+            cached = hours.get(hour)
+            if cached is None:
+                day = hour[:10].decode()
+                partial = days.get(day)
+                if partial is None:
+                    partial = days[day] = _Partial()
+                cached = hours[hour] = (int(time.mktime(time.strptime(hour.decode(), '%Y-%m-%d %H'))), partial)
+            base, partial = cached
+            ts = base + int(minute) * 60 + int(second)
+            if lost is not None:
+                partial.events.append(ts)
+                partial.events.append(ips.setdefault(lost, len(ips)))
+                continue
+            try:
+                cpu = round(float(cpu) * 10)
+                memory = round(float(memory) * 10)
+            except ValueError:
+                continue  # 例如 "1.2.3"
+            uptime = int(up_hours) * 3600 + int(up_minutes) * 60 + int(up_seconds)
+            if up_days is not None:
+                uptime += int(up_days) * 86400
+            columns = partial.columns
+            columns['ts'].append(ts)
+            columns['ip'].append(ips.setdefault(ip, len(ips)))
+            columns['project'].append(projects.setdefault(project, len(projects)))
+            columns['cpu'].append(min(cpu, 1000))
+            columns['mem'].append(min(memory, 1000))
+            columns['uptime'].append(uptime)
+    return ([ip.decode('utf-8', 'replace') for ip in ips],
+            [project.decode('utf-8', 'replace') for project in projects], days)
+
+
+def _parse_task(task):
+    source, path, start, end = task
+    return source, parse_chunk(path, start, end)
+
+
+class DayFile:
+    """
+    一天一个来源的索引文件。load_summary 只读取汇总和事件；load_rows 额外解压列数据
+    """
+    def __init__(self, path):
+        self.path = path
+        self.ips = []
+        self.projects = []
+        self.groups = []  # GROUP 解包后的元组
+        self.events = []  # [(时间, IP 下标)]
+        self.columns = None
+
+    def load_summary(self, with_rows=False):
+        with open(self.path, 'rb') as f:
+            magic, version, rows, groups, events, strings_len, columns_len = DAY_HEADER.unpack(
+                f.read(DAY_HEADER.size))
+            if magic != DAY_MAGIC or version != DAY_VERSION:
+                raise ValueError(f"{self.path} 不是索引文件或版本不兼容")
+            strings = json.loads(f.read(strings_len).decode('utf-8'))
+            self.ips, self.projects = strings['ips'], strings['projects']
+            data = f.read(groups * GROUP.size)
+            self.groups = [GROUP.unpack_from(data, i * GROUP.size) for i in range(groups)]
+            data = f.read(events * EVENT.size)
+            self.events = [EVENT.unpack_from(data, i * EVENT.size) for i in range(events)]
+            if with_rows:
+                payload = zlib.decompress(f.read(columns_len))
+                self.columns = {}
+                offset = 0
+                for name, code in COLUMNS:
+                    column = array.array(code)
+                    size = rows * column.itemsize
+                    column.frombytes(payload[offset:offset + size])
+                    self.columns[name] = column
+                    offset += size
+        return self
+
+    def load_rows(self):
+        return self.load_summary(with_rows=True)
+
+
+def _summarize(columns, start, stop, gap):
+    # 一个展项一天内 (已按时间排序) 的行 -> GROUP 中除项目、IP、首行、行数以外的字段
+    ts, cpu, mem, uptime = columns['ts'], columns['cpu'], columns['mem'], columns['uptime']
+    hist = [0] * HIST_BINS
+    online = reboots = 0
+    previous_ts, previous_uptime = ts[start], uptime[start]
+    for i in range(start, stop):
+        hist[cpu[i] // 10] += 1
+        t = ts[i]
+        if 0 < t - previous_ts <= gap:
+            online += t - previous_ts
+        if uptime[i] < previous_uptime:
+            reboots += 1
+        previous_ts, previous_uptime = t, uptime[i]
+    cpu_part, mem_part = cpu[start:stop], mem[start:stop]
+    return (ts[start], ts[stop - 1], uptime[start], uptime[stop - 1], sum(cpu_part), sum(mem_part),
+            online, reboots, max(cpu_part), max(mem_part), *hist)
+
+
+def build_day(task):
+    """
+    合并一天的新数据和已有索引 (增量更新)，排序、汇总后写成新一代文件，返回 (日期, 来源, 文件名, 行数)
+    """
+    directory, day, source, generation, old_name, partials, gap = task
+    ips, projects = {}, {}
+    columns = {name: array.array(code) for name, code in COLUMNS}
+    events = []
+    sources = []
+    if old_name:
+        old = DayFile(os.path.join(directory, old_name)).load_rows()
+        sources.append((old.ips, old.projects, old.columns, old.events))
+    for part_ips, part_projects, partial in partials:
+        flat = partial.events
+        sources.append((part_ips, part_projects, partial.columns,
+                        [(flat[i], flat[i + 1]) for i in range(0, len(flat), 2)]))
+    for part_ips, part_projects, part_columns, part_events in sources:
+        ip_map = [ips.setdefault(ip, len(ips)) for ip in part_ips]
+        project_map = [projects.setdefault(project, len(projects)) for project in part_projects]
+        columns['ip'].extend(ip_map[i] for i in part_columns['ip'])
+        columns['project'].extend(project_map[i] for i in part_columns['project'])
+        for name in ('ts', 'cpu', 'mem', 'uptime'):
+            columns[name].extend(part_columns[name])
+        events += [(t, ip_map[i]) for t, i in part_events]
+
+    # 按 (项目, IP, 时间) 排序: 每个展项的行连续存放
+    projects_list, ips_list = list(projects), list(ips)
+    counts = collections.Counter(zip(columns['project'], columns['ip']))
+    pairs = sorted(counts, key=lambda pair: (projects_list[pair[0]], ips_list[pair[1]]))
+    rank = {pair: n for n, pair in enumerate(pairs)}
+    # 组序号放在高 32 位，一次整数排序即可
+    keys = [rank[pair] << 32 | t for pair, t in zip(zip(columns['project'], columns['ip']), columns['ts'])]
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    if len(order) > 1:
+        pick = operator.itemgetter(*order)
+        columns = {name: array.array(code, pick(columns[name])) for name, code in COLUMNS}
+
+    summaries = []
+    row = 0
+    for project, ip in pairs:
+        stop = row + counts[project, ip]
+        summaries.append(GROUP.pack(project, ip, row, stop - row, *_summarize(columns, row, stop, gap)))
+        row = stop
+    total = row
+    events.sort()
+
+    strings = json.dumps({'ips': ips_list, 'projects': projects_list}, ensure_ascii=False).encode('utf-8')
+    # 列数据只在增量合并时才读取，用最快的压缩级别
+    payload = zlib.compress(b''.join(columns[name].tobytes() for name, _ in COLUMNS), 1)
+    name = f'{day}.{source}.{generation}.day'
+    tmp_path = os.path.join(directory, name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(DAY_HEADER.pack(DAY_MAGIC, DAY_VERSION, total, len(summaries), len(events),
+                                len(strings), len(payload)))
+        f.write(strings)
+        f.write(b''.join(summaries))
+        f.write(b''.join(EVENT.pack(t, i) for t, i in events))
+        f.write(payload)
+    os.replace(tmp_path, os.path.join(directory, name))
+    return day, source, name, total
+
+
+class LogIndex:
+    """
+    索引目录中的 manifest.json 记录每个日志文件已处理到的位置、各天当前的索引文件名和代号。
+    每次更新把受影响的天写成新一代文件，最后原子替换 manifest，之后才删除旧文件；
+    中途中断时旧 manifest 仍指向完整的旧文件，下次从原位置重新解析
+    """
+    def __init__(self, directory='log_index', gap=90):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        self.manifest = {'gap': gap, 'generation': 0, 'files': {}, 'days': {}}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            pass
+        self.gap = self.manifest['gap']  # 在线时长按建立索引时的 gap 计算
+
+    @staticmethod
+    def _fingerprint(path, length=FINGERPRINT_BYTES):
+        # 文件开头 length 字节的摘要，防止 inode 被新文件复用时误认为是同一个文件
+        with open(path, 'rb') as f:
+            return hashlib.blake2b(f.read(length), digest_size=8).hexdigest()
+
+    def scan(self, log_dir):
+        # 返回需要解析的任务 [(来源, 路径, 起点, 终点)] 和更新后的文件记录
+        known = self.manifest['files']
+        records = {}
+        tasks = []
+        for source, patterns in LOG_PATTERNS.items():
+            for pattern in patterns:
+                for path in sorted(glob.glob(os.path.join(log_dir, pattern))):
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    file_id = f'{stat.st_dev}:{stat.st_ino}'
+                    if file_id in records or stat.st_size == 0:
+                        continue
+                    record = known.get(file_id)
+                    offset = 0
+                    # 建索引时文件可能还不到 FINGERPRINT_BYTES，只比较当时摘要覆盖的那部分
+                    if (record and record['offset'] <= stat.st_size and record['fingerprint'] ==
+                            self._fingerprint(path, record.get('fingerprint_bytes', FINGERPRINT_BYTES))):
+                        offset = record['offset']
+                    end = self._last_line_end(path, offset, stat.st_size)
+                    length = min(stat.st_size, FINGERPRINT_BYTES)
+                    records[file_id] = {'path': path, 'fingerprint': self._fingerprint(path, length),
+                                        'fingerprint_bytes': length, 'offset': end}
+                    while offset < end:
+                        stop = self._last_line_end(path, offset, min(end, offset + CHUNK_SIZE))
+                        if stop <= offset:
+                            stop = end  # 超长的行
+                        tasks.append((source, path, offset, stop))
+                        offset = stop
+        # 已经删除的日志保留记录，轮转改名后仍能识别
+        for file_id, record in known.items():
+            records.setdefault(file_id, record)
+        return tasks, records
+
+    @staticmethod
+    def _last_line_end(path, start, end):
+        # [start, end) 中最后一个换行符之后的位置；没有完整的行时返回 start
+        if end <= start:
+            return start
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return data.rfind(b'\n', start, end) + 1 or start
+
+    def update(self, log_dir='.', workers=None):
+        # 解析新增的日志并合并进索引，返回统计信息
+        os.makedirs(self.directory, exist_ok=True)
+        started = time.perf_counter()
+        tasks, records = self.scan(log_dir)
+        stats = {'chunks': len(tasks), 'bytes': sum(end - start for _, _, start, end in tasks),
+                 'rows': 0, 'days': 0}
+        if not tasks:
+            stats['seconds'] = round(time.perf_counter() - started, 3)
+            return stats
+        workers = workers or os.cpu_count() or 1
+        pool = multiprocessing.get_context('spawn').Pool(workers) if workers > 1 and len(tasks) > 1 else None
+        try:
+            results = pool.map(_parse_task, tasks) if pool else [_parse_task(task) for task in tasks]
+            parsed = time.perf_counter()
+            by_day = {}
+            for source, (ips, projects, days) in results:
+                for day, partial in days.items():
+                    by_day.setdefault((day, source), []).append((ips, projects, partial))
+            generation = self.manifest['generation'] + 1
+            day_tasks = [(self.directory, day, source, generation,
+                          self.manifest['days'].get(f'{day}.{source}'), partials, self.gap)
+                         for (day, source), partials in sorted(by_day.items())]
+            built = pool.map(build_day, day_tasks) if pool and len(day_tasks) > 1 \
+                else [build_day(task) for task in day_tasks]
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        replaced = []
+        for day, source, name, rows in built:
+            key = f'{day}.{source}'
+            if key in self.manifest['days']:
+                replaced.append(self.manifest['days'][key])
+            self.manifest['days'][key] = name
+            stats['rows'] += rows
+        self.manifest['generation'] = generation
+        self.manifest['files'] = records
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+        for name in replaced:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+        stats['days'] = len(built)
+        stats['parse_seconds'] = round(parsed - started, 3)
+        stats['seconds'] = round(time.perf_counter() - started, 3)
+        return stats
+
+    def day_files(self, since=None, until=None, source='server'):
+        # 日期在 [since, until] 内 (字符串 YYYY-MM-DD) 的索引文件，按日期排序
+        result = []
+        for key, name in sorted(self.manifest['days'].items()):
+            day, day_source = key.split('.', 1)
+            if day_source != source or (since and day < since) or (until and day > until):
+                continue
+            result.append((day, os.path.join(self.directory, name)))
+        return result
+
+    def sources(self):
+        return {key.split('.', 1)[1] for key in self.manifest['days']}
+
+    def report(self, since=None, until=None, source='server', exhibit=None):
+        """
+        按展项 (项目名称@IP) 汇总，返回 {展项: 统计}。exhibit 为项目名称前缀或 IP，只统计匹配的展项
+        """
+        totals = {}
+        disconnects = {}
+        for day, path in self.day_files(since, until, source):
+            day_file = DayFile(path).load_summary()
+            ips, projects = day_file.ips, day_file.projects
+            for _, ip in day_file.events:
+                disconnects[ips[ip]] = disconnects.get(ips[ip], 0) + 1
+            for group in day_file.groups:
+                (project, ip, _, rows, first_ts, last_ts, first_uptime, last_uptime, cpu_sum, mem_sum,
+                 online, reboots, cpu_max, mem_max) = group[:14]
+                ip, project = ips[ip], projects[project]
+                if exhibit and not (project.startswith(exhibit) or ip == exhibit):
+                    continue
+                key = f'{project}@{ip}'
+                total = totals.get(key)
+                if total is None:
+                    total = totals[key] = {'project': project, 'ip': ip, 'reports': 0, 'cpu_sum': 0, 'mem_sum': 0,
+                                           'cpu_max': 0, 'mem_max': 0, 'online': 0, 'reboots': 0,
+                                           'first_ts': first_ts, 'last_ts': last_ts, 'last_uptime': last_uptime,
+                                           'hist': list(group[14:])}
+                else:
+                    # 与前一天的最后一条上报相接
+                    if 0 < first_ts - total['last_ts'] <= self.gap:
+                        total['online'] += first_ts - total['last_ts']
+                    if first_uptime < total['last_uptime']:
+                        total['reboots'] += 1
+                    total['hist'] = list(map(operator.add, total['hist'], group[14:]))
+                total['reports'] += rows
+                total['cpu_sum'] += cpu_sum
+                total['mem_sum'] += mem_sum
+                total['cpu_max'] = max(total['cpu_max'], cpu_max)
+                total['mem_max'] = max(total['mem_max'], mem_max)
+                total['online'] += online
+                total['reboots'] += reboots
+                total['last_ts'] = last_ts
+                total['last_uptime'] = last_uptime
+        span_start = min((t['first_ts'] for t in totals.values()), default=0)
+        span_end = max((t['last_ts'] for t in totals.values()), default=0)
+        span = max(span_end - span_start, 1)
+        result = {}
+        for key, total in totals.items():
+            hist = total['hist']
+            reports = total['reports']
+            cpu_max = total['cpu_max'] / 10
+            result[key] = {
+                'project': total['project'], 'ip': total['ip'], 'reports': reports,
+                'online_hours': round(total['online'] / 3600, 2),
+                'online_pct': round(total['online'] * 100 / span, 1),
+                'reboots': total['reboots'], 'disconnects': disconnects.get(total['ip'], 0),
+                'cpu_avg': round(total['cpu_sum'] / reports / 10, 1),
+                'cpu_p50': percentile(hist, 50, cpu_max), 'cpu_p95': percentile(hist, 95, cpu_max),
+                'cpu_p99': percentile(hist, 99, cpu_max), 'cpu_max': cpu_max,
+                'mem_avg': round(total['mem_sum'] / reports / 10, 1), 'mem_max': total['mem_max'] / 10,
+                'last_uptime_hours': round(total['last_uptime'] / 3600, 1),
+                'last_seen': datetime.datetime.fromtimestamp(total['last_ts']).strftime('%Y-%m-%d %H:%M:%S'),
+            }
+        return result
+
+
+def percentile(hist, p, limit=100.0):
+    # 由 1% 一档的直方图估算百分位数 (档内线性插值)，不超过实际最大值 limit
+    count = sum(hist)
+    if count == 0:
+        return None
+    rank = p / 100 * (count - 1)
+    seen = 0
+    for value, n in enumerate(hist):
+        if n and seen + n > rank:
+            return round(min(value + (rank - seen + 0.5) / n, limit), 1)
+        seen += n
+    return limit
+
+
+REPORT_FIELDS = (('reports', '上报数'), ('online_hours', '在线(时)'), ('online_pct', '在线%'),
+                 ('reboots', '重启'), ('disconnects', '异常断开'), ('cpu_avg', 'CPU均值'),
+                 ('cpu_p50', 'P50'), ('cpu_p95', 'P95'), ('cpu_p99', 'P99'), ('cpu_max', 'CPU最大'),
+                 ('mem_avg', '内存均值'), ('mem_max', '内存最大'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="历史日志的离线索引与统计")
+    parser.add_argument('--logs', default='.', help="日志所在目录 (server_*.log 和 clientlog/)")
+    parser.add_argument('--index', default='log_index', help="索引目录")
+    sub = parser.add_subparsers(dest='action', required=True)
+
+    p = sub.add_parser('update', help="解析新增的日志并更新索引")
+    p.add_argument('--workers', type=int, default=None, help="解析进程数，默认为 CPU 核数")
+    p.add_argument('--gap', type=int, default=90, help="相邻上报间隔不超过该秒数时计为在线 (只在新建索引时生效)")
+
+    p = sub.add_parser('report', help="按展项输出在线时长、CPU 百分位数和异常断开次数")
+    p.add_argument('--since', help="起始日期 YYYY-MM-DD")
+    p.add_argument('--until', help="结束日期 YYYY-MM-DD (含)")
+    p.add_argument('--source', choices=['server', 'client'], default=None,
+                   help="统计服务器日志还是客户端日志，默认有服务器日志时用服务器日志")
+    p.add_argument('--exhibit', help="项目名称前缀或 IP")
+    p.add_argument('--sort', default='project', help="排序字段，如 cpu_p95、online_pct、disconnects")
+    p.add_argument('--top', type=int, default=None)
+    p.add_argument('--json', action='store_true', help="输出 JSON")
+    p.add_argument('--no-update', action='store_true', help="不先更新索引")
+    p.add_argument('--workers', type=int, default=None)
+
+    args = parser.parse_args()
+    if args.action == 'update':
+        index = LogIndex(args.index, args.gap)
+        stats = index.update(args.logs, args.workers)
+        print(f"已解析 {stats['chunks']} 段 {stats['bytes'] / 1048576:.1f} MB 新日志，"
+              f"更新 {stats['days']} 天 (共 {stats['rows']} 行)，耗时 {stats['seconds']:.2f} 秒")
+        return
+
+    index = LogIndex(args.index)
+    if not args.no_update:
+        stats = index.update(args.logs, args.workers)
+        if stats['chunks']:
+            print(f"索引已更新: {stats['bytes'] / 1048576:.1f} MB 新日志，耗时 {stats['seconds']:.2f} 秒")
+    source = args.source or ('server' if 'server' in index.sources() or not index.sources() else 'client')
+    start = time.perf_counter()
+    result = index.report(args.since, args.until, source, args.exhibit)
+    elapsed = time.perf_counter() - start
+    rows = sorted(result.items(), key=lambda item: item[0])
+    if args.sort != 'project':
+        rows.sort(key=lambda item: item[1].get(args.sort) or 0, reverse=True)
+    if args.top:
+        rows = rows[:args.top]
+    if args.json:
+        print(json.dumps(dict(rows), ensure_ascii=False, indent=2))
+        return
+    print(f"{'展项':<28}" + ''.join(f"{title:>10}" for _, title in REPORT_FIELDS))
+    for key, stats in rows:
+        print(f"{key:<28}" + ''.join(f"{stats[field] if stats[field] is not None else '-':>10}"
+                                     for field, _ in REPORT_FIELDS))
+    print(f"\n共 {len(result)} 个展项 (来源: {source})，查询耗时 {elapsed * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
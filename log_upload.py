@@ -0,0 +1,193 @@
+import collections
+import os
+import threading
+import time
+import zlib
+import logging
+
+from protocol import encode_log_request, encode_log_credit, decode_log_chunk, decode_log_end
+
+logger = logging.getLogger('server')
+
+UNLIMITED_CREDIT = 1 << 62
+
+
+class LogTransfer:
+    def __init__(self, ip, client_socket, directory):
+        self.ip = ip
+        self.socket = client_socket
+        self.directory = directory
+        self.files = {}  # 文件名 -> [文件对象, 下一次写入位置]
+        self.granted = 0  # 已授予的额度 (压缩后字节)
+        self.received = 0  # 已收到的压缩字节
+        self.written = 0  # 已写入磁盘的原始字节
+        self.started = time.time()
+
+
+class LogUploadManager:
+    """
+    客户端日志上传调度。同时最多 max_concurrent 台设备在上传，其余排队；
+    后台线程每 tick 秒把 bandwidth*tick 字节的额度分给正在上传的设备，
+    所有设备的上传总速率不超过 bandwidth (字节/秒，0 表示不限速)。
+    日志保存在 directory/<IP>/ 下，已有文件的大小就是续传位置：
+    断线后设备重新连接时自动从断点继续，再次拉取时也只上传新增部分。
+    """
+    def __init__(self, server, directory='clientlog', bandwidth=2 * 1024 * 1024, max_concurrent=8,
+                 chunk_credit=64 * 1024, tick=0.1, write_buffer=256 * 1024):
+        self.server = server
+        self.directory = directory
+        self.bandwidth = bandwidth
+        self.max_concurrent = max_concurrent
+        self.chunk_credit = chunk_credit  # 单台设备未用完的额度低于该值时才继续发放
+        self.tick = tick
+        self.write_buffer = write_buffer
+        self.wanted = set()  # 需要上传但尚未完成的 IP (包括离线设备)
+        self.queue = collections.deque()  # 等待开始上传的 IP
+        self.active = {}  # socket -> LogTransfer
+        self.lock = threading.Lock()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        if self.bandwidth:
+            self._thread = threading.Thread(target=self._run, name='log-upload', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=5)
+        with self.lock:
+            transfers = list(self.active.values())
+            self.active.clear()
+        for transfer in transfers:
+            self._close_files(transfer)
+
+    def request(self, ip):
+        # 请求设备上传日志；设备离线时等它重新连接后再开始
+        with self.lock:
+            self.wanted.add(ip)
+            if ip not in self.queue and not self._is_active(ip):
+                self.queue.append(ip)
+        self._pump()
+
+    def on_client_ready(self, ip):
+        # 支持日志上传的客户端完成协议协商时调用
+        with self.lock:
+            if ip in self.wanted and ip not in self.queue and not self._is_active(ip):
+                self.queue.append(ip)
+        self._pump()
+
+    def _is_active(self, ip):
+        return any(transfer.ip == ip for transfer in self.active.values())
+
+    def _pump(self):
+        # 在并发上限内启动排队中的上传
+        with self.lock:
+            started = []
+            skipped = []
+            while self.queue and len(self.active) < self.max_concurrent:
+                ip = self.queue.popleft()
+                client_socket = self.server.client_sockets.get(ip)
+                if client_socket is None or self.server.client_levels.get(client_socket, 0) < 3:
+                    skipped.append(ip)  # 离线或旧版客户端，留在 wanted 中等待重新连接
+                    continue
+                directory = os.path.join(self.directory, ip)
+                transfer = LogTransfer(ip, client_socket, directory)
+                self.active[client_socket] = transfer
+                started.append(transfer)
+        for ip in skipped:
+            logger.info(f"设备 {ip} 不在线或不支持日志上传，将在重新连接后上传")
+            print(f"设备 {ip} 不在线或不支持日志上传，将在重新连接后上传")
+        for transfer in started:
+            os.makedirs(transfer.directory, exist_ok=True)
+            offsets = {name: os.path.getsize(os.path.join(transfer.directory, name))
+                       for name in os.listdir(transfer.directory)}
+            logger.info(f"请求设备 {transfer.ip} 上传日志，已有 {len(offsets)} 个文件")
+            print(f"请求设备 {transfer.ip} 上传日志，已有 {len(offsets)} 个文件")
+            self.server.send_bytes(transfer.socket, encode_log_request(offsets))
+            if not self.bandwidth:
+                transfer.granted = UNLIMITED_CREDIT
+                self.server.send_bytes(transfer.socket, encode_log_credit(UNLIMITED_CREDIT))
+
+    def _run(self):
+        while self._running:
+            time.sleep(self.tick)
+            with self.lock:
+                needy = [t for t in self.active.values()
+                         if t.granted - t.received < self.chunk_credit]
+                if not needy:
+                    continue
+                share = int(self.bandwidth * self.tick / len(needy)) or 1
+                for transfer in needy:
+                    transfer.granted += share
+            for transfer in needy:
+                self.server.send_bytes(transfer.socket, encode_log_credit(share))
+
+    def on_chunk(self, client_socket, ip, payload):
+        transfer = self.active.get(client_socket)
+        if transfer is None:
+            logger.warning(f"设备 {ip} 发送了未请求的日志块，已忽略")
+            return
+        name, offset, compressed = decode_log_chunk(payload)
+        data = zlib.decompress(compressed)
+        transfer.received += len(compressed)
+        entry = transfer.files.get(name)
+        if entry is None:
+            # 只取文件名部分，防止写到目录之外
+            path = os.path.join(transfer.directory, os.path.basename(name))
+            log_file = open(path, 'r+b' if offset and os.path.exists(path) else 'wb',
+                            buffering=self.write_buffer)
+            entry = transfer.files[name] = [log_file, 0]
+        log_file = entry[0]
+        if entry[1] != offset:
+            log_file.seek(offset)
+            log_file.truncate()
+        log_file.write(data)
+        entry[1] = offset + len(data)
+        transfer.written += len(data)
+
+    def on_end(self, client_socket, ip, payload):
+        transfer = self.active.get(client_socket)
+        if transfer is None:
+            return
+        name, size = decode_log_end(payload)
+        if name:
+            entry = transfer.files.pop(name, None)
+            if entry:
+                entry[0].close()
+                logger.info(f"已保存设备 {ip} 的日志文件: {name} ({size} 字节)")
+            return
+        with self.lock:
+            self.active.pop(client_socket, None)
+            self.wanted.discard(ip)
+        self._close_files(transfer)
+        elapsed = time.time() - transfer.started
+        logger.info(f"设备 {ip} 日志上传完成: 原始 {transfer.written} 字节, 传输 {transfer.received} 字节, "
+                    f"耗时 {elapsed:.1f} 秒")
+        print(f"设备 {ip} 日志上传完成: 原始 {transfer.written} 字节, 传输 {transfer.received} 字节, "
+              f"耗时 {elapsed:.1f} 秒")
+        self._pump()
+
+    def forget(self, client_socket):
+        # 连接断开：保留已写入的部分，设备重新连接后从断点续传
+        with self.lock:
+            transfer = self.active.pop(client_socket, None)
+        if transfer is None:
+            return
+        self._close_files(transfer)
+        logger.warning(f"设备 {transfer.ip} 日志上传中断，已保存 {transfer.written} 字节，重新连接后继续")
+        self._pump()
+
+    def _close_files(self, transfer):
+        for log_file, _ in transfer.files.values():
+            log_file.close()
+        transfer.files.clear()
+
+    def status(self):
+        with self.lock:
+            active = [(t.ip, t.written, t.received, time.time() - t.started) for t in self.active.values()]
+            queued = list(self.queue)
+            waiting = sorted(self.wanted - set(queued) - {ip for ip, *_ in active})
+        return active, queued, waiting
@@ -1,18 +1,190 @@
+import json
 import logging
+import queue
+import threading
 from logging.handlers import RotatingFileHandler
 import datetime
 
-def setup_logger(name, log_file, level=logging.INFO):
+
+class JsonLinesFormatter(logging.Formatter):
+    # 每条日志一行 JSON，便于用脚本检索和统计
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'sampled', None):
+            entry['sampled'] = record.sampled
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    对高频重复日志抽样：rules 为 {消息前缀: N}，以该前缀开头的日志每 N 条只保留 1 条，
+    保留的那条会注明省略了多少条同类日志
+    """
+    def __init__(self, rules):
+        super().__init__()
+        self.rules = [(prefix, n) for prefix, n in rules.items() if n > 1]
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if not self.rules:
+            return True
+        message = record.getMessage()
+        for prefix, n in self.rules:
+            if message.startswith(prefix):
+                with self.lock:
+                    count = self.counts.get(prefix, 0)
+                    self.counts[prefix] = count + 1
+                if count % n:
+                    return False
+                if count:
+                    record.msg = f"{message} (已省略 {n - 1} 条同类日志)"
+                    record.args = None
+                    record.sampled = n
+                return True
+        return True
+
+
+class BatchRotatingFileHandler(RotatingFileHandler):
+    # 一次写入一批日志并只 flush 一次
+    def emit_batch(self, records):
+        try:
+            data = ''.join(self.format(record) + self.terminator for record in records)
+        except Exception:
+            for record in records:
+                self.handleError(record)
+            return
+        self.acquire()
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            if self.maxBytes > 0 and self.stream.tell() + len(data) >= self.maxBytes:
+                self.doRollover()
+            self.stream.write(data)
+            self.flush()
+        except Exception:
+            self.handleError(records[-1])
+        finally:
+            self.release()
+
+
+class AsyncLogHandler(logging.Handler):
+    """
+    异步日志 (配置 "async": true 时启用)：调用方只把日志记录放入有界队列，后台线程批量格式化并写入 target，
+    磁盘延迟不再影响接收线程/事件循环。队列满时丢弃 INFO 及以下的日志并计数，之后写入一条警告；
+    WARNING 及以上的日志不丢弃，直接在当前线程写入 target。
+    """
+    def __init__(self, target, queue_size=100000, batch_size=512):
+        super().__init__()
+        self.target = target
+        self.batch_size = batch_size
+        self.queue = queue.Queue(queue_size)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+        if record.exc_info and not record.exc_text:
+            # 异常信息必须在当前线程格式化，之后 traceback 可能已失效
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.WARNING:
+                self.target.handle(record)  # 文件处理器自带锁，可与写入线程并发
+                return
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            batch = []
+            stop = record is None
+            if not stop:
+                batch.append(record)
+            while len(batch) < self.batch_size and not stop:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                else:
+                    batch.append(record)
+            with self._dropped_lock:
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                batch.append(logging.makeLogRecord({
+                    'name': batch[0].name if batch else 'log', 'levelno': logging.WARNING,
+                    'levelname': 'WARNING', 'msg': f"日志队列已满，丢弃了 {dropped} 条日志"}))
+            if batch:
+                if hasattr(self.target, 'emit_batch'):
+                    self.target.emit_batch(batch)
+                else:
+                    for record in batch:
+                        self.target.handle(record)
+            if stop:
+                return
+
+    def flush(self):
+        # 等待队列中已有的日志写完
+        while not self.queue.empty() and self._thread.is_alive():
+            threading.Event().wait(0.01)
+        self.target.flush()
+
+    def close(self):
+        # logging.shutdown() 在进程退出时调用，写完剩余日志再关闭文件
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(timeout=5)
+        self.target.close()
+        super().close()
+
+
+def load_logging_config(config_file):
+    # 读取配置文件中的 "logging" 部分；文件不存在或格式错误时使用默认设置
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            return json.load(f).get('logging', {})
+    except (FileNotFoundError, json.JSONDecodeError, AttributeError):
+        return {}
+
+
+def setup_logger(name, log_file, level=logging.INFO, options=None):
+    # options: async (默认 False), format ('text' 或 'json'), sample ({消息前缀: N}),
+    # queue_size, batch_size；见 load_logging_config
+    options = options or {}
     formatter = logging.Formatter('%(asctime)s %(levelname)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
-    
+    extension = 'log'
+    if options.get('format') == 'json':
+        formatter = JsonLinesFormatter(datefmt='%Y-%m-%d %H:%M:%S')
+        extension = 'jsonl'
+
     today = datetime.datetime.now().strftime("%Y-%m-%d")
-    log_file_with_date = f"{log_file}_{today}.log"
-    
-    file_handler = RotatingFileHandler(log_file_with_date, maxBytes=10*1024*1024, backupCount=5, encoding='utf-8')
+    log_file_with_date = f"{log_file}_{today}.{extension}"
+
+    file_handler = BatchRotatingFileHandler(log_file_with_date, maxBytes=10*1024*1024, backupCount=5, encoding='utf-8')
     file_handler.setFormatter(formatter)
 
+    handler = file_handler
+    if options.get('async', False):
+        handler = AsyncLogHandler(file_handler, options.get('queue_size', 100000), options.get('batch_size', 512))
+    if options.get('sample'):
+        handler.addFilter(SamplingFilter(options['sample']))
+
     logger = logging.getLogger(name)
     logger.setLevel(level)
-    logger.addHandler(file_handler)
+    logger.addHandler(handler)
 
     return logger
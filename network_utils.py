@@ -1,5 +1,12 @@
 import subprocess
 import platform
+import random
+import collections
+import errno
+import selectors
+import socket
+import threading
+import time
 
 def ping_test(ip):
     param = '-n' if platform.system().lower() == 'windows' else '-c'
@@ -18,3 +25,128 @@ def ping_test(ip):
         return False
     except subprocess.CalledProcessError:
         return False
+    except OSError:
+        # 系统中没有 ping 命令
+        return False
+
+
+# 探测端口：Windows 展品电脑常见的 SMB / RPC / 远程桌面端口。
+# 端口开放 (连接成功) 或关闭 (收到 RST) 都说明主机在线，只有超时才算不可达。
+DEFAULT_PROBE_PORTS = (445, 135, 3389)
+_ALIVE_ERRNOS = {0, errno.ECONNREFUSED, 10061}  # 10061: Windows 上的 WSAECONNREFUSED
+_IN_PROGRESS_ERRNOS = {errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN, 10035}
+
+
+def sweep(ips, ports=DEFAULT_PROBE_PORTS, timeout=1.0, concurrency=128):
+    """
+    在当前进程内用非阻塞 TCP 连接并发探测多台主机，不为每台主机启动 ping 进程。
+    同时最多探测 concurrency 台主机，返回 {ip: (是否可达, 往返耗时秒数或 None)}。
+    """
+    results = {}
+    waiting = collections.deque(dict.fromkeys(ips))  # 去重并保持顺序
+    probing = {}  # ip -> [开始时间, 未完成的 socket 列表]
+    deadlines = collections.deque()  # (截止时间, ip)，超时相同所以按开始顺序排列即可
+    selector = selectors.DefaultSelector()
+
+    def finish(ip, reachable, rtt=None):
+        start, sockets = probing.pop(ip)
+        for sock in sockets:
+            selector.unregister(sock)
+            sock.close()
+        results[ip] = (reachable, rtt)
+
+    try:
+        while waiting or probing:
+            while waiting and len(probing) < concurrency:
+                ip = waiting.popleft()
+                start = time.perf_counter()
+                probing[ip] = [start, []]
+                deadlines.append((start + timeout, ip))
+                for port in ports:
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    sock.setblocking(False)
+                    try:
+                        err = sock.connect_ex((ip, port))
+                    except OSError:
+                        err = errno.EHOSTUNREACH  # 地址无效等
+                    if err in _IN_PROGRESS_ERRNOS:
+                        selector.register(sock, selectors.EVENT_WRITE, ip)
+                        probing[ip][1].append(sock)
+                    else:
+                        sock.close()
+                        if err in _ALIVE_ERRNOS:
+                            finish(ip, True, time.perf_counter() - start)
+                            break
+                if ip in probing and not probing[ip][1]:
+                    finish(ip, False)
+
+            now = time.perf_counter()
+            while deadlines and (deadlines[0][1] not in probing or deadlines[0][0] <= now):
+                deadline, ip = deadlines.popleft()
+                if ip in probing:
+                    finish(ip, False)
+            if not probing:
+                continue
+
+            for key, _ in selector.select(timeout=max(0.0, deadlines[0][0] - now)):
+                ip = key.data
+                if ip not in probing:
+                    continue  # 同一主机的另一个端口已经给出结果
+                sock = key.fileobj
+                err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if err in _ALIVE_ERRNOS:
+                    finish(ip, True, time.perf_counter() - probing[ip][0])
+                else:
+                    selector.unregister(sock)
+                    sock.close()
+                    probing[ip][1].remove(sock)
+                    if not probing[ip][1]:
+                        finish(ip, False)
+    finally:
+        for ip in list(probing):
+            finish(ip, False)
+        selector.close()
+    return results
+
+
+class ReachabilityCache:
+    """
+    可达性探测结果缓存，超过 ttl 秒的结果视为过期
+    """
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.entries = {}  # ip -> (是否可达, 往返耗时, 探测时间)
+        self.lock = threading.Lock()
+
+    def update(self, results):
+        now = time.time()
+        with self.lock:
+            for ip, (reachable, rtt) in results.items():
+                self.entries[ip] = (reachable, rtt, now)
+
+    def get(self, ip):
+        # 返回 (是否可达, 往返耗时, 探测时间)，没有记录或已过期时返回 None
+        entry = self.entries.get(ip)
+        if entry is None or time.time() - entry[2] > self.ttl:
+            return None
+        return entry
+
+
+class ReconnectBackoff:
+    """
+    客户端重连间隔：指数退避 + 全抖动。第 n 次失败后等待 [0, min(maximum, base * 2^n)] 内的随机时间，
+    服务器重启时大量客户端不会同时重连
+    """
+    def __init__(self, base=1.0, maximum=60.0, rng=None):
+        self.base = base
+        self.maximum = maximum
+        self.attempts = 0
+        self.random = rng or random.Random()
+
+    def next_delay(self):
+        ceiling = min(self.maximum, self.base * (2 ** self.attempts))
+        self.attempts = min(self.attempts + 1, 32)
+        return self.random.uniform(0, ceiling)
+
+    def reset(self):
+        self.attempts = 0
@@ -0,0 +1,323 @@
+import heapq
+import ipaddress
+import itertools
+import socket
+import threading
+import time
+import logging
+
+from commands import TIMED_OUT
+
+logger = logging.getLogger('server')
+
+
+def parse_mac(mac):
+    # 接受 aa:bb:cc:dd:ee:ff / aa-bb-cc-dd-ee-ff / aabbccddeeff，返回 6 字节
+    digits = mac.replace(':', '').replace('-', '').replace('.', '')
+    if len(digits) != 12:
+        raise ValueError(f"MAC 地址格式错误: {mac}")
+    return bytes.fromhex(digits)
+
+
+def magic_packet(mac):
+    # Wake-on-LAN 魔术包: 6 个 0xFF 后接重复 16 次的 MAC
+    return b'\xff' * 6 + parse_mac(mac) * 16
+
+
+class WakeSender:
+    """
+    批量发送 Wake-on-LAN 魔术包。UDP 可能丢包，每个包连续发送 repeat 次
+    """
+    def __init__(self, address='255.255.255.255', port=9, repeat=2):
+        self.address = address
+        self.port = port
+        self.repeat = repeat
+        self.sock = None
+
+    def send(self, macs):
+        if self.sock is None:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sent = 0
+        packets = [magic_packet(mac) for mac in macs]
+        for _ in range(self.repeat):
+            for packet in packets:
+                try:
+                    self.sock.sendto(packet, (self.address, self.port))
+                    sent += 1
+                except OSError as e:
+                    logger.error(f"发送唤醒包失败: {e}")
+        return sent
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+class TimerQueue:
+    """
+    定时任务堆：后台线程睡到最早的到期时间再执行，新任务更早时被唤醒重新计时，不轮询
+    """
+    def __init__(self):
+        self._heap = []  # [到期时间, 序号, 回调, 参数]，回调为 None 表示已取消
+        self._cond = threading.Condition()
+        self._sequence = itertools.count()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='power-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def call_at(self, when, callback, *args):
+        entry = [when, next(self._sequence), callback, args]
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                self._cond.notify()
+        return entry
+
+    def cancel(self, entry):
+        with self._cond:
+            entry[2] = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and (not self._heap or self._heap[0][0] > time.time()):
+                    self._cond.wait(self._heap[0][0] - time.time() if self._heap else None)
+                if not self._running:
+                    return
+                _, _, callback, args = heapq.heappop(self._heap)
+            if callback is None:
+                continue
+            try:
+                callback(*args)
+            except Exception as e:
+                logger.error(f"定时任务出错: {e}")
+
+
+class PowerOperation:
+    """
+    一次分组分批的电源操作。各组同时开始，每隔 interval 秒每组发出下一批 (最多 wave_size 台)；
+    关机/重启在指令期限到达后把超时未回复的设备放回队列重试，唤醒则在 wake_timeout 秒后
+    对仍未上线的设备重发唤醒包，最多重试 retries 次
+    """
+    def __init__(self, action, groups, wave_size, interval, retries):
+        self.action = action
+        self.groups = groups  # 组名 -> 待处理的 ip 列表
+        self.wave_size = wave_size
+        self.interval = interval
+        self.retries = retries
+        self.total = sum(len(ips) for ips in groups.values())
+        self.attempts = {}  # ip -> 已发送次数
+        self.done = {}  # ip -> 结果
+        self.started = time.time()
+        self.finished = None
+        self.waves = 0
+        self.outstanding = 0  # 已发出、尚未得到结果的批次
+        self.last_wave = 0  # 上一批的发送时间
+        self.wave_timer = None  # 已排定的下一批
+        self.timers = []
+        self.commands = []  # 已发出、尚未关闭的关机/重启指令 (PendingCommand)
+        self.lock = threading.Lock()
+
+    def next_wave(self):
+        # 从每组取出下一批
+        batch = []
+        with self.lock:
+            for ips in self.groups.values():
+                batch += ips[:self.wave_size]
+                del ips[:self.wave_size]
+            for ip in batch:
+                self.attempts[ip] = self.attempts.get(ip, 0) + 1
+            if batch:
+                self.waves += 1
+                self.outstanding += 1
+        return batch
+
+    def requeue(self, group, ip):
+        # 还可以重试时放回所在组的队尾并返回 True
+        with self.lock:
+            if self.attempts.get(ip, 0) > self.retries:
+                return False
+            self.groups.setdefault(group, []).append(ip)
+            return True
+
+    def pending(self):
+        return sum(len(ips) for ips in self.groups.values())
+
+    def summary(self):
+        counts = {}
+        for state in self.done.values():
+            counts[state] = counts.get(state, 0) + 1
+        elapsed = (self.finished or time.time()) - self.started
+        state = "已完成" if self.finished else "进行中"
+        return (f"{self.action} {state}: 共 {self.total} 台, 第 {self.waves} 批, 待发送 {self.pending()}, "
+                + ", ".join(f"{name} {n}" for name, n in sorted(counts.items()))
+                + f", 已用 {elapsed:.0f} 秒")
+
+
+class PowerScheduler:
+    """
+    服务器端的电源操作调度：关机、重启分组分批发送并重试未确认的设备，
+    开机用登记表中记录的 MAC 分批发送 Wake-on-LAN 唤醒包。分组为 /24 网段
+    (group_by='subnet') 或项目名称中 '-' 之前的部分 (group_by='name')
+    """
+    def __init__(self, server, wave_size=20, interval=10, retries=2, wake_timeout=180, group_by='subnet',
+                 wol_address='255.255.255.255', wol_port=9, wol_repeat=2):
+        self.server = server
+        self.wave_size = wave_size
+        self.interval = interval
+        self.retries = retries
+        self.wake_timeout = wake_timeout
+        self.group_by = group_by
+        self.wake_sender = WakeSender(wol_address, wol_port, wol_repeat)
+        self.timers = TimerQueue()
+        self.operation = None
+        self.history = []  # 已结束的操作
+
+    def start(self):
+        self.timers.start()
+
+    def stop(self):
+        self.cancel()
+        self.timers.stop()
+        self.wake_sender.close()
+
+    def group_of(self, ip):
+        if self.group_by == 'name':
+            keys = sorted(self.server.ip_index.get(ip, ()))
+            if keys:
+                return self.server.client_info[keys[0]]['project_name'].split('-', 1)[0]
+            return '未登记'
+        try:
+            return str(ipaddress.ip_network(f'{ip}/24', strict=False))
+        except ValueError:
+            return ip
+
+    def begin(self, action, ips):
+        # action: 'shutdown' / 'reboot' / 'wake'；同一时间只进行一个操作
+        if self.operation is not None and not self.operation.finished:
+            print(f"已有电源操作在进行: {self.operation.summary()}")
+            return None
+        groups = {}
+        for ip in sorted(ips):
+            groups.setdefault(self.group_of(ip), []).append(ip)
+        operation = PowerOperation(action, groups, self.wave_size, self.interval, self.retries)
+        self.operation = operation
+        batches = -(-max((len(g) for g in groups.values()), default=0) // self.wave_size)
+        message = (f"开始 {action}: {operation.total} 台设备, {len(groups)} 组, 每组每批 {self.wave_size} 台, "
+                   f"批间隔 {self.interval} 秒, 预计 {max(batches - 1, 0) * self.interval} 秒内发送完毕")
+        logger.info(message)
+        print(message)
+        self._schedule(operation, time.time())
+        return operation
+
+    def _schedule(self, operation, when):
+        operation.wave_timer = self.timers.call_at(when, self._run_wave, operation)
+        operation.timers.append(operation.wave_timer)
+
+    def _run_wave(self, operation):
+        # 所有定时回调都在调度线程中执行，彼此不会并发
+        operation.wave_timer = None
+        operation.last_wave = time.time()
+        batch = operation.next_wave()
+        if batch:
+            if operation.action == 'wake':
+                self._wake_wave(operation, batch)
+            else:
+                self._command_wave(operation, batch)
+        if operation.pending():
+            self._schedule(operation, time.time() + operation.interval)
+        else:
+            self._check_finished(operation)
+
+    def _command_wave(self, operation, batch):
+        pending = self.server.send_command(operation.action, batch)
+        with operation.lock:
+            operation.commands.append(pending)
+        logger.info(f"{operation.action} 第 {operation.waves} 批: {len(batch)} 台")
+        operation.timers.append(self.timers.call_at(pending.deadline, self._command_results, operation, pending))
+
+    def _command_results(self, operation, pending):
+        results = pending.wait()
+        self.server.commands.close(pending)
+        with operation.lock:
+            if pending in operation.commands:
+                operation.commands.remove(pending)
+            if operation.finished:
+                return  # 已取消
+        for ip, (state, _, _) in results.items():
+            if state != TIMED_OUT or not operation.requeue(self.group_of(ip), ip):
+                # 只重发超时未回复的；已响应、已离线，以及旧版客户端 (从不回复，结果为已发送) 不再重发，
+                # 避免重复关机。超过重试次数的保留最后一次结果
+                operation.done[ip] = state
+        self._batch_finished(operation)
+
+    def _wake_wave(self, operation, batch):
+        macs = {}
+        for ip in batch:
+            mac = self.server.mac_of(ip)
+            if mac:
+                macs[ip] = mac
+            else:
+                operation.done[ip] = '无 MAC'
+        sent = self.wake_sender.send(list(macs.values()))
+        logger.info(f"唤醒第 {operation.waves} 批: {len(macs)} 台, 发送 {sent} 个唤醒包")
+        operation.timers.append(self.timers.call_at(time.time() + self.wake_timeout, self._wake_results,
+                                                    operation, list(macs)))
+
+    def _wake_results(self, operation, ips):
+        for ip in ips:
+            if self.server.liveness.is_online(ip):
+                operation.done[ip] = '已上线'
+            elif not operation.requeue(self.group_of(ip), ip):
+                operation.done[ip] = '未上线'
+        self._batch_finished(operation)
+
+    def _batch_finished(self, operation):
+        with operation.lock:
+            operation.outstanding -= 1
+        if operation.pending() and operation.wave_timer is None:
+            # 其余批次已发完，重试的设备仍按批间隔发送
+            self._schedule(operation, max(time.time(), operation.last_wave + operation.interval))
+        self._check_finished(operation)
+
+    def _check_finished(self, operation):
+        with operation.lock:
+            if operation.finished or operation.outstanding or operation.pending():
+                return
+            operation.finished = time.time()
+        self.history.append(operation)
+        logger.info(operation.summary())
+        print(operation.summary())
+
+    def cancel(self):
+        operation = self.operation
+        if operation is None or operation.finished:
+            return False
+        for entry in operation.timers:
+            self.timers.cancel(entry)
+        with operation.lock:
+            operation.finished = time.time()
+            commands, operation.commands = operation.commands, []
+            for ips in operation.groups.values():
+                for ip in ips:
+                    operation.done.setdefault(ip, '已取消')
+                ips.clear()
+        for pending in commands:
+            # 结果回调已被取消，在这里释放指令编号，迟到的回复不再匹配
+            self.server.commands.close(pending)
+        logger.info(f"电源操作已取消: {operation.summary()}")
+        print(f"电源操作已取消: {operation.summary()}")
+        return True
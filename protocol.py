@@ -0,0 +1,406 @@
+"""
+服务器与客户端之间的帧协议
+
+每帧 = 8 字节头 (魔数 2 字节, 版本 1 字节, 消息类型 1 字节, 负载长度 4 字节) + 负载。
+魔数以 0xCC 开头，合法的 UTF-8 文本不会以它开头，因此同一端口上可以同时接入
+只会发送纯文本的旧客户端：连接上先按文本处理，收到第一帧后切换到帧模式。
+"""
+import datetime
+import struct
+
+MAGIC = b'\xcc\xcc'
+VERSION = 1  # 帧格式版本
+# HELLO 中交换的消息集级别: 1 = TEXT/STATUS; 2 = 增加 DELTA/HEARTBEAT; 3 = 增加日志上传;
+# 4 = 增加 METRICS; 5 = 增加带编号的 COMMAND/REPLY; 6 = 增加展项内容同步
+LEVEL = 6
+HEADER = struct.Struct('!2sBBI')
+MAX_PAYLOAD = 16 * 1024 * 1024
+
+# 消息类型
+MSG_HELLO = 1      # 协议协商，负载为消息集级别 (1 字节)，可选会话令牌和恢复标志，见 encode_hello
+MSG_TEXT = 2       # UTF-8 文本指令或回复，如 "shutdown" / "OK"
+MSG_STATUS = 3     # 二进制状态记录 (完整快照)，见 encode_status
+MSG_DELTA = 4      # 只含变化指标的增量，见 encode_delta
+MSG_HEARTBEAT = 5  # 无负载的心跳，只用于维持在线状态
+MSG_LOG_REQUEST = 6  # 服务器请求上传日志，负载为服务器已有的各文件字节数，见 encode_log_request
+MSG_LOG_CREDIT = 7   # 服务器授予的上传额度 (压缩后字节数)，用于全局限速
+MSG_LOG_CHUNK = 8    # 客户端上传的一块压缩日志，见 encode_log_chunk
+MSG_LOG_END = 9      # 一个日志文件上传完毕；文件名为空表示本次上传全部结束
+MSG_METRICS = 10     # 附加指标 (磁盘、网络、展项进程等)，见 encode_metrics
+MSG_COMMAND = 11     # 带编号的指令，客户端执行后用 REPLY 回复同一编号，见 encode_command
+MSG_REPLY = 12       # 指令回复，负载格式与 COMMAND 相同
+MSG_CONTENT_OFFER = 13  # 服务器推送的目录清单 (各文件的数据块摘要)，见 encode_content_offer
+MSG_CONTENT_WANT = 14   # 客户端本地没有的数据块摘要列表
+MSG_CONTENT_CHUNK = 15  # 一个数据块，见 encode_content_chunk_header
+MSG_CONTENT_END = 16    # 客户端请求的数据块已全部发出
+MSG_CONTENT_DONE = 17   # 客户端应用更新的结果，负载格式与 COMMAND 相同
+
+# 状态记录: CPU% 和内存% (单位 0.1%), 启动时间戳 (秒), 运行秒数, IP 长度,
+# 之后是 IP、项目名称长度 (2 字节) 和项目名称
+STATUS_RECORD = struct.Struct('!HHIIH')
+STRING_LENGTH = struct.Struct('!H')
+# 状态记录中的基本字段；状态字典中的其他字段作为附加指标用 METRICS 发送
+STATUS_FIELDS = ('ip', 'project_name', 'cpu', 'memory', 'boot_time', 'uptime')
+
+# 增量: 1 字节掩码，随后按掩码顺序排列的指标值 (单位 0.1%)
+DELTA_FIELDS = (('cpu', 0x01), ('memory', 0x02))
+DELTA_VALUE = struct.Struct('!H')
+
+# 日志上传: 文件名长度 (2 字节) + 文件名 + 原始文件中的字节偏移/大小 (8 字节)
+LOG_OFFSET = struct.Struct('!Q')
+LOG_COUNT = struct.Struct('!H')
+
+# 附加指标: 个数 (2 字节)，每项为名称长度 (2 字节) + 名称 + 数值 (8 字节浮点)
+METRIC_VALUE = struct.Struct('!d')
+
+# 指令与回复: 指令编号 (4 字节) + UTF-8 文本
+COMMAND_ID = struct.Struct('!I')
+
+# 内容同步: 传输编号 (4 字节, 同 COMMAND_ID)；清单中每个文件为路径 + 大小 (8 字节) + 块数 (4 字节)，
+# 每块为摘要 + 长度 (4 字节)
+CONTENT_DIGEST_SIZE = 16
+CONTENT_COUNT = struct.Struct('!I')
+CONTENT_CHUNK_LENGTH = struct.Struct('!I')
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode_frame(msg_type, payload=b''):
+    return HEADER.pack(MAGIC, VERSION, msg_type, len(payload)) + payload
+
+
+def encode_frames(frames):
+    # 把多帧拼成一段数据，一次 send 发出
+    return b''.join(encode_frame(msg_type, payload) for msg_type, payload in frames)
+
+
+SESSION_TOKEN_SIZE = 16
+
+
+def encode_hello(token=b'', resumed=None):
+    # 客户端: 级别 + 上次的会话令牌 (可选); 服务器: 级别 + 分配或恢复的令牌 + 是否恢复 (1 字节)
+    payload = bytes([LEVEL]) + token
+    if resumed is not None:
+        payload += bytes([1 if resumed else 0])
+    return encode_frame(MSG_HELLO, payload)
+
+
+def decode_hello(payload):
+    return payload[0] if payload else 1
+
+
+def decode_hello_session(payload):
+    # 返回 (级别, 会话令牌或 None, 是否恢复)
+    end = 1 + SESSION_TOKEN_SIZE
+    token = payload[1:end] if len(payload) >= end else None
+    resumed = len(payload) > end and payload[end] == 1
+    return decode_hello(payload), token, resumed
+
+
+def encode_text(text):
+    return encode_frame(MSG_TEXT, text.encode('utf-8'))
+
+
+def encode_status(status):
+    ip = (status['ip'] or '').encode('utf-8')
+    project_name = status['project_name'].encode('utf-8')
+    payload = b''.join((
+        STATUS_RECORD.pack(round(status['cpu'] * 10), round(status['memory'] * 10),
+                           int(status['boot_time']), int(status['uptime']), len(ip)),
+        ip, STRING_LENGTH.pack(len(project_name)), project_name))
+    return encode_frame(MSG_STATUS, payload)
+
+
+def decode_status(payload):
+    try:
+        cpu, memory, boot_time, uptime, ip_length = STATUS_RECORD.unpack_from(payload)
+        offset = STATUS_RECORD.size + ip_length
+        ip = payload[STATUS_RECORD.size:offset].decode('utf-8')
+        (name_length,) = STRING_LENGTH.unpack_from(payload, offset)
+        offset += STRING_LENGTH.size
+        project_name = payload[offset:offset + name_length].decode('utf-8')
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ProtocolError(f"状态记录格式错误: {e}")
+    return {
+        'ip': ip,
+        'project_name': project_name,
+        'cpu': cpu / 10,
+        'memory': memory / 10,
+        'boot_time': boot_time,
+        'uptime': uptime,
+    }
+
+
+def encode_delta(changes):
+    mask = 0
+    values = b''
+    for name, bit in DELTA_FIELDS:
+        if name in changes:
+            mask |= bit
+            values += DELTA_VALUE.pack(round(changes[name] * 10))
+    return encode_frame(MSG_DELTA, bytes([mask]) + values)
+
+
+def decode_delta(payload):
+    if not payload:
+        raise ProtocolError("增量记录为空")
+    mask = payload[0]
+    offset = 1
+    changes = {}
+    try:
+        for name, bit in DELTA_FIELDS:
+            if mask & bit:
+                (value,) = DELTA_VALUE.unpack_from(payload, offset)
+                changes[name] = value / 10
+                offset += DELTA_VALUE.size
+    except struct.error as e:
+        raise ProtocolError(f"增量记录格式错误: {e}")
+    return changes
+
+
+def encode_heartbeat():
+    return encode_frame(MSG_HEARTBEAT)
+
+
+def _pack_name(name, value):
+    name = name.encode('utf-8')
+    return STRING_LENGTH.pack(len(name)) + name + LOG_OFFSET.pack(value)
+
+
+def _unpack_name(payload, offset=0):
+    (length,) = STRING_LENGTH.unpack_from(payload, offset)
+    offset += STRING_LENGTH.size
+    name = payload[offset:offset + length].decode('utf-8')
+    offset += length
+    (value,) = LOG_OFFSET.unpack_from(payload, offset)
+    return name, value, offset + LOG_OFFSET.size
+
+
+def encode_log_request(offsets):
+    # offsets: {文件名: 服务器已保存的字节数}，客户端从这些位置继续上传
+    return encode_frame(MSG_LOG_REQUEST, LOG_COUNT.pack(len(offsets)) + b''.join(
+        _pack_name(name, size) for name, size in offsets.items()))
+
+
+def decode_log_request(payload):
+    try:
+        (count,) = LOG_COUNT.unpack_from(payload)
+        offset = LOG_COUNT.size
+        offsets = {}
+        for _ in range(count):
+            name, size, offset = _unpack_name(payload, offset)
+            offsets[name] = size
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ProtocolError(f"日志请求格式错误: {e}")
+    return offsets
+
+
+def encode_log_credit(nbytes):
+    return encode_frame(MSG_LOG_CREDIT, LOG_OFFSET.pack(nbytes))
+
+
+def decode_log_credit(payload):
+    try:
+        return LOG_OFFSET.unpack(payload)[0]
+    except struct.error as e:
+        raise ProtocolError(f"上传额度格式错误: {e}")
+
+
+def encode_log_chunk(name, offset, compressed):
+    # compressed 是原始文件 [offset, offset + 解压后长度) 这一段的 zlib 压缩数据
+    return encode_frame(MSG_LOG_CHUNK, _pack_name(name, offset) + compressed)
+
+
+def decode_log_chunk(payload):
+    try:
+        name, offset, start = _unpack_name(payload)
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ProtocolError(f"日志块格式错误: {e}")
+    return name, offset, payload[start:]
+
+
+def encode_log_end(name='', size=0):
+    return encode_frame(MSG_LOG_END, _pack_name(name, size))
+
+
+def decode_log_end(payload):
+    try:
+        name, size, _ = _unpack_name(payload)
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ProtocolError(f"日志结束标记格式错误: {e}")
+    return name, size
+
+
+def encode_metrics(metrics):
+    parts = [LOG_COUNT.pack(len(metrics))]
+    for name, value in metrics.items():
+        name = name.encode('utf-8')
+        parts += [STRING_LENGTH.pack(len(name)), name, METRIC_VALUE.pack(value)]
+    return encode_frame(MSG_METRICS, b''.join(parts))
+
+
+def decode_metrics(payload):
+    try:
+        (count,) = LOG_COUNT.unpack_from(payload)
+        offset = LOG_COUNT.size
+        metrics = {}
+        for _ in range(count):
+            (length,) = STRING_LENGTH.unpack_from(payload, offset)
+            offset += STRING_LENGTH.size
+            name = payload[offset:offset + length].decode('utf-8')
+            offset += length
+            (metrics[name],) = METRIC_VALUE.unpack_from(payload, offset)
+            offset += METRIC_VALUE.size
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ProtocolError(f"附加指标格式错误: {e}")
+    return metrics
+
+
+def encode_command(command_id, text, msg_type=MSG_COMMAND):
+    return encode_frame(msg_type, COMMAND_ID.pack(command_id) + text.encode('utf-8'))
+
+
+def encode_reply(command_id, text):
+    return encode_command(command_id, text, MSG_REPLY)
+
+
+def decode_command(payload):
+    # COMMAND 和 REPLY 通用，返回 (指令编号, 文本)
+    try:
+        (command_id,) = COMMAND_ID.unpack_from(payload)
+        return command_id, payload[COMMAND_ID.size:].decode('utf-8')
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ProtocolError(f"指令格式错误: {e}")
+
+
+def encode_content_offer(transfer_id, target, files):
+    # files: [(相对路径, 大小, [(摘要, 长度), ...]), ...]；target 为空表示客户端当前的项目目录
+    target = target.encode('utf-8')
+    parts = [COMMAND_ID.pack(transfer_id), STRING_LENGTH.pack(len(target)), target, CONTENT_COUNT.pack(len(files))]
+    for path, size, chunks in files:
+        parts += [_pack_name(path, size), CONTENT_COUNT.pack(len(chunks))]
+        parts += [digest + CONTENT_CHUNK_LENGTH.pack(length) for digest, length in chunks]
+    return encode_frame(MSG_CONTENT_OFFER, b''.join(parts))
+
+
+def decode_content_offer(payload):
+    # 返回 (传输编号, 目标项目名称, 文件清单)
+    try:
+        (transfer_id,) = COMMAND_ID.unpack_from(payload)
+        offset = COMMAND_ID.size
+        (length,) = STRING_LENGTH.unpack_from(payload, offset)
+        offset += STRING_LENGTH.size
+        target = payload[offset:offset + length].decode('utf-8')
+        offset += length
+        (count,) = CONTENT_COUNT.unpack_from(payload, offset)
+        offset += CONTENT_COUNT.size
+        files = []
+        for _ in range(count):
+            path, size, offset = _unpack_name(payload, offset)
+            (nchunks,) = CONTENT_COUNT.unpack_from(payload, offset)
+            offset += CONTENT_COUNT.size
+            chunks = []
+            for _ in range(nchunks):
+                digest = payload[offset:offset + CONTENT_DIGEST_SIZE]
+                (chunk_length,) = CONTENT_CHUNK_LENGTH.unpack_from(payload, offset + CONTENT_DIGEST_SIZE)
+                offset += CONTENT_DIGEST_SIZE + CONTENT_CHUNK_LENGTH.size
+                chunks.append((digest, chunk_length))
+            files.append((path, size, chunks))
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ProtocolError(f"内容清单格式错误: {e}")
+    return transfer_id, target, files
+
+
+def encode_content_want(transfer_id, digests):
+    return encode_frame(MSG_CONTENT_WANT, COMMAND_ID.pack(transfer_id) + CONTENT_COUNT.pack(len(digests))
+                        + b''.join(digests))
+
+
+def decode_content_want(payload):
+    try:
+        transfer_id, count = struct.unpack_from('!II', payload)
+    except struct.error as e:
+        raise ProtocolError(f"数据块请求格式错误: {e}")
+    start = COMMAND_ID.size + CONTENT_COUNT.size
+    if len(payload) != start + count * CONTENT_DIGEST_SIZE:
+        raise ProtocolError("数据块请求长度错误")
+    return transfer_id, {payload[i:i + CONTENT_DIGEST_SIZE]
+                         for i in range(start, len(payload), CONTENT_DIGEST_SIZE)}
+
+
+def encode_content_chunk_header(transfer_id, digest, length):
+    # 帧头和块前缀；调用方在其后直接读入 length 字节的数据，整帧只分配一次
+    return (HEADER.pack(MAGIC, VERSION, MSG_CONTENT_CHUNK, COMMAND_ID.size + CONTENT_DIGEST_SIZE + length)
+            + COMMAND_ID.pack(transfer_id) + digest)
+
+
+def decode_content_chunk(payload):
+    # 返回 (传输编号, 摘要, 数据)
+    start = COMMAND_ID.size + CONTENT_DIGEST_SIZE
+    if len(payload) < start:
+        raise ProtocolError("数据块格式错误")
+    (transfer_id,) = COMMAND_ID.unpack_from(payload)
+    return transfer_id, payload[COMMAND_ID.size:start], memoryview(payload)[start:]
+
+
+def encode_content_end(transfer_id):
+    return encode_frame(MSG_CONTENT_END, COMMAND_ID.pack(transfer_id))
+
+
+def decode_content_end(payload):
+    try:
+        return COMMAND_ID.unpack(payload)[0]
+    except struct.error as e:
+        raise ProtocolError(f"内容结束标记格式错误: {e}")
+
+
+def encode_content_done(transfer_id, result):
+    return encode_command(transfer_id, result, MSG_CONTENT_DONE)
+
+
+def format_status(status):
+    # 生成与旧版文本协议相同格式的状态字符串，用于日志和旧服务器
+    boot_time = datetime.datetime.fromtimestamp(status['boot_time']).strftime("%Y-%m-%d %H:%M:%S")
+    uptime_str = str(datetime.timedelta(seconds=int(status['uptime'])))
+    return (f"IP: {status['ip']}, 项目名称: {status['project_name']}, CPU: {status['cpu']}%, "
+            f"内存: {status['memory']}%, 启动时间: {boot_time}, 运行时长: {uptime_str}")
+
+
+class StreamDecoder:
+    """
+    按连接维护的解码器。未收到过帧时把每次收到的数据当作一条文本消息（旧协议行为），
+    一旦数据以魔数开头就切换为帧模式，之后按长度前缀切分，可处理粘包和半包。
+    """
+    def __init__(self):
+        self.framed = False
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        # 返回 (消息类型, 负载) 列表；旧协议的文本消息以 (MSG_TEXT, bytes) 返回
+        if not self.framed:
+            if not data or not data.startswith(MAGIC[:len(data)]):
+                return [(MSG_TEXT, data)]
+            self.framed = True
+        self.buffer += data
+        buffer = self.buffer
+        size = len(buffer)
+        frames = []
+        offset = 0
+        while size - offset >= HEADER.size:
+            magic, version, msg_type, length = HEADER.unpack_from(buffer, offset)
+            if magic != MAGIC:
+                raise ProtocolError("帧魔数错误，数据流已损坏")
+            if version > VERSION:
+                raise ProtocolError(f"不支持的协议版本: {version}")
+            if length > MAX_PAYLOAD:
+                raise ProtocolError(f"帧过大: {length} 字节")
+            start = offset + HEADER.size
+            end = start + length
+            if end > size:
+                break
+            frames.append((msg_type, bytes(buffer[start:end])))
+            offset = end
+        del buffer[:offset]
+        return frames
@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger('server')
+
+
+class ClientRegistry:
+    """
+    持久化的客户端登记表 (项目名称@IP -> 信息)。
+    快照仍是 Proj_Ip_table.json；每次变更立即追加到日志文件 (<快照>.journal)，
+    崩溃后启动时加载快照再重放日志即可恢复。日志条数超过 compact_threshold 时
+    由后台线程把当前内容写成新快照 (先写临时文件再原子替换)，然后删除旧日志。
+    """
+    def __init__(self, path='Proj_Ip_table.json', compact_threshold=10000, fsync=False):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.compacting_path = path + '.journal.1'  # 压缩期间被换下的旧日志
+        self.compact_threshold = compact_threshold
+        self.fsync = fsync  # True 时每条日志都 fsync，断电也不丢，但写入更慢
+        self.data = {}
+        self.journal = None
+        self.journal_entries = 0
+        self.lock = threading.Lock()
+        self._compact_lock = threading.Lock()  # 后台压缩和 save 指令不能同时进行
+        self._compact_requested = threading.Event()
+        self._running = False
+        self._thread = None
+
+    def load(self):
+        # 返回 (快照条数, 重放的日志条数)；快照不存在时从空表开始
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            self.data = {}
+        except json.JSONDecodeError as e:
+            logger.error(f"{self.path} 文件格式错误，只从日志恢复: {e}")
+            self.data = {}
+        snapshot_entries = len(self.data)
+        replayed = 0
+        for path in (self.compacting_path, self.journal_path):
+            replayed += self._replay(path)
+        self.journal_entries = replayed
+        self.journal = open(self.journal_path, 'a', encoding='utf-8')
+        return snapshot_entries, replayed
+
+    def _replay(self, path):
+        count = 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 崩溃时最后一行可能只写了一半，之后的内容都不可信
+                        logger.warning(f"登记表日志 {path} 第 {count + 1} 行不完整，已忽略其后的内容")
+                        break
+                    if 'v' in entry:
+                        self.data[entry['k']] = entry['v']
+                    else:
+                        self.data.pop(entry['k'], None)
+                    count += 1
+        except FileNotFoundError:
+            pass
+        return count
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='registry-compactor', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._running = False
+        self._compact_requested.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        with self.lock:
+            if self.journal:
+                self.journal.close()
+                self.journal = None
+
+    def put(self, key, info):
+        # 内容没有变化时不写日志
+        with self.lock:
+            if self.data.get(key) == info:
+                return False
+            self.data[key] = info
+            self._append({'k': key, 'v': info})
+        return True
+
+    def remove(self, key):
+        with self.lock:
+            if self.data.pop(key, None) is None:
+                return False
+            self._append({'k': key})
+        return True
+
+    def _append(self, entry):
+        self.journal.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.journal.flush()
+        if self.fsync:
+            os.fsync(self.journal.fileno())
+        self.journal_entries += 1
+        if self.journal_entries >= self.compact_threshold:
+            self._compact_requested.set()
+
+    def compact(self):
+        # 写出新快照并丢弃已包含在快照中的日志；期间的新变更写入新日志
+        with self._compact_lock:
+            return self._compact()
+
+    def _compact(self):
+        start = time.perf_counter()
+        if os.path.exists(self.compacting_path):
+            # 上次压缩中断留下的旧日志：启动时已重放，但还没写进快照。先写一次快照把它合并进去，
+            # 否则下面的改名会覆盖它，再次崩溃时其中的变更就丢了
+            with self.lock:
+                snapshot = dict(self.data)
+            self._write_snapshot(snapshot)
+            os.remove(self.compacting_path)
+        with self.lock:
+            snapshot = dict(self.data)
+            self.journal.close()
+            os.replace(self.journal_path, self.compacting_path)
+            self.journal = open(self.journal_path, 'a', encoding='utf-8')
+            self.journal_entries = 0
+        self._write_snapshot(snapshot)
+        os.remove(self.compacting_path)
+        logger.info(f"登记表已压缩: {len(snapshot)} 条, 耗时 {(time.perf_counter() - start) * 1000:.0f}ms")
+        return len(snapshot)
+
+    def _write_snapshot(self, snapshot):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _run(self):
+        while self._running:
+            self._compact_requested.wait()
+            self._compact_requested.clear()
+            if self._running and self.journal_entries >= self.compact_threshold:
+                try:
+                    self.compact()
+                except OSError as e:
+                    logger.error(f"登记表压缩失败: {e}")
@@ -1,120 +1,574 @@
 import socket
+import sys
 import threading
 import json
+import base64
 import time
 import logging
 import datetime
 from logging.handlers import RotatingFileHandler
-from network_utils import ping_test
-from logger_config import setup_logger
+from network_utils import ping_test, sweep, ReachabilityCache
+from logger_config import setup_logger, load_logging_config
+from io_engine import SelectorEngine
+from broadcast import BroadcastResult, Outbox, SenderPool
+from telemetry_store import TelemetryStore
+from liveness import LivenessTracker
+from log_upload import LogUploadManager
+from registry import ClientRegistry
+from admission import AcceptLimiter, SessionTable
+from server_metrics import ServerMetrics
+from client_index import ClientIndex
+from commands import CommandTracker, ANSWERED, OFFLINE, SEND_FAILED, NO_REPLY
+from power import PowerScheduler, parse_mac
+from content_sync import ContentDistributor
+from sharding import ShardAgent
+from handoff import HandoffListener, Takeover, send_state, send_message, recv_message, supported as handoff_supported
+from protocol import (StreamDecoder, MSG_HELLO, MSG_TEXT, MSG_STATUS, MSG_DELTA, MSG_HEARTBEAT,
+                      MSG_LOG_CHUNK, MSG_LOG_END, MSG_METRICS, MSG_REPLY, MSG_CONTENT_WANT, MSG_CONTENT_DONE,
+                      encode_hello, decode_hello_session, encode_text, decode_status, decode_delta, decode_metrics,
+                      encode_command, decode_command, format_status)
 import os
 
 
 # 创建日志记录器
-logger = setup_logger('server', 'server')
+logger = setup_logger('server', 'server', options=load_logging_config('server_config.json'))
+
+
+def load_server_config():
+    try:
+        with open('server_config.json', 'r') as config_file:
+            return json.load(config_file)
+    except FileNotFoundError:
+        print("未找到 server_config.json 文件，使用默认设置")
+        return {}
+    except json.JSONDecodeError:
+        print("server_config.json 文件格式错误，使用默认设置")
+        return {}
+
 
 class ControlServer:
-    def __init__(self, host='0.0.0.0', port=5000):
+    def __init__(self, host='0.0.0.0', port=5000, engine='thread', workers=1,
+                 outbox_max_bytes=256 * 1024, slow_client_timeout=10, broadcast_wait=2,
+                 sender_threads=8, ping_cache_ttl=60, probe_timeout=1.0, telemetry_dir='telemetry',
+                 liveness_timeout=90, liveness_groups=None, log_bandwidth=2 * 1024 * 1024,
+                 log_concurrency=8, registry_compact_threshold=10000, accept_rate=200, accept_burst=50,
+                 session_ttl=600, session_file='sessions.json', metrics_enabled=True, metrics_host='127.0.0.1',
+                 metrics_port=None, command_timeout=5, power_options=None, content_options=None,
+                 handoff_path=None, shard_options=None):
         self.host = host
         self.port = port
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.clients = []
         self.running = False
-        self.client_info = {}  # 用于存储客户端信息的字典
-        self.last_seen = {}  # 用于记录客户端最后一次发送消息的时间
+        self.engine_name = engine  # 'thread': 每个客户端一个线程; 'selector': 事件循环
+        self.workers = workers  # selector 模式下的事件循环数量
+        self.engine = None
+        self.outbox_max_bytes = outbox_max_bytes  # 每个客户端发送队列的上限
+        self.slow_client_timeout = slow_client_timeout  # 发送队列积压超过该秒数即断开慢速客户端
+        self.broadcast_wait = broadcast_wait  # 广播后最多等待多少秒再输出投递统计
+        self.sender_threads = sender_threads
+        self.sender_pool = SenderPool(self, sender_threads) if engine == 'thread' else None
+        self.accept_thread = None
+        self.client_threads = {}  # 线程模式: socket -> 接收线程
+        self.reachability = ReachabilityCache(ping_cache_ttl)  # ping / ping-all 的结果缓存
+        self.probe_timeout = probe_timeout
+        self.telemetry = TelemetryStore(telemetry_dir)  # 各客户端 CPU / 内存历史
+        # 客户端登记表：变更实时写入日志，后台压缩为 Proj_Ip_table.json 快照
+        self.registry = ClientRegistry('Proj_Ip_table.json', registry_compact_threshold)
+        self.client_info = {}  # 用于存储客户端信息的字典 (即 registry.data)
+        # client_info 的索引：按项目名称前缀、标签、网段选择设备
+        self.index = ClientIndex()
+        self.ip_index = self.index.ip_keys  # ip -> client_info 中对应的 key 集合
+        # 在线状态跟踪；liveness_groups 为 {项目名称前缀: 超时秒数}
+        self.liveness_groups = dict(liveness_groups or {})
+        self.liveness = LivenessTracker(liveness_timeout, self.liveness_groups)
+        self.liveness.on_transition(self.on_liveness_change)
+        self.last_seen = self.liveness.last_seen  # 用于记录客户端最后一次发送消息的时间
         self.client_log_dir = 'clientlog'
         if not os.path.exists(self.client_log_dir):
             os.makedirs(self.client_log_dir)
+        # 日志上传：log_bandwidth 为所有设备合计的上传速率上限 (字节/秒)
+        self.log_uploads = LogUploadManager(self, self.client_log_dir, log_bandwidth, log_concurrency)
         self.client_sockets = {}  # 用于存储客户端 IP 和对应的 socket
+        self.client_addresses = {}  # socket -> 客户端 IP
+        self.client_decoders = {}  # socket -> StreamDecoder，记录每个连接的协议状态
+        self.client_outboxes = {}  # socket -> Outbox，每个连接的有界发送队列
+        self.client_states = {}  # socket -> 由快照和增量还原出的最新完整状态
+        self.client_levels = {}  # socket -> 客户端在 HELLO 中声明的消息集级别
+        self.client_metrics = {}  # ip -> (时间, 最新的附加指标)
+        self.client_sessions = {}  # socket -> 会话令牌
+        # 重连风暴控制：限制每秒接受的新连接数；重连的客户端凭会话令牌跳过重新登记
+        self.admission = AcceptLimiter(accept_rate, accept_burst)
+        self.sessions = SessionTable(session_file, session_ttl)
+        # 运行指标；metrics_port 不为 None 时在 metrics_host 上提供 HTTP 端点
+        self.metrics = ServerMetrics(self, metrics_enabled)
+        self.metrics_host = metrics_host
+        self.metrics_port = metrics_port
+        # 带编号的指令：回复关联到指令，超过 command_timeout 秒未回复的设备记为超时
+        self.commands = CommandTracker(command_timeout)
+        # 关机/重启/网络唤醒分组分批进行；power_options 见 PowerScheduler 的参数
+        self.power = PowerScheduler(self, **(power_options or {}))
+        # 展项内容推送；content_options 见 ContentDistributor 的参数
+        self.content = ContentDistributor(self, **(content_options or {}))
+        # 热重启：新进程 (server.py --takeover) 通过 handoff_path 上的 Unix socket 接管监听 socket 和所有连接
+        self.handoff_path = handoff_path
+        self.handoff = None
+        self.adopted = False  # 监听 socket 和连接是否从旧进程接管
+        self.io_paused = False  # 交接期间暂停所有收发
+        # 分片模式：多个服务器进程按 project@ip 的一致性哈希分担设备，shard_options 见 ShardAgent 的参数
+        self.shard = ShardAgent(self, **shard_options) if shard_options and shard_options.get('name') else None
 
         # 加载配置文件
         self.load_client_info()
 
     def load_client_info(self):
-        # 从文件加载客户端信息
-        try:
-            with open('Proj_Ip_table.json', 'r') as f:
-                self.client_info = json.load(f)
-            
-            print("客户端信息已从 Proj_Ip_table.json 加载")
-            print(self.client_info)
-        except FileNotFoundError:
-            print("未找到 Proj_Ip_table.json 文件，使用空的客户端信息")
-        except json.JSONDecodeError:
-            print("Proj_Ip_table.json 文件格式错误，使用空的客户端信息")
+        # 从快照加载客户端信息，再重放上次保存之后的变更日志
+        start = time.perf_counter()
+        snapshot_entries, replayed = self.registry.load()
+        self.client_info = self.registry.data
+        for key, info in self.client_info.items():
+            self.index_client(key, info)
+        print(f"客户端信息已从 Proj_Ip_table.json 加载: 快照 {snapshot_entries} 条, 重放日志 {replayed} 条, "
+              f"共 {len(self.client_info)} 个客户端, 耗时 {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    def index_client(self, key, info):
+        self.index.add(key, info)
+        group = next((prefix for prefix in self.liveness_groups
+                      if info['project_name'].startswith(prefix)), None)
+        self.liveness.set_group(info['ip'], group)
+
+    def on_liveness_change(self, ip, online, timestamp):
+        logger.info(f"设备 {ip} {'上线' if online else '离线'}")
+        if not online:
+            print(f"设备 {ip} 离线")
 
     def start(self):
-        self.server_socket.bind((self.host, self.port))
-        self.server_socket.listen(5)
-        logger.info(f"服务器正在监听 {self.host}:{self.port}")
-        print(f"服务器正在监听 {self.host}:{self.port}")
+        if not self.adopted:
+            # 重启后立即重新绑定同一端口；Windows 上 SO_REUSEADDR 允许端口被抢占，改用独占选项
+            if hasattr(socket, 'SO_EXCLUSIVEADDRUSE'):
+                self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+            else:
+                self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server_socket.bind((self.host, self.port))
+            self.server_socket.listen(socket.SOMAXCONN)
+        self.port = self.server_socket.getsockname()[1]  # port=0 时取实际端口
+        adopted = f"，已接管 {len(self.clients)} 个连接" if self.adopted else ""
+        logger.info(f"服务器正在监听 {self.host}:{self.port} (引擎: {self.engine_name}){adopted}")
+        print(f"服务器正在监听 {self.host}:{self.port} (引擎: {self.engine_name}){adopted}")
         self.running = True
+        resumable = self.sessions.load()
+        if resumable:
+            logger.info(f"已加载 {resumable} 个可恢复的客户端会话")
+        self.telemetry.start()
+        self.liveness.start()
+        self.log_uploads.start()
+        self.registry.start()
+        self.metrics.start(self.metrics_host, self.metrics_port)
+        self.power.start()
 
-        accept_thread = threading.Thread(target=self.accept_clients)
-        accept_thread.start()
+        self._start_io()
+        if self.adopted:
+            # 交接前未完成的日志上传，向已连接的设备重新请求 (从断点续传)
+            for ip in list(self.log_uploads.wanted):
+                if ip in self.client_sockets:
+                    self.log_uploads.on_client_ready(ip)
+        if self.shard:
+            self.shard.start()
+        if self.handoff_path and handoff_supported():
+            self.handoff = HandoffListener(self, self.handoff_path)
+            if not self.handoff.start():
+                self.handoff = None
+
+    def _start_io(self):
+        # 启动收发；已登记的连接 (接管或交接失败后恢复的) 直接继续收发
+        connections = [(self.client_addresses[sock], sock) for sock in self.clients
+                       if sock in self.client_addresses]
+        if self.engine_name == 'selector':
+            self.engine = SelectorEngine(self, workers=self.workers)
+            self.engine.start(connections)
+        else:
+            self.server_socket.settimeout(1.0)  # 让接受线程能及时发现交接暂停
+            self.sender_pool.start()
+            for client_address, client_socket in connections:
+                client_socket.settimeout(self.slow_client_timeout)
+                self.spawn_client_thread(self.serve_client, client_address, client_socket)
+                outbox = self.client_outboxes[client_socket]
+                if outbox.pending():
+                    self.sender_pool.kick(client_socket, outbox)
+            self.accept_thread = threading.Thread(target=self.accept_clients)
+            self.accept_thread.start()
+
+    def spawn_client_thread(self, target, *args):
+        client_thread = threading.Thread(target=target, args=args)
+        self.client_threads[args[-1]] = client_thread
+        client_thread.start()
 
     def accept_clients(self):
-        while self.running:
+        while self.running and not self.io_paused:
+            wait = self.admission.acquire()
+            if wait:
+                time.sleep(wait)  # 超过准入速率，新连接暂时留在 listen 队列中
+                continue
             try:
                 client_socket, addr = self.server_socket.accept()
+                # 带超时的 socket 让发送线程不会被单个慢速客户端无限阻塞
+                client_socket.settimeout(self.slow_client_timeout)
                 print(f"新客户端连接: {addr}")
                 self.clients.append(client_socket)
-                client_thread = threading.Thread(target=self.handle_client, args=(client_socket,))
-                client_thread.start()
+                self.spawn_client_thread(self.handle_client, client_socket)
+            except socket.timeout:
+                self.admission.refund()
+                continue
             except:
                 break
 
     def handle_client(self, client_socket):
         client_address = client_socket.getpeername()[0]
-        logger.info(f"新客户端连接: {client_address}")
-        self.client_sockets[client_address] = client_socket  # 存储客户端 socket
+        self.register_client(client_address, client_socket)
+        self.serve_client(client_address, client_socket)
+
+    def serve_client(self, client_address, client_socket):
         while self.running:
+            if self.io_paused:
+                return  # 热重启交接：连接留给新进程，不清理
             try:
                 data = client_socket.recv(4096)  # 增加接收缓冲区大小
                 if not data:
                     break
-                try:
-                    message = data.decode('utf-8')
-                    logger.info(f"收到数据: {message}")
-                    if message.startswith("状态信息:"):
-                        info = message[5:].strip()
-                        self.parse_and_save_client_info(info)
-                    elif message == "OK":
-                        logger.info(f"客户端 {client_address} 响应测试: OK")
-                        print(f"客户端 {client_address} 响应测试: OK")
-                    
-                    self.last_seen[client_address] = time.time()
-                except UnicodeDecodeError:
-                    # 如果无法解码，可能是日志文件的开始部分
-                    print('开始接收日志（检测到二进制数据）')
-        
-                        
+                self.handle_data(client_socket, client_address, data)
+            except socket.timeout:
+                continue  # 只是暂时没有数据
             except Exception as e:
+                if not self.running:
+                    break  # 服务器停止时关闭了 socket
                 logger.error(f"Client {client_address} 异常退出: {e}")
                 print(f"Client {client_address} 异常退出: {e}")
                 break
-        
-        del self.client_sockets[client_address]  # 移除断开连接的客户端
-        self.clients.remove(client_socket)
+
+        self.client_threads.pop(client_socket, None)
+        self.unregister_client(client_address, client_socket)
         client_socket.close()
 
+    def register_client(self, client_address, client_socket):
+        logger.info(f"新客户端连接: {client_address}")
+        self.metrics.connections.inc()
+        if client_address in self.last_seen:
+            self.metrics.reconnects.inc()
+        self.add_client_state(client_address, client_socket)
+
+    def add_client_state(self, client_address, client_socket):
+        self.client_sockets[client_address] = client_socket  # 存储客户端 socket
+        self.client_addresses[client_socket] = client_address
+        self.client_decoders[client_socket] = StreamDecoder()
+        self.client_outboxes[client_socket] = Outbox(self.outbox_max_bytes, self.metrics)
+
+    def unregister_client(self, client_address, client_socket):
+        # 同一 IP 可能已经重新连接，只移除属于本连接的记录
+        if self.client_sockets.get(client_address) is client_socket:
+            del self.client_sockets[client_address]  # 移除断开连接的客户端
+        if client_socket in self.clients:
+            self.clients.remove(client_socket)
+        self.client_addresses.pop(client_socket, None)
+        self.client_decoders.pop(client_socket, None)
+        state = self.client_states.pop(client_socket, None)
+        self.client_levels.pop(client_socket, None)
+        token = self.client_sessions.pop(client_socket, None)
+        if token:
+            self.sessions.close(token, state)
+        self.log_uploads.forget(client_socket)
+        self.content.forget(client_socket)
+        outbox = self.client_outboxes.pop(client_socket, None)
+        if outbox:
+            outbox.close()
+        if client_address not in self.client_sockets:
+            self.liveness.mark_offline(client_address)
+
+    def shed_client(self, client_socket, reason):
+        # 断开慢速或出错的客户端：丢弃其发送队列，关闭连接后由接收线程/事件循环完成清理
+        outbox = self.client_outboxes.get(client_socket)
+        if outbox:
+            outbox.close()
+        try:
+            client_address = client_socket.getpeername()[0]
+        except OSError:
+            client_address = '未知'
+        logger.warning(f"断开慢速客户端 {client_address}: {reason}")
+        print(f"断开慢速客户端 {client_address}: {reason}")
+        try:
+            client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def handle_data(self, client_socket, client_address, data):
+        # 处理从客户端收到的一段数据，线程模式和事件循环模式共用
+        decoder = self.client_decoders.get(client_socket)
+        frames = decoder.feed(data) if decoder else [(MSG_TEXT, data)]
+        self.metrics.bytes_received.inc(len(data))
+        self.metrics.messages_received.inc(len(frames))
+        for msg_type, payload in frames:
+            self.handle_frame(client_socket, client_address, msg_type, payload)
+
+    def handle_frame(self, client_socket, client_address, msg_type, payload):
+        if msg_type == MSG_TEXT:
+            try:
+                message = payload.decode('utf-8')
+            except UnicodeDecodeError:
+                # 旧版客户端不支持日志上传，二进制数据无法处理
+                logger.warning(f"客户端 {client_address} 发送了无法解码的数据，已忽略")
+                return
+            self.handle_message(client_address, message)
+        elif msg_type == MSG_STATUS:
+            status = decode_status(payload)
+            self.client_states[client_socket] = status
+            self.ingest_status(client_address, status)
+            self.commands.on_legacy_reply(client_address, 'status')
+        elif msg_type == MSG_REPLY:
+            command_id, reply = decode_command(payload)
+            self.commands.on_reply(client_address, command_id, reply)
+            self.liveness.touch(client_address)
+        elif msg_type == MSG_DELTA:
+            status = self.client_states.get(client_socket)
+            if status is None:
+                # 没有快照无法还原完整状态，请客户端重新发送
+                logger.warning(f"客户端 {client_address} 发送了增量但没有快照，请求完整状态")
+                self.send_bytes(client_socket, self.encode_message(client_socket, "get"))
+                return
+            status.update(decode_delta(payload))
+            status['uptime'] = time.time() - status['boot_time']
+            self.ingest_status(client_address, status)
+        elif msg_type == MSG_HEARTBEAT:
+            # 心跳不写日志；仍按当前状态记录一个遥测点，使历史曲线连续
+            status = self.client_states.get(client_socket)
+            if status is not None:
+                self.record_telemetry(status['ip'], status['project_name'], status['cpu'], status['memory'])
+            self.liveness.touch(client_address)
+        elif msg_type == MSG_METRICS:
+            self.client_metrics[client_address] = (time.time(), decode_metrics(payload))
+            self.liveness.touch(client_address)
+        elif msg_type == MSG_LOG_CHUNK:
+            self.log_uploads.on_chunk(client_socket, client_address, payload)
+        elif msg_type == MSG_LOG_END:
+            self.log_uploads.on_end(client_socket, client_address, payload)
+        elif msg_type == MSG_CONTENT_WANT:
+            self.content.on_want(client_socket, client_address, payload)
+        elif msg_type == MSG_CONTENT_DONE:
+            self.content.on_done(client_socket, client_address, payload)
+            self.liveness.touch(client_address)
+        elif msg_type == MSG_HELLO:
+            level, token, _ = decode_hello_session(payload)
+            self.client_levels[client_socket] = level
+            token, session, resumed = self.sessions.open(token.hex() if token else None, client_address, level)
+            self.client_sessions[client_socket] = token
+            if resumed and session['state']:
+                # 恢复会话：沿用断开前的完整状态，客户端可以直接继续发送增量
+                self.client_states[client_socket] = dict(session['state'])
+            logger.info(f"客户端 {client_address} 使用帧协议，消息集级别 {level}"
+                        f"{'，已恢复会话' if resumed else ''}")
+            self.send_bytes(client_socket, encode_hello(bytes.fromhex(token), resumed))
+            self.liveness.touch(client_address)
+            if level >= 3:
+                self.log_uploads.on_client_ready(client_address)
+        else:
+            logger.warning(f"客户端 {client_address} 发送了未知类型的帧: {msg_type}")
+
+    def ingest_status(self, client_address, status):
+        start = time.perf_counter()
+        logger.info(f"收到数据: 状态信息: {format_status(status)}")
+        self.update_client_info(status['ip'], status['project_name'])
+        self.record_telemetry(status['ip'], status['project_name'], status['cpu'], status['memory'])
+        self.liveness.touch(client_address)
+        self.metrics.ingest_seconds.observe(time.perf_counter() - start)
+
+    def handle_message(self, client_address, message):
+        logger.info(f"收到数据: {message}")
+        if message.startswith("状态信息:"):
+            info = message[5:].strip()
+            self.parse_and_save_client_info(info)
+            self.commands.on_legacy_reply(client_address, 'status')
+        elif message == "OK":
+            logger.info(f"客户端 {client_address} 响应测试: OK")
+            self.commands.on_legacy_reply(client_address, 'OK')
+
+        self.liveness.touch(client_address)
+
     def parse_and_save_client_info(self, info):
         # 解析客户端发送的信息
+        start = time.perf_counter()
         info_parts = info.split(', ')
         ip = None
         project_name = None
+        cpu = None
+        memory = None
         for part in info_parts:
             if part.startswith("IP:"):
                 ip = part.split(': ')[1]
             elif part.startswith("项目名称:"):
                 project_name = part.split(': ')[1]
-        
+            elif part.startswith("CPU:"):
+                cpu = self._parse_percent(part)
+            elif part.startswith("内存:"):
+                memory = self._parse_percent(part)
+        self.update_client_info(ip, project_name)
+        self.record_telemetry(ip, project_name, cpu, memory)
+        self.metrics.parse_seconds.observe(time.perf_counter() - start)
+
+    @staticmethod
+    def _parse_percent(part):
+        try:
+            return float(part.split(': ')[1].rstrip('%'))
+        except (IndexError, ValueError):
+            return None
+
+    def record_telemetry(self, ip, project_name, cpu, memory):
+        if ip and project_name and cpu is not None and memory is not None:
+            self.telemetry.append(project_name+'@'+ip, time.time(), cpu, memory)
+
+    def update_client_info(self, ip, project_name):
         # 保存或更新客户端信息
         if ip and project_name:
-            self.client_info[project_name+'@'+ip] = {
-                'ip': ip,
-                'project_name': project_name
-            }
+            key = project_name+'@'+ip
+            old = self.client_info.get(key)
+            if old is None:
+                info = {'ip': ip, 'project_name': project_name}
+                self.index_client(key, info)
+            else:
+                info = dict(old, ip=ip, project_name=project_name)  # 保留标签、MAC 等附加信息
+            self.registry.put(key, info)
+
+    def set_mac(self, ip, mac):
+        # 记录设备的 MAC 地址 (写入该 IP 的所有登记项)，供网络唤醒使用
+        try:
+            mac = parse_mac(mac).hex(':')
+        except ValueError as e:
+            print(e)
+            return False
+        keys = list(self.ip_index.get(ip, ()))
+        if not keys:
+            print(f"未找到设备 {ip} 的登记信息")
+            return False
+        for key in keys:
+            info = dict(self.client_info[key], mac=mac)
+            if info != self.client_info[key]:
+                self.index_client(key, info)
+                self.registry.put(key, info)
+        return True
+
+    def mac_of(self, ip):
+        for key in self.ip_index.get(ip, ()):
+            mac = self.client_info[key].get('mac')
+            if mac:
+                return mac
+        return None
+
+    def scan_macs(self, selector=None):
+        # 向在线设备查询 MAC 地址并记录；旧版客户端不支持，需要用 mac <IP> <MAC> 手动设置
+        pending = self.run_command('mac', selector)
+        if pending is None:
+            return 0
+        learned = 0
+        for ip, (state, reply, _) in pending.results.items():
+            if state == ANSWERED and reply and reply != '未知':
+                learned += self.set_mac(ip, reply)
+        print(f"已记录 {learned} 台设备的 MAC 地址")
+        return learned
+
+    def power_operation(self, action, selector=None):
+        """
+        关机/重启/唤醒选中的设备。selector 为 None 时: 关机、重启针对所有在线设备，
+        唤醒针对所有已登记且当前不在线的设备
+        """
+        if selector is None:
+            ips = set(self.client_sockets) if action != 'wake' else set(self.ip_index)
+        else:
+            try:
+                ips = self.index.select(selector)
+            except ValueError as e:
+                print(e)
+                return None
+        if action == 'wake':
+            ips = {ip for ip in ips if not self.liveness.is_online(ip)}
+            missing = sorted(ip for ip in ips if not self.mac_of(ip))
+            if missing:
+                print(f"{len(missing)} 台设备没有记录 MAC 地址，无法唤醒: {', '.join(missing[:20])}"
+                      f"{' ...' if len(missing) > 20 else ''}")
+        return self.power.begin(action, ips)
+
+    def show_power_status(self):
+        operation = self.power.operation
+        if operation is None:
+            print("没有进行中的电源操作")
+            return
+        print(operation.summary())
+        failed = sorted(ip for ip, state in operation.done.items()
+                        if state not in (ANSWERED, OFFLINE, NO_REPLY, '已上线'))
+        if failed:
+            print(f"未成功的设备: {', '.join(failed)}")
+
+    def push_content(self, source, selector, target=''):
+        # 把服务器上的 source 目录同步到选中设备的项目目录 (target 为空时为设备当前的项目)，后台进行
+        try:
+            targets = self.index.select(selector)
+        except ValueError as e:
+            print(e)
+            return None
+        if not targets:
+            print(f"没有与 '{selector}' 匹配的设备")
+            return None
+        push = self.content.push(source, targets, target)
+        if push:
+            message = f"开始推送 #{push.id}: {source} -> {len(targets)} 台设备的 {target or '当前项目'}"
+            logger.info(message)
+            print(message)
+        return push
+
+    def show_content_pushes(self):
+        pushes = list(self.content.pushes.values())
+        if not pushes:
+            print("没有内容推送记录")
+            return
+        for push in pushes[-10:]:
+            print(push.summary())
+            for ip, error in sorted(push.errors.items()):
+                print(f"  {ip}: {error}")
+
+    def tag_clients(self, selector, tag, remove=False):
+        # 给选中设备的所有登记项添加或移除标签，标签随登记表保存
+        try:
+            ips = self.index.select(selector)
+        except ValueError as e:
+            print(e)
+            return 0
+        changed = 0
+        for ip in ips:
+            for key in list(self.ip_index.get(ip, ())):
+                info = dict(self.client_info[key])
+                tags = set(info.get('tags', ()))
+                if remove:
+                    tags.discard(tag)
+                else:
+                    tags.add(tag)
+                if tags:
+                    info['tags'] = sorted(tags)
+                else:
+                    info.pop('tags', None)
+                if info != self.client_info[key]:
+                    self.index_client(key, info)
+                    self.registry.put(key, info)
+                    changed += 1
+        print(f"已{'移除' if remove else '添加'}标签 '{tag}': {changed} 个登记项")
+        return changed
+
+    def show_selection(self, selector):
+        try:
+            ips = self.index.select(selector)
+        except ValueError as e:
+            print(e)
+            return
+        print(f"\n'{selector}' 选中 {len(ips)} 台设备:")
+        for ip in sorted(ips):
+            names = ', '.join(self.client_info[key]['project_name'] for key in sorted(self.ip_index.get(ip, ())))
+            print(f"{ip}  {names or '未登记'}  {'在线' if ip in self.client_sockets else '离线'}")
+        print()
 
     def broadcast(self, message):
         for client in self.clients[:]:  # 使用列表的副本进行迭代
@@ -128,6 +582,25 @@ class ControlServer:
 
     def stop(self):
         self.running = False
+        if self.engine:
+            self.engine.stop()
+        if self.sender_pool:
+            self.sender_pool.stop()
+        self.telemetry.close()
+        self.liveness.stop()
+        self.log_uploads.stop()
+        self.registry.close()
+        self.metrics.stop()
+        self.power.stop()
+        if self.shard:
+            self.shard.stop()
+        if self.handoff:
+            self.handoff.close()
+        # 保存会话，重启后客户端可以恢复
+        for client_socket, token in list(self.client_sessions.items()):
+            self.sessions.close(token, self.client_states.get(client_socket))
+        self.client_sessions.clear()
+        self.sessions.save()
         for client in self.clients:
             try:
                 client.close()
@@ -141,16 +614,159 @@ class ControlServer:
         logger.info("服务器已停止")
         print("服务器已停止")
 
+    def hand_off(self, conn):
+        # 在交接线程中调用：把监听 socket、所有连接和内存状态交给新进程。
+        # 返回 True 表示新进程已接管，本进程应退出；失败时恢复收发，连接不受影响
+        start = time.perf_counter()
+        logger.info("新进程请求接管，暂停收发")
+        print("新进程请求接管，暂停收发")
+        self.pause_io()
+        try:
+            self.telemetry.flush(force=True)
+            self.sessions.save()
+            state, clients = self.export_state()
+            send_state(conn, state, self.server_socket, clients)
+            reply, _ = recv_message(conn)
+            if reply.get('type') != 'ready':
+                raise ConnectionError(f"新进程回复异常: {reply}")
+        except (OSError, ValueError) as e:
+            logger.error(f"交接失败，恢复收发: {e}")
+            print(f"交接失败，恢复收发: {e}")
+            conn.close()
+            self.resume_io()
+            return False
+        self.release()
+        logger.info(f"已把 {len(clients)} 个连接交给新进程，暂停收发 "
+                    f"{(time.perf_counter() - start) * 1000:.0f}ms")
+        print(f"已把 {len(clients)} 个连接交给新进程，暂停收发 {(time.perf_counter() - start) * 1000:.0f}ms")
+        try:
+            send_message(conn, {'type': 'bye'})
+        except OSError:
+            pass
+        conn.close()
+        return True
+
+    def pause_io(self):
+        # 停止所有收发，但不关闭连接；之后解码器、发送队列等状态不再变化
+        self.io_paused = True
+        if self.engine:
+            self.engine.detach()
+            self.engine = None
+            return
+        # 线程模式: 接收线程最多在 slow_client_timeout 秒后发现暂停
+        self.sender_pool.stop()
+        self.sender_pool.join()
+        if self.accept_thread:
+            self.accept_thread.join()
+        for client_thread in list(self.client_threads.values()):
+            client_thread.join()
+        self.client_threads.clear()
+
+    def resume_io(self):
+        self.io_paused = False
+        if self.engine_name == 'thread':
+            self.sender_pool = SenderPool(self, self.sender_threads)
+            for outbox in self.client_outboxes.values():
+                outbox.scheduled = False
+        self._start_io()
+
+    def export_state(self):
+        # 交接给新进程的状态；二进制数据用 base64 编码。
+        # 进行中的指令、内容推送和广播统计不交接
+        now = time.time()
+        state = {
+            'client_info': dict(self.registry.data),
+            'last_seen': dict(self.last_seen),
+            'online': self.liveness.online_ips(),
+            'client_metrics': {ip: [t, m] for ip, (t, m) in self.client_metrics.items()},
+            'log_wanted': list(self.log_uploads.wanted),
+            'telemetry': self.telemetry.recent(3600),
+            'exported': now,
+        }
+        clients = []
+        for client_socket in list(self.clients):
+            client_address = self.client_addresses.get(client_socket)
+            if client_address is None:
+                continue  # 尚未登记的连接
+            decoder = self.client_decoders[client_socket]
+            outbox = self.client_outboxes[client_socket]
+            clients.append((client_socket, {
+                'ip': client_address,
+                'framed': decoder.framed,
+                'buffer': base64.b64encode(decoder.buffer).decode('ascii'),
+                'level': self.client_levels.get(client_socket),
+                'session': self.client_sessions.get(client_socket),
+                'state': self.client_states.get(client_socket),
+                'outbox': base64.b64encode(outbox.pending_bytes()).decode('ascii'),
+            }))
+        return state, clients
+
+    def release(self):
+        # 新进程已接管：停止后台任务 (写完登记表、遥测等文件)，只关闭本进程的描述符，
+        # 不 shutdown，连接由新进程继续使用
+        self.running = False
+        self.telemetry.close()
+        self.liveness.stop()
+        self.log_uploads.stop()
+        self.registry.close()
+        self.metrics.stop()
+        self.power.stop()
+        if self.shard:
+            self.shard.stop()
+        if self.handoff:
+            self.handoff.close()
+        for client in self.clients:
+            client.close()
+        self.server_socket.close()
+
+    def adopt(self, takeover):
+        # 新进程: 接管 Takeover 收到的监听 socket、连接和状态，随后通知旧进程退出
+        state = takeover.state
+        self.server_socket.close()
+        self.server_socket = takeover.listener
+        self.adopted = True
+        if state['client_info'] != self.client_info:
+            # 旧进程内存中的登记表比磁盘上的新 (例如正在压缩)，以它为准并写出新快照
+            self.registry.data = self.client_info = state['client_info']
+            self.index = ClientIndex()
+            self.ip_index = self.index.ip_keys
+            for key, info in self.client_info.items():
+                self.index_client(key, info)
+            self.registry.compact()
+        self.liveness.restore(state['last_seen'], state['online'])
+        self.client_metrics.update({ip: (t, m) for ip, (t, m) in state['client_metrics'].items()})
+        self.log_uploads.wanted.update(state['log_wanted'])
+        self.telemetry.restore(state['telemetry'])
+        for client_socket, info in takeover.clients:
+            client_address = info['ip']
+            self.clients.append(client_socket)
+            self.add_client_state(client_address, client_socket)
+            decoder = self.client_decoders[client_socket]
+            decoder.framed = info['framed']
+            decoder.buffer += base64.b64decode(info['buffer'])
+            if info['level'] is not None:
+                self.client_levels[client_socket] = info['level']
+            if info['state'] is not None:
+                self.client_states[client_socket] = info['state']
+            if info['session']:
+                self.client_sessions[client_socket] = info['session']
+                self.sessions.restore(info['session'], client_address, info['level'])
+            pending = base64.b64decode(info['outbox'])
+            if pending:
+                self.client_outboxes[client_socket].push(pending)
+        takeover.clients = []
+        takeover.confirm()
+        logger.info(f"已从旧进程接管 {len(self.clients)} 个连接，耗时 "
+                    f"{(time.perf_counter() - takeover.started) * 1000:.0f}ms")
+
     def save_client_info(self):
-        # 将客户端信息保存到文件
-        with open('Proj_Ip_table.json', 'w') as f:
-            json.dump(self.client_info, f, indent=4)
-        print("客户端信息已保存到 Proj_Ip_table.json")
+        # 变更已实时写入日志；这里立即压缩为新快照
+        count = self.registry.compact()
+        print(f"客户端信息已保存到 Proj_Ip_table.json ({count} 条)")
 
     def test_client_online(self, ip):
         if ip in self.last_seen:
-            last_seen_time = self.last_seen[ip]
-            if time.time() - last_seen_time < 10:  # 10秒内有消息则认为在线
+            if self.liveness.is_online(ip):
                 print(f"设备 {ip} 在线")
                 return True
             else:
@@ -162,69 +778,246 @@ class ControlServer:
 
     def ping_test(self, ip):
         result = ping_test(ip)
+        self.reachability.update({ip: (result, None)})
         logger.info(f"Ping 测试: 设备 {ip} {'在线' if result else '离线'}")
         print(f"Ping 测试: 设备 {ip} {'在线' if result else '离线'}")
 
+    def ping_all(self):
+        # 并发探测 Proj_Ip_table.json 中的所有设备，结果写入缓存供 show 使用
+        ips = [info['ip'] for info in self.client_info.values()]
+        start = time.perf_counter()
+        results = sweep(ips, timeout=self.probe_timeout)
+        elapsed = time.perf_counter() - start
+        self.reachability.update(results)
+        unreachable = sorted(ip for ip, (reachable, _) in results.items() if not reachable)
+        logger.info(f"Ping 全部设备: 共 {len(results)} 台, 可达 {len(results) - len(unreachable)} 台, "
+                    f"不可达 {len(unreachable)} 台, 耗时 {elapsed:.2f} 秒")
+        print(f"Ping 全部设备: 共 {len(results)} 台, 可达 {len(results) - len(unreachable)} 台, "
+              f"不可达 {len(unreachable)} 台, 耗时 {elapsed:.2f} 秒")
+        if unreachable:
+            print(f"不可达设备: {', '.join(unreachable)}")
+        return results
+
     def show_clients(self):
         print("\n当前客户端信息:")
         print("--------------------")
         for info in self.client_info.values():
-            last_seen = self.last_seen.get(info['ip'], 0)
-            online = "在线√" if time.time() - last_seen < 10 else "离线×"  # 10秒内有消息则认为在线
+            online = "在线√" if self.liveness.is_online(info['ip']) else "离线×"
             print(f"IP地址: {info['ip']}")
             print(f"展品名称: {info['project_name']}")
             print(f"状态: {online}")
+            cached = self.reachability.get(info['ip'])
+            if cached:
+                reachable, rtt, checked_at = cached
+                rtt_str = f", {rtt * 1000:.1f}ms" if rtt is not None else ""
+                print(f"网络: {'可达' if reachable else '不可达'}{rtt_str} "
+                      f"({int(time.time() - checked_at)} 秒前探测)")
             print("--------------------")
 
-    def save_client_log(self, client_address, log_content):
-        log_filename = f"{client_address}_{time.strftime('%Y-%m-%d_%H-%M-%S')}.log"
-        log_path = os.path.join(self.client_log_dir, log_filename)
-        with open(log_path, 'wb') as log_file:
-            log_file.write(log_content)
-        logger.info(f"已保存客户端 {client_address} 的日志文件: {log_filename}")
-        print(f"已保存客户端 {client_address} 的日志文件: {log_filename}")
+    def show_top_clients(self, n=10, window=300):
+        print(f"\n最近 {window // 60} 分钟 CPU 占用最高的 {n} 台设备:")
+        print("--------------------")
+        top = self.telemetry.top_n(n, 'cpu', window)
+        for key, cpu in top:
+            memory = self.telemetry.window_stats(key, 'memory', time.time() - window)
+            print(f"{key}  CPU 平均: {cpu}%  内存平均: {memory['avg'] if memory else '-'}%")
+        if not top:
+            print("暂无遥测数据")
+        print()
+
+    def show_client_stats(self, key):
+        latest = self.telemetry.latest(key)
+        if latest is None:
+            print(f"未找到 {key} 的遥测数据")
+            return
+        ts, cpu, memory = latest
+        print(f"\n{key} 最新: CPU {cpu:.1f}%, 内存 {memory:.1f}% "
+              f"({datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')})")
+        now = time.time()
+        for label, seconds in (("1小时", 3600), ("24小时", 86400), ("7天", 7 * 86400)):
+            for metric, name in (('cpu', 'CPU'), ('memory', '内存')):
+                stats = self.telemetry.window_stats(key, metric, now - seconds, now)
+                if stats:
+                    print(f"{label} {name}: 最小 {stats['min']}%, 最大 {stats['max']}%, "
+                          f"平均 {stats['avg']}% ({stats['count']} 条)")
+        ip = key.rsplit('@', 1)[-1]
+        if ip in self.client_metrics:
+            ts, metrics = self.client_metrics[ip]
+            print(f"附加指标 ({datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')}): "
+                  + ", ".join(f"{name} {value:g}" for name, value in sorted(metrics.items())))
+        print()
+
+    def request_client_logs(self, ip):
+        # 请求设备上传日志，保存到 clientlog/<IP>/；上传与控制指令交错进行，不会阻塞指令
+        self.log_uploads.request(ip)
+
+    def request_all_logs(self):
+        # 在线设备立即开始（受并发数和总带宽限制），离线设备在重新连接后上传
+        for ip in sorted(set(self.client_sockets) | set(self.ip_index)):
+            self.log_uploads.request(ip)
+
+    def show_log_uploads(self):
+        active, queued, waiting = self.log_uploads.status()
+        print(f"\n正在上传 ({len(active)}):")
+        for ip, written, received, elapsed in active:
+            print(f"  {ip}: 已保存 {written} 字节, 已传输 {received} 字节, {elapsed:.0f} 秒")
+        print(f"排队中 ({len(queued)}): {', '.join(queued)}")
+        print(f"等待设备上线 ({len(waiting)}): {', '.join(waiting)}")
+        print()
+
+    def show_metrics(self):
+        report = self.metrics.to_json()
+        print("\n服务器运行指标:")
+        print("--------------------")
+        for name, value in report['gauges'].items():
+            print(f"{name}: {value}")
+        for name, value in report['per_second'].items():
+            print(f"{name}: {value}/秒")
+        print(f"reconnects: {report['reconnects_per_minute']}/分钟")
+        for name, stats in report['histograms'].items():
+            if stats['count']:
+                p50, p99 = (f"<= {stats[q] * 1000:g}ms" if stats[q] is not None else "> 5s" for q in ('p50', 'p99'))
+                print(f"{name}: {stats['count']} 次, 平均 {stats['avg'] * 1000:.3f}ms, p50 {p50}, p99 {p99}")
+        print()
+
     def bocast(self,message):
-        for ip in self.client_sockets.keys():
-            self.send_to_client(ip, message)
+        """
+        向所有在线客户端广播消息：每种协议只编码一次，放入各客户端的发送队列，
+        由事件循环或发送线程并行写出，单个慢速客户端不会拖慢其他客户端
+        """
+        encoded = {False: message.encode('utf-8'), True: encode_text(message)}
+        targets = list(self.client_sockets.values())
+        result = BroadcastResult(message, len(targets))
+        for client_socket in targets:
+            decoder = self.client_decoders.get(client_socket)
+            if not self.send_bytes(client_socket, encoded[bool(decoder and decoder.framed)], result):
+                result.mark_dropped(was_queued=False)
+        result.wait(self.broadcast_wait)
+        logger.info(result.summary())
+        print(result.summary())
+        return result
+
     def send_to_client(self, ip, message):
         """
         向指定 IP 的客户端发送消息
         """
         if ip in self.client_sockets:
-            try:
-                self.client_sockets[ip].send(message.encode('utf-8'))
+            client_socket = self.client_sockets[ip]
+            if self.send_bytes(client_socket, self.encode_message(client_socket, message)):
                 logger.info(f"已发送消息到客户端 {ip}: {message}")
                 print(f"已发送消息到客户端 {ip}: {message}\n")
-            except Exception as e:
-                logger.error(f"向客户端 {ip} 发送消息时出错: {e}")
-                print(f"向客户端 {ip} 发送消息时出错: {e}")
-                # 如果发送失败，可能客户端已断开连接，从字典中移除
-                del self.client_sockets[ip]
-                if self.client_sockets[ip] in self.clients:
-                    self.clients.remove(self.client_sockets[ip])
+                return True
+            # 发送队列已满或连接已关闭，连接会被断开并在接收端清理
+            logger.error(f"向客户端 {ip} 发送消息时出错: 发送队列已满或连接已关闭")
+            print(f"向客户端 {ip} 发送消息时出错: 发送队列已满或连接已关闭")
         else:
             logger.warning(f"客户端 {ip} 不在线或未连接")
             print(f"客户端 {ip} 不在线或未连接")
-    def handle_comd_withip(self,command):
-         parts = command.split(' ', 1)
-         if len(parts) == 2:
-            ip = parts[1]
-            self.send_to_client(ip,command)
-        
+        return False
+
+    def encode_message(self, client_socket, message):
+        # 帧协议客户端发送 TEXT 帧，旧客户端仍发送纯文本
+        decoder = self.client_decoders.get(client_socket)
+        if decoder and decoder.framed:
+            return encode_text(message)
+        return message.encode('utf-8')
+
+    def send_bytes(self, client_socket, data, tracker=None):
+        # 放入客户端的发送队列后立即返回，由事件循环或发送线程写出；
+        # 返回 False 表示队列已满或连接已关闭
+        outbox = self.client_outboxes.get(client_socket)
+        if outbox is None:
+            return False
+        if not outbox.push(data, tracker):
+            self.shed_client(client_socket, "发送队列已满")
+            return False
+        self.metrics.messages_sent.inc()
+        if self.engine:
+            self.engine.kick(client_socket)
+        else:
+            self.sender_pool.kick(client_socket, outbox)
+        return True
+
+    def run_command(self, command, selector=None, timeout=None):
+        """
+        向选中的设备发送带编号的指令，等待回复或到达期限后输出每台设备的结果并返回 PendingCommand。
+        selector 为 None 时发往所有在线设备；选中但不在线的设备记为离线
+        """
+        if selector is None:
+            targets = list(self.client_sockets)
+        else:
+            try:
+                targets = self.index.select(selector)
+            except ValueError as e:
+                print(e)
+                return None
+        pending = self.send_command(command, targets, timeout)
+        pending.wait()
+        self.commands.close(pending)
+        self.show_command_result(pending)
+        return pending
+
+    def send_command(self, command, targets, timeout=None):
+        # 向 targets 中的 IP 发出指令后立即返回 PendingCommand，由调用方等待结果并 close
+        pending = self.commands.issue(command, timeout)
+        # 每种协议只编码一次：级别 5 以上的客户端收到带编号的 COMMAND 帧，其他客户端收到文本
+        encoded = {'command': encode_command(pending.id, command), 'framed': encode_text(command),
+                   'text': command.encode('utf-8')}
+        for ip in targets:
+            client_socket = self.client_sockets.get(ip)
+            if client_socket is None:
+                pending.finish(ip, OFFLINE)
+                continue
+            if self.client_levels.get(client_socket, 0) >= 5:
+                kind = 'command'
+                expected = True
+                pending.expect(ip)
+            else:
+                decoder = self.client_decoders.get(client_socket)
+                kind = 'framed' if decoder and decoder.framed else 'text'
+                expected = self.commands.expect_legacy(pending, ip)
+            if not self.send_bytes(client_socket, encoded[kind]):
+                pending.finish(ip, SEND_FAILED)
+            elif not expected:
+                pending.finish(ip, NO_REPLY)
+        return pending
+
+    def show_command_result(self, pending):
+        counts = pending.counts()
+        elapsed = max(time.time() - pending.started, 0)
+        summary = (f"指令 #{pending.id} '{pending.command}': 共 {len(pending.results)} 台, "
+                   + ", ".join(f"{state} {n}" for state, n in counts.most_common())
+                   + f", 耗时 {elapsed:.2f} 秒")
+        logger.info(summary)
+        print(f"\n{summary}")
+        print("--------------------")
+        # 未响应的设备排在前面
+        for ip, (state, reply, latency) in sorted(pending.results.items(),
+                                                  key=lambda item: (item[1][0] == ANSWERED, item[0])):
+            names = ', '.join(self.client_info[key]['project_name'] for key in sorted(self.ip_index.get(ip, ())))
+            latency = f"{latency * 1000:.1f}ms" if latency is not None else "-"
+            print(f"{ip:<16}{names or '未登记':<16}{state:<6}{reply or '-':<10}{latency}")
+        print()
+
+    def online_clients(self):
+        # [{'ip', 'names': 登记的项目名称, 'last_seen'}]，按 IP 排序
+        return [{'ip': ip, 'last_seen': self.last_seen.get(ip, 0),
+                 'names': [self.client_info[key]['project_name'] for key in sorted(self.ip_index.get(ip, ()))]}
+                for ip in sorted(self.liveness.online_ips())]
+
     def show_online_clients(self):
         print("\n当前在线客户端信息:")
         print("--------------------")
-        online_count = 0
-        for key, info in self.client_info.items():
-            ip = info['ip']
-            last_seen = self.last_seen.get(ip, 0)
-            if time.time() - last_seen < 10:  # 10秒内有消息则认为在线
-                online_count += 1
-                print(f"IP地址: {ip}")
-                print(f"展品名称: {info['project_name']}")
+        online = self.online_clients()
+        online_count = len(online)
+        for client in online:
+            last_seen = client['last_seen']
+            for name in client['names'] or ['未登记']:
+                print(f"IP地址: {client['ip']}")
+                print(f"展品名称: {name}")
                 print(f"最后活动时间: {datetime.datetime.fromtimestamp(last_seen).strftime('%Y-%m-%d %H:%M:%S')}")
                 print("--------------------")
-        
+
         if online_count == 0:
             print("当前没有在线的客户端")
         else:
@@ -233,7 +1026,51 @@ class ControlServer:
 
    
 def main():
-    server = ControlServer()
+    config = load_server_config()
+    takeover = None
+    if '--takeover' in sys.argv[1:]:
+        # 热重启: 从正在运行的旧进程接管，客户端不需要重新连接
+        path = config.get('handoff_socket')
+        if not path or not handoff_supported():
+            print("未配置 handoff_socket 或当前平台不支持热重启，正常启动")
+        else:
+            takeover = Takeover(path)
+            try:
+                takeover.receive()
+            except (OSError, ValueError) as e:
+                print(f"没有可接管的服务器 ({e})，正常启动")
+                takeover = None
+    server = ControlServer(
+        host=config.get('host', '0.0.0.0'),
+        port=config.get('port', 5000),
+        engine=config.get('engine', 'thread'),
+        workers=config.get('workers', 1),
+        outbox_max_bytes=config.get('outbox_max_bytes', 256 * 1024),
+        slow_client_timeout=config.get('slow_client_timeout', 10),
+        broadcast_wait=config.get('broadcast_wait', 2),
+        sender_threads=config.get('sender_threads', 8),
+        ping_cache_ttl=config.get('ping_cache_ttl', 60),
+        probe_timeout=config.get('probe_timeout', 1.0),
+        telemetry_dir=config.get('telemetry_dir', 'telemetry'),
+        liveness_timeout=config.get('liveness_timeout', 90),
+        liveness_groups=config.get('liveness_groups', {}),
+        registry_compact_threshold=config.get('registry_compact_threshold', 10000),
+        log_bandwidth=config.get('log_bandwidth', 2 * 1024 * 1024),
+        log_concurrency=config.get('log_concurrency', 8),
+        accept_rate=config.get('accept_rate', 200),
+        accept_burst=config.get('accept_burst', 50),
+        session_ttl=config.get('session_ttl', 600),
+        command_timeout=config.get('command_timeout', 5),
+        power_options=config.get('power', {}),
+        content_options=config.get('content', {}),
+        metrics_enabled=config.get('metrics_enabled', True),
+        metrics_host=config.get('metrics_host', '127.0.0.1'),
+        metrics_port=config.get('metrics_port', 9108),
+        handoff_path=config.get('handoff_socket'),
+        shard_options=config.get('shard', {}),
+    )
+    if takeover:
+        server.adopt(takeover)
     server.start()
 
     help_message = """
@@ -242,16 +1079,34 @@ quit - 停止服务器
 save - 保存客户端信息
 show - 显示所有客户端信息
 show-online - 显示在线客户端信息
-test <IP> - 测试指定IP的设备是否在线
+test <目标> - 测试选中的设备是否响应，等待回复后列出每台设备的结果
 test-all - 测试所有在线设备
-get <IP> - 获取指定IP的设备状态
+get <目标> - 获取选中设备的状态
 get-all - 获取所有在线设备的状态
-hello-all - 向所有在线设备发送hello指令
-shutdown-all - 向所有在线设备发送关机指令
-reboot-all - 向所有在线设备发送重启指令
-sleep-all - 向所有在线设备发送睡眠指令
-cancel-all - 向所有在线设备发送取消关机/重启指令
+hello <目标> / hello-all - 向选中 / 所有在线设备发送hello指令
+shutdown <目标> / shutdown-all - 分组分批发送关机指令，未确认的设备自动重试
+reboot <目标> / reboot-all - 分组分批发送重启指令
+wake <目标> / wake-all - 分组分批发送网络唤醒包 (需要已记录 MAC 地址)
+power-status - 显示电源操作进度
+power-cancel - 取消尚未发出的电源操作批次
+mac-scan [目标] - 查询在线设备的 MAC 地址并记录到登记表
+mac <IP> <MAC> - 手动记录设备的 MAC 地址
+sleep <目标> / sleep-all - 发送睡眠指令
+cancel <目标> / cancel-all - 发送取消关机/重启指令
+  <目标>: IP、网段 (10.0.1.0/24)、项目名称、项目名称前缀 (展厅A-*) 或 tag:标签，多个用逗号分隔
+select <目标> - 列出目标选中的设备
+tag <目标> <标签> - 给选中的设备添加标签
+untag <目标> <标签> - 移除选中设备的标签
 ping <IP> - 使用ping测试指定IP的设备是否在线
+ping-all - 并发探测所有已登记设备的网络可达性
+top [N] - 显示最近5分钟CPU占用最高的N台设备
+stats <项目名称@IP> - 显示指定设备的CPU/内存历史统计
+log <IP> - 拉取指定设备的日志到 clientlog/<IP>/ (支持断点续传)
+log-all - 拉取所有设备的日志
+log-status - 显示日志上传进度
+push <目录> <目标> [项目名称] - 把目录同步到选中设备的项目目录 (默认为设备当前的项目)，只传输变化的数据块
+push-status - 显示内容推送进度
+metrics - 显示服务器运行指标 (也可通过 HTTP 端点 /metrics 或 /metrics.json 获取)
 help - 显示此帮助信息
 """
 
@@ -268,24 +1123,53 @@ help - 显示此帮助信息
                 server.show_clients()
             elif command.lower() == 'show-online':
                 server.show_online_clients()
-            elif command.lower() == 'shutdown-all':
-                server.bocast("shutdown")
-            elif command.lower() == 'reboot-all':
-                server.bocast("reboot")
-            elif command.lower() == 'sleep-all':
-                server.bocast("sleep")
-            elif command.lower() == 'cancel-all':
-                server.bocast("cancel")
-            elif command.lower() == 'hello-all':
-                server.bocast("hello")   
-            elif command.lower() == 'test-all':
-                server.bocast("test")
-            elif command.lower() == 'get-all':
-                server.bocast("get")
-            elif command.lower().startswith('test '):
-                server.handle_comd_withip(command)
-            elif command.lower().startswith('get '):
-                server.handle_comd_withip(command)
+            elif command.lower() in ('shutdown-all', 'reboot-all', 'wake-all'):
+                server.power_operation(command.lower()[:-4])
+            elif command.split(' ', 1)[0].lower() in ('shutdown', 'reboot', 'wake') and ' ' in command:
+                action, selector = command.split(' ', 1)
+                server.power_operation(action.lower(), selector.strip())
+            elif command.lower() == 'power-status':
+                server.show_power_status()
+            elif command.lower() == 'power-cancel':
+                server.power.cancel()
+            elif command.lower() == 'mac-scan' or command.lower().startswith('mac-scan '):
+                parts = command.split(' ', 1)
+                server.scan_macs(parts[1].strip() if len(parts) == 2 else None)
+            elif command.lower().startswith('mac '):
+                parts = command.split()
+                if len(parts) == 3:
+                    server.set_mac(parts[1], parts[2])
+                else:
+                    print("格式错误。正确格式: mac <IP> <MAC>")
+            elif command.lower() in ('sleep-all', 'cancel-all', 'hello-all', 'test-all', 'get-all'):
+                server.run_command(command.lower()[:-4])
+            elif command.split(' ', 1)[0].lower() in ('test', 'get', 'hello', 'sleep', 'cancel') and ' ' in command:
+                action, selector = command.split(' ', 1)
+                server.run_command(action.lower(), selector.strip())
+            elif command.lower().startswith('select '):
+                server.show_selection(command.split(' ', 1)[1].strip())
+            elif command.lower().startswith('tag ') or command.lower().startswith('untag '):
+                parts = command.split()
+                if len(parts) == 3:
+                    server.tag_clients(parts[1], parts[2], remove=parts[0].lower() == 'untag')
+                else:
+                    print("格式错误。正确格式: tag <目标> <标签>")
+            elif command.lower() == 'top' or command.lower().startswith('top '):
+                parts = command.split()
+                if len(parts) == 2 and parts[1].isdigit():
+                    server.show_top_clients(int(parts[1]))
+                else:
+                    server.show_top_clients()
+            elif command.lower().startswith('stats '):
+                server.show_client_stats(command.split(' ', 1)[1].strip())
+            elif command.lower() == 'log-all':
+                server.request_all_logs()
+            elif command.lower() == 'log-status':
+                server.show_log_uploads()
+            elif command.lower().startswith('log '):
+                server.request_client_logs(command.split(' ', 1)[1].strip())
+            elif command.lower() == 'ping-all':
+                threading.Thread(target=server.ping_all).start()
             elif command.lower().startswith('ping '):
                 parts = command.split(' ', 1)
                 if len(parts) == 2:
@@ -293,6 +1177,16 @@ help - 显示此帮助信息
                     threading.Thread(target=server.ping_test, args=(ip,)).start()
                 else:
                     print("格式错误。正确格式: ping <IP>")
+            elif command.lower().startswith('push '):
+                parts = command.split()
+                if len(parts) in (3, 4):
+                    server.push_content(parts[1], parts[2], parts[3] if len(parts) == 4 else '')
+                else:
+                    print("格式错误。正确格式: push <目录> <目标> [项目名称]")
+            elif command.lower() == 'push-status':
+                server.show_content_pushes()
+            elif command.lower() == 'metrics':
+                server.show_metrics()
             elif command.lower() == 'help':
                 print(help_message)
             else:
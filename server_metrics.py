@@ -0,0 +1,243 @@
+import bisect
+import collections
+import json
+import threading
+import time
+import logging
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger('server')
+
+PREFIX = 'control_server_'
+# 延迟直方图的桶上限 (秒)，10 微秒到 5 秒
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self.lock:
+            self.value += n
+
+
+class Histogram:
+    """
+    固定分桶的直方图：observe 只做一次二分查找和几次加法，
+    分位数按所在桶的上限估计
+    """
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个桶为 +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q, counts, count):
+        # 没有数据或落在最大桶之外时返回 None
+        rank = q * count
+        seen = 0
+        for index, n in enumerate(counts[:-1]):
+            seen += n
+            if count and seen >= rank:
+                return self.buckets[index]
+        return None
+
+
+class _Disabled:
+    # 关闭指标时替代 Counter / Histogram，调用开销只剩一次空函数调用
+    def inc(self, n=1):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+DISABLED = _Disabled()
+
+
+class ServerMetrics:
+    """
+    ControlServer 的运行指标：计数器和延迟直方图在热路径上更新，
+    连接数、发送队列深度等在抓取时才计算。start 后在本地 HTTP 端口提供
+    /metrics (Prometheus 文本格式) 和 /metrics.json
+    """
+    def __init__(self, server, enabled=True, window=60):
+        self.server = server
+        self.enabled = enabled
+        self.window = window  # 计算每秒速率所用的时间窗口 (秒)
+        self.started = time.time()
+        self.counters = [
+            Counter('connections_total', "接受的客户端连接数"),
+            Counter('reconnects_total', "已连接过的设备重新连接的次数"),
+            Counter('messages_received_total', "收到的消息数"),
+            Counter('bytes_received_total', "收到的字节数"),
+            Counter('messages_sent_total', "放入发送队列的消息数"),
+            Counter('bytes_sent_total', "写入 socket 的字节数"),
+        ]
+        self.histograms = [
+            Histogram('status_parse_seconds', "parse_and_save_client_info 解析文本状态的耗时"),
+            Histogram('status_ingest_seconds', "ingest_status 处理二进制状态的耗时"),
+            Histogram('send_latency_seconds', "消息从放入发送队列到完全写入 socket 的时间"),
+        ]
+        named = {metric.name: metric for metric in self.counters + self.histograms}
+        if not enabled:
+            named = {name: DISABLED for name in named}
+        self.connections = named['connections_total']
+        self.reconnects = named['reconnects_total']
+        self.messages_received = named['messages_received_total']
+        self.bytes_received = named['bytes_received_total']
+        self.messages_sent = named['messages_sent_total']
+        self.bytes_sent = named['bytes_sent_total']
+        self.parse_seconds = named['status_parse_seconds']
+        self.ingest_seconds = named['status_ingest_seconds']
+        self.send_latency = named['send_latency_seconds']
+        self.history = collections.deque()  # (时间, {计数器名: 值})，用于计算速率
+        self.history_lock = threading.Lock()
+        self.http = None
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def gauges(self):
+        server = self.server
+        outboxes = list(server.client_outboxes.values())
+        sizes = [outbox.size for outbox in outboxes]
+        return {
+            'connected_clients': (len(server.client_sockets), "当前连接的客户端数"),
+            'online_clients': (len(server.liveness.online_ips()), "判定为在线的设备数"),
+            'outbound_queue_bytes': (sum(sizes), "所有发送队列中待发送的字节数"),
+            'outbound_queue_max_bytes': (max(sizes, default=0), "单个发送队列的最大积压字节数"),
+            'outbound_backlogged': (sum(1 for size in sizes if size), "发送队列有积压的连接数"),
+            'uptime_seconds': (round(time.time() - self.started, 1), "服务器运行时间"),
+        }
+
+    def sample(self):
+        # 记录一次计数器快照，丢弃窗口之外的旧快照
+        now = time.monotonic()
+        values = {counter.name: counter.value for counter in self.counters}
+        with self.history_lock:
+            self.history.append((now, values))
+            while len(self.history) > 2 and now - self.history[1][0] >= self.window:
+                self.history.popleft()
+        return now, values
+
+    def rates(self):
+        # 最近 window 秒内各计数器的每秒增量
+        now, values = self.sample()
+        with self.history_lock:
+            then, old = self.history[0]
+        elapsed = now - then
+        if elapsed <= 0:
+            return {name: 0.0 for name in values}
+        return {name: round((values[name] - old[name]) / elapsed, 2) for name in values}
+
+    def to_json(self):
+        rates = self.rates()
+        histograms = {}
+        for histogram in self.histograms:
+            counts, total, count = histogram.snapshot()
+            histograms[histogram.name] = {
+                'count': count,
+                'avg': total / count if count else None,
+                'p50': histogram.quantile(0.5, counts, count),
+                'p99': histogram.quantile(0.99, counts, count),
+            }
+        return {
+            'enabled': self.enabled,
+            'counters': {counter.name: counter.value for counter in self.counters},
+            'per_second': {name.replace('_total', ''): rate for name, rate in rates.items()},
+            'reconnects_per_minute': round(rates['reconnects_total'] * 60, 2),
+            'gauges': {name: value for name, (value, _) in self.gauges().items()},
+            'histograms': histograms,
+        }
+
+    def to_prometheus(self):
+        lines = []
+        for counter in self.counters:
+            name = PREFIX + counter.name
+            lines += [f"# HELP {name} {counter.help}", f"# TYPE {name} counter", f"{name} {counter.value}"]
+        for gauge, (value, help_text) in self.gauges().items():
+            name = PREFIX + gauge
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+        for histogram in self.histograms:
+            name = PREFIX + histogram.name
+            counts, total, count = histogram.snapshot()
+            lines += [f"# HELP {name} {histogram.help}", f"# TYPE {name} histogram"]
+            cumulative = 0
+            for bound, n in zip(histogram.buckets + ('+Inf',), counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+            lines += [f"{name}_sum {total}", f"{name}_count {count}"]
+        return '\n'.join(lines) + '\n'
+
+    def start(self, host='127.0.0.1', port=None):
+        # port 为 None 时只采集不提供 HTTP 端点
+        self._stop.clear()
+        self.sample()
+        self._sampler = threading.Thread(target=self._run_sampler, name='metrics-sampler', daemon=True)
+        self._sampler.start()
+        if port is None:
+            return
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/metrics':
+                    body = metrics.to_prometheus().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif path == '/metrics.json':
+                    body = json.dumps(metrics.to_json(), ensure_ascii=False).encode('utf-8')
+                    content_type = 'application/json; charset=utf-8'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.http = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            logger.error(f"指标端点无法监听 {host}:{port}: {e}")
+            print(f"指标端点无法监听 {host}:{port}: {e}")
+            return
+        self.http.daemon_threads = True
+        threading.Thread(target=self.http.serve_forever, name='metrics-http', daemon=True).start()
+        logger.info(f"指标端点: http://{host}:{self.http.server_address[1]}/metrics")
+        print(f"指标端点: http://{host}:{self.http.server_address[1]}/metrics")
+
+    def _run_sampler(self):
+        # 没有人抓取时也定期记录快照，保证速率窗口有起点
+        while not self._stop.wait(5):
+            self.sample()
+
+    def stop(self):
+        self._stop.set()
+        if self.http:
+            self.http.shutdown()
+            self.http.server_close()
+            self.http = None
@@ -0,0 +1,188 @@
+import bisect
+import hashlib
+import json
+import socket
+import threading
+import logging
+
+logger = logging.getLogger('server')
+
+
+def parse_address(name, default_port=5000):
+    # 'host:port' -> (host, port)
+    host, _, port = name.rpartition(':')
+    if not host:
+        return port, default_port
+    return host, int(port)
+
+
+class HashRing:
+    """
+    一致性哈希环。每个分片 (以客户端连接的 'host:port' 命名) 在环上有 replicas 个虚拟节点，
+    设备 (project@ip) 归属于顺时针方向的第一个分片。分片故障时只有它的设备改为归属
+    环上的下一个分片，其余设备不动；客户端和服务器用同一份分片列表算出同样的结果
+    """
+    def __init__(self, nodes=(), replicas=64):
+        self.replicas = replicas
+        self.nodes = []
+        self._points = []  # 排序的哈希值
+        self._owners = []  # 与 _points 一一对应的分片
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(text):
+        return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big')
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for i in range(self.replicas):
+            point = self._hash(f'{node}#{i}')
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node):
+        if node not in self.nodes:
+            return
+        self.nodes.remove(node)
+        kept = [(p, o) for p, o in zip(self._points, self._owners) if o != node]
+        self._points = [p for p, _ in kept]
+        self._owners = [o for _, o in kept]
+
+    def preference(self, key):
+        # 从 key 的位置顺时针经过的各个分片 (不重复)，第一个就是归属分片
+        if not self._points:
+            return []
+        start = bisect.bisect(self._points, self._hash(key))
+        result = []
+        for i in range(len(self._points)):
+            owner = self._owners[(start + i) % len(self._points)]
+            if owner not in result:
+                result.append(owner)
+                if len(result) == len(self.nodes):
+                    break
+        return result
+
+    def owner(self, key, alive=None):
+        # alive: 当前可用的分片集合，None 表示都可用
+        for node in self.preference(key):
+            if alive is None or node in alive:
+                return node
+        return None
+
+
+def send_json(stream, message):
+    stream.write(json.dumps(message, ensure_ascii=False).encode('utf-8') + b'\n')
+    stream.flush()
+
+
+def recv_json(stream):
+    line = stream.readline()
+    if not line:
+        raise ConnectionError("连接已关闭")
+    return json.loads(line)
+
+
+class ShardAgent:
+    """
+    分片模式下服务器一侧的管理端口：协调器通过它转发指令、汇总在线设备，
+    并在分片上下线时下发可用分片列表。请求和回复都是一行 JSON
+    """
+    def __init__(self, server, name, servers, admin_host='127.0.0.1', admin_port=None, replicas=64):
+        self.server = server
+        self.name = name  # 本分片在 servers 中的名称
+        self.ring = HashRing(servers, replicas)
+        self.alive = set(servers)  # 协调器未下发之前假定所有分片都可用
+        self.admin_host = admin_host
+        self.admin_port = admin_port
+        self.sock = None
+        self._thread = None
+
+    def start(self):
+        if self.name not in self.ring.nodes:
+            logger.warning(f"分片名称 {self.name} 不在 servers 列表中")
+        if self.admin_port is None:
+            return
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.admin_host, self.admin_port))
+        self.admin_port = self.sock.getsockname()[1]
+        self.sock.listen(8)
+        self._thread = threading.Thread(target=self._accept, name='shard-admin', daemon=True)
+        self._thread.start()
+        logger.info(f"分片 {self.name} 的管理端口: {self.admin_host}:{self.admin_port}")
+        print(f"分片 {self.name} 的管理端口: {self.admin_host}:{self.admin_port}")
+
+    def stop(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except (OSError, AttributeError):
+                return  # 已关闭
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        stream = conn.makefile('rwb')
+        try:
+            while True:
+                request = recv_json(stream)
+                try:
+                    response = self.handle(request)
+                except Exception as e:
+                    logger.error(f"处理协调器请求 {request.get('op')} 时出错: {e}")
+                    response = {'error': str(e)}
+                send_json(stream, response)
+        except (OSError, ValueError):
+            pass
+        finally:
+            stream.close()
+            conn.close()
+
+    def handle(self, request):
+        op = request.get('op')
+        server = self.server
+        if op == 'ping':
+            return {'name': self.name, 'connections': len(server.client_sockets),
+                    'online': server.liveness.online_count()}
+        if op == 'online':
+            return {'clients': server.online_clients()}
+        if op == 'send':
+            return {'sent': server.send_to_client(request['ip'], request['message'])}
+        if op == 'bocast':
+            result = server.bocast(request['message'])
+            return {'total': result.total, 'delivered': result.delivered, 'queued': result.queued,
+                    'dropped': result.dropped}
+        if op == 'members':
+            return {'moved': self.set_alive(request['alive'])}
+        return {'error': f"未知请求: {op}"}
+
+    def owner(self, key):
+        return self.ring.owner(key, self.alive)
+
+    def set_alive(self, alive):
+        """
+        更新可用分片列表。已连接的设备若改为归属其他分片 (例如故障的分片恢复)，
+        通知它断开后按哈希环重新选择服务器；返回通知的设备数
+        """
+        self.alive = set(alive)
+        server = self.server
+        moved = 0
+        for ip, client_socket in list(server.client_sockets.items()):
+            state = server.client_states.get(client_socket)
+            if state is None:
+                continue  # 还没有上报状态，不知道项目名称
+            owner = self.owner(f"{state['project_name']}@{ip}")
+            if owner is not None and owner != self.name:
+                server.send_bytes(client_socket, server.encode_message(client_socket, 'rebalance'))
+                moved += 1
+        logger.info(f"可用分片: {', '.join(sorted(self.alive))}，{moved} 台设备改由其他分片负责")
+        print(f"可用分片: {', '.join(sorted(self.alive))}，{moved} 台设备改由其他分片负责")
+        return moved
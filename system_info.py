@@ -1,11 +1,41 @@
-import psutil
-import datetime
 import os
+import socket
 import json
+import time
+from protocol import format_status
 
-def load_config():
+CONFIG_FILE = 'client_config.json'
+# psutil 导入较慢，在第一次采集时才导入 (见各采集插件)，客户端启动后可以先连接服务器
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class CachedFact:
+    """
+    静态信息缓存：依赖的文件或目录的 mtime 没有变化时直接返回上次的结果，
+    只需一次 stat 而不必重新读取和解析
+    """
+    def __init__(self, compute):
+        self.compute = compute
+        self.stamp = None
+        self.value = None
+
+    def get(self, *paths):
+        stamp = tuple((path, _mtime(path)) for path in paths)
+        if stamp != self.stamp:
+            self.value = self.compute(*paths)
+            self.stamp = stamp
+        return self.value
+
+
+def _read_config(path):
     try:
-        with open('client_config.json', 'r') as config_file:
+        with open(path, 'r') as config_file:
             return json.load(config_file)
     except FileNotFoundError:
         print("未找到配置文件，使用默认设置")
@@ -14,21 +44,218 @@ def load_config():
         print("配置文件格式错误，使用默认设置")
         return {"pssoft_path": "D:\\pssoft"}
 
-def get_project_name():
-    config = load_config()
-    pssoft_path = config.get("pssoft_path", "D:\\pssoft")
+
+def _list_project(pssoft_path):
     try:
-        folders = [f for f in os.listdir(pssoft_path) if os.path.isdir(os.path.join(pssoft_path, f))]
+        # 以 . 开头的是内容同步的暂存目录等，不是项目
+        folders = [f for f in os.listdir(pssoft_path)
+                   if not f.startswith('.') and os.path.isdir(os.path.join(pssoft_path, f))]
         return folders[0] if folders else "NoProjects"
     except Exception:
         return "NoProjects"
 
+
+_config = CachedFact(_read_config)
+_project_name = CachedFact(_list_project)
+
+
+def load_config():
+    # 配置文件修改后自动重新读取
+    return _config.get(CONFIG_FILE)
+
+def get_project_name():
+    # pssoft 目录增删子目录时其 mtime 会变化，此时才重新扫描
+    pssoft_path = load_config().get("pssoft_path", "D:\\pssoft")
+    return _project_name.get(pssoft_path)
+
+
+class Collector:
+    """
+    采集插件基类。interval 秒内重复采样直接返回上次的读数 (0 表示每次都采集)，
+    collect 返回 {指标名: 数值}
+    """
+    name = ''
+    interval = 0
+
+    def __init__(self, interval=None):
+        if interval is not None:
+            self.interval = interval
+        self.last_time = None
+        self.last_value = {}
+
+    def sample(self, now):
+        if self.last_time is None or now - self.last_time >= self.interval:
+            self.last_value = self.collect(now)
+            self.last_time = now
+        return self.last_value
+
+    def collect(self, now):
+        raise NotImplementedError
+
+
+class CpuCollector(Collector):
+    name = 'cpu'
+
+    def collect(self, now):
+        import psutil
+        return {'cpu': psutil.cpu_percent()}
+
+
+class MemoryCollector(Collector):
+    name = 'memory'
+
+    def collect(self, now):
+        import psutil
+        return {'memory': psutil.virtual_memory().percent}
+
+
+class BootTimeCollector(Collector):
+    # 启动时间在系统运行期间不变，只读取一次
+    name = 'boot_time'
+    interval = float('inf')
+
+    def collect(self, now):
+        import psutil
+        return {'boot_time': psutil.boot_time()}
+
+
+class DiskCollector(Collector):
+    name = 'disk'
+    interval = 60
+
+    def __init__(self, interval=None, path='C:\\'):
+        super().__init__(interval)
+        self.path = path
+
+    def collect(self, now):
+        import psutil
+        return {'disk': psutil.disk_usage(self.path).percent}
+
+
+class NetworkCollector(Collector):
+    # 两次采样之间的平均收发速率 (字节/秒)
+    name = 'network'
+    interval = 5
+
+    def __init__(self, interval=None):
+        super().__init__(interval)
+        self.previous = None
+
+    def collect(self, now):
+        import psutil
+        counters = psutil.net_io_counters()
+        previous, self.previous = self.previous, (now, counters.bytes_sent, counters.bytes_recv)
+        if previous is None or now <= previous[0]:
+            return {'net_sent': 0.0, 'net_recv': 0.0}
+        elapsed = now - previous[0]
+        return {'net_sent': round((counters.bytes_sent - previous[1]) / elapsed, 1),
+                'net_recv': round((counters.bytes_recv - previous[2]) / elapsed, 1)}
+
+
+class ProcessCollector(Collector):
+    """
+    展项程序的进程状态：运行中的进程数、CPU% 合计和内存 (MB) 合计。
+    每个采集周期都重新遍历进程列表，已知 pid 沿用缓存的进程对象，
+    这样 cpu_percent 能按上次采集计算占用率
+    """
+    name = 'process'
+    interval = 30
+
+    def __init__(self, interval=None, names=()):
+        super().__init__(interval)
+        self.names = {name.lower() for name in names}
+        self.processes = []
+
+    def collect(self, now):
+        import psutil
+        known = {p.pid: p for p in self.processes if p.is_running()}
+        alive = [known.get(p.pid, p) for p in psutil.process_iter(['name'])
+                 if (p.info['name'] or '').lower() in self.names]
+        self.processes = alive
+        cpu = 0.0
+        memory = 0
+        for process in alive:
+            try:
+                cpu += process.cpu_percent()
+                memory += process.memory_info().rss
+            except psutil.Error:
+                pass
+        return {'app_running': len(alive), 'app_cpu': cpu, 'app_memory': round(memory / 1048576, 1)}
+
+
+COLLECTORS = {collector.name: collector for collector in
+              (CpuCollector, MemoryCollector, BootTimeCollector, DiskCollector, NetworkCollector,
+               ProcessCollector)}
+
+
+class MetricsCollector:
+    """
+    按各自的采样间隔运行一组采集插件，并把最新读数合并为一份报告
+    """
+    def __init__(self, collectors):
+        self.collectors = collectors
+        self.errors = {}  # 插件名 -> 最近一次出错信息
+
+    def sample(self, now=None):
+        # 插件出错时沿用它上次的读数 (下次采样会重试)；状态上报必需的字段没有读数时用默认值，
+        # 否则 encode_status / format_status 会因缺少字段而失败
+        now = time.time() if now is None else now
+        report = {}
+        for collector in self.collectors:
+            try:
+                report.update(collector.sample(now))
+            except Exception as e:
+                self.errors[collector.name] = str(e)
+                report.update(collector.last_value)
+        report.setdefault('cpu', 0.0)
+        report.setdefault('memory', 0.0)
+        if 'boot_time' not in report:
+            report['boot_time'] = now - time.monotonic()  # 单调时钟从开机开始计时，用来估算启动时间
+        return report
+
+
+def build_collectors(config):
+    # config 中的 "collectors": {插件名: {"interval": 秒, 其他参数...}}，
+    # 设为 false 可关闭插件；cpu / memory / boot_time 是状态上报必需的，总是启用
+    settings = {'disk': {}, 'network': {}}
+    settings.update(config.get('collectors', {}))
+    for required in ('cpu', 'memory', 'boot_time'):
+        settings[required] = settings.get(required) or {}
+    collectors = []
+    for name, options in settings.items():
+        if options is False or name not in COLLECTORS:
+            continue
+        if name == 'process' and not options.get('names'):
+            continue
+        collectors.append(COLLECTORS[name](**options))
+    return MetricsCollector(collectors)
+
+
+_default_metrics = None
+
+
+def get_system_status(client_ip, project_name, metrics=None):
+    # 以数值形式返回状态，供二进制协议直接编码；除基本字段外还包含各插件的附加指标
+    global _default_metrics
+    if metrics is None:
+        if _default_metrics is None:
+            _default_metrics = build_collectors(load_config())
+        metrics = _default_metrics
+    status = metrics.sample()
+    status['ip'] = client_ip
+    status['project_name'] = project_name
+    status['uptime'] = time.time() - status['boot_time']
+    return status
+
+def get_mac_address(client_ip):
+    # 返回 client_ip 所在网卡的 MAC 地址 (aa:bb:cc:dd:ee:ff)，找不到时返回 None
+    import psutil
+    for addresses in psutil.net_if_addrs().values():
+        if any(a.family == socket.AF_INET and a.address == client_ip for a in addresses):
+            for a in addresses:
+                if a.family == psutil.AF_LINK and a.address:
+                    return a.address.replace('-', ':').lower()
+    return None
+
 def get_system_info(client_ip, project_name):
-    cpu_percent = psutil.cpu_percent()
-    memory = psutil.virtual_memory()
-    memory_percent = memory.percent
-    boot_time = datetime.datetime.fromtimestamp(psutil.boot_time()).strftime("%Y-%m-%d %H:%M:%S")
-    uptime = datetime.datetime.now() - datetime.datetime.fromtimestamp(psutil.boot_time())
-    uptime_str = str(uptime).split('.')[0]
-
-    return f"IP: {client_ip}, 项目名称: {project_name}, CPU: {cpu_percent}%, 内存: {memory_percent}%, 启动时间: {boot_time}, 运行时长: {uptime_str}"
+    return format_status(get_system_status(client_ip, project_name))
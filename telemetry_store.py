@@ -0,0 +1,393 @@
+"""
+服务器端的客户端遥测时序存储
+
+最近的数据保存在每个客户端一个的环形缓冲区 (array) 中；历史数据按块压缩后
+追加写入 telemetry/ 目录下按天划分的段文件 (YYYY-MM-DD.seg)，同时写入一份
+只含块头的索引文件 (YYYY-MM-DD.idx)。块头带有 CPU / 内存的最小、最大值和总和，
+查询长时间窗口时完整落在窗口内的块无需解压。
+"""
+import array
+import bisect
+import collections
+import datetime
+import heapq
+import os
+import struct
+import threading
+import time
+import zlib
+
+METRICS = ('cpu', 'memory')
+
+BLOCK_MAGIC = b'TS'
+# 魔数, key 长度, 记录数, 压缩数据长度, 起止时间戳, CPU 最小/最大/总和, 内存最小/最大/总和
+# (百分比均以 0.1% 为单位)
+BLOCK_HEADER = struct.Struct('!2sHIIddHHdHHd')
+INDEX_OFFSET = struct.Struct('!Q')
+
+
+class Block:
+    __slots__ = ('key', 'count', 't_min', 't_max', 'stats', 'path', 'offset', 'length')
+
+    def __init__(self, key, count, t_min, t_max, stats, path, offset, length):
+        self.key = key
+        self.count = count
+        self.t_min = t_min
+        self.t_max = t_max
+        self.stats = stats  # {'cpu': (min, max, sum), 'memory': (min, max, sum)}，单位 0.1%
+        self.path = path
+        self.offset = offset  # 压缩数据在段文件中的位置
+        self.length = length
+
+
+def _encode_block(key, records):
+    t_min = records[0][0]
+    t_max = records[-1][0]
+    offsets = array.array('I', (int((ts - t_min) * 1000) for ts, _, _ in records))
+    cpu = array.array('H', (round(c * 10) for _, c, _ in records))
+    memory = array.array('H', (round(m * 10) for _, _, m in records))
+    if offsets.itemsize != 4 or cpu.itemsize != 2:
+        raise RuntimeError("当前平台的 array 类型大小不符合存储格式")
+    payload = zlib.compress(offsets.tobytes() + cpu.tobytes() + memory.tobytes())
+    key_bytes = key.encode('utf-8')
+    header = BLOCK_HEADER.pack(BLOCK_MAGIC, len(key_bytes), len(records), len(payload), t_min, t_max,
+                               min(cpu), max(cpu), float(sum(cpu)),
+                               min(memory), max(memory), float(sum(memory)))
+    return header + key_bytes, payload
+
+
+def _decode_payload(block, payload):
+    data = zlib.decompress(payload)
+    offsets = array.array('I')
+    offsets.frombytes(data[:block.count * 4])
+    cpu = array.array('H')
+    cpu.frombytes(data[block.count * 4:block.count * 6])
+    memory = array.array('H')
+    memory.frombytes(data[block.count * 6:block.count * 8])
+    timestamps = [block.t_min + offset / 1000 for offset in offsets]
+    return timestamps, {'cpu': cpu, 'memory': memory}
+
+
+def _parse_header(data, offset):
+    fields = BLOCK_HEADER.unpack_from(data, offset)
+    if fields[0] != BLOCK_MAGIC:
+        raise ValueError("遥测数据块格式错误")
+    key_start = offset + BLOCK_HEADER.size
+    key = data[key_start:key_start + fields[1]].decode('utf-8')
+    return fields, key, key_start + fields[1]
+
+
+class SeriesRing:
+    """
+    单个客户端最近 capacity 条记录的环形缓冲区，时间戳单调递增
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.ts = array.array('d', bytes(8 * capacity))
+        self.values = {metric: array.array('f', bytes(4 * capacity)) for metric in METRICS}
+        self.head = 0  # 下一条记录写入的位置
+        self.count = 0
+
+    def append(self, ts, cpu, memory):
+        self.ts[self.head] = ts
+        self.values['cpu'][self.head] = cpu
+        self.values['memory'][self.head] = memory
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def oldest(self):
+        if self.count == 0:
+            return None
+        return self.ts[0] if self.count < self.capacity else self.ts[self.head]
+
+    def latest(self):
+        if self.count == 0:
+            return None
+        i = (self.head - 1) % self.capacity
+        return self.ts[i], self.values['cpu'][i], self.values['memory'][i]
+
+    def ranges(self, start, end):
+        # 返回时间在 [start, end] 内的记录所在的物理下标区间，按时间顺序
+        if self.count < self.capacity:
+            segments = [(0, self.count)]
+        else:
+            segments = [(self.head, self.capacity), (0, self.head)]
+        result = []
+        for lo, hi in segments:
+            a = bisect.bisect_left(self.ts, start, lo, hi)
+            b = bisect.bisect_right(self.ts, end, lo, hi)
+            if a < b:
+                result.append((a, b))
+        return result
+
+
+class TelemetryStore:
+    def __init__(self, directory='telemetry', ring_capacity=2880, block_records=240,
+                 max_pending_age=3600, flush_interval=60, index_cache_days=31):
+        self.directory = directory
+        self.ring_capacity = ring_capacity  # 默认 30 秒一条时约 24 小时
+        self.block_records = block_records  # 每个客户端积累多少条写一个块
+        self.max_pending_age = max_pending_age  # 未满一块的数据最多在内存中停留的秒数
+        self.flush_interval = flush_interval
+        self.index_cache_days = index_cache_days
+        self.rings = {}  # key -> SeriesRing
+        self.pending = {}  # key -> 尚未写入磁盘的记录列表 [(ts, cpu, memory)]
+        self.lock = threading.RLock()
+        self._write_lock = threading.Lock()  # 段文件只允许一个线程追加
+        self._day_indexes = collections.OrderedDict()  # 'YYYY-MM-DD' -> {key: [Block]}
+        self._stop = threading.Event()
+        self._flusher = None
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        self._flusher = threading.Thread(target=self._flush_loop, name='telemetry-flush', daemon=True)
+        self._flusher.start()
+
+    def close(self):
+        self._stop.set()
+        if self._flusher:
+            self._flusher.join(timeout=5)
+        self.flush(force=True)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    # ---- 写入 ----
+
+    def append(self, key, ts, cpu, memory):
+        with self.lock:
+            ring = self.rings.get(key)
+            if ring is None:
+                ring = self.rings[key] = SeriesRing(self.ring_capacity)
+            elif ts <= ring.latest()[0]:
+                return  # 丢弃乱序或重复的记录，保持时间戳单调递增
+            ring.append(ts, cpu, memory)
+            self.pending.setdefault(key, []).append((ts, cpu, memory))
+
+    def recent(self, window):
+        # 各客户端最近 window 秒的记录 {key: [(ts, cpu, memory)]}，热重启时交给新进程
+        start = time.time() - window
+        result = {}
+        with self.lock:
+            for key, ring in self.rings.items():
+                records = []
+                for lo, hi in ring.ranges(start, float('inf')):
+                    records += zip(ring.ts[lo:hi], ring.values['cpu'][lo:hi], ring.values['memory'][lo:hi])
+                if records:
+                    result[key] = [(ts, round(cpu, 1), round(memory, 1)) for ts, cpu, memory in records]
+        return result
+
+    def restore(self, recent):
+        # 只放回内存中的环形缓冲区；这些记录旧进程已经写入磁盘
+        with self.lock:
+            for key, records in recent.items():
+                ring = self.rings.get(key)
+                if ring is None:
+                    ring = self.rings[key] = SeriesRing(self.ring_capacity)
+                for ts, cpu, memory in records:
+                    if ring.count == 0 or ts > ring.latest()[0]:
+                        ring.append(ts, cpu, memory)
+
+    def flush(self, force=False):
+        now = time.time()
+        with self.lock:
+            due = {key: records for key, records in self.pending.items()
+                   if force or len(records) >= self.block_records
+                   or now - records[0][0] >= self.max_pending_age}
+            for key in due:
+                del self.pending[key]
+        by_day = collections.defaultdict(list)
+        for key, records in due.items():
+            for i in range(0, len(records), self.block_records):
+                chunk = records[i:i + self.block_records]
+                by_day[self._day_of(chunk[0][0])].append((key, chunk))
+        with self._write_lock:
+            for day, blocks in by_day.items():
+                self._write_blocks(day, blocks)
+
+    def _write_blocks(self, day, blocks):
+        seg_path = os.path.join(self.directory, f'{day}.seg')
+        idx_path = os.path.join(self.directory, f'{day}.idx')
+        seg_data = bytearray()
+        idx_data = bytearray()
+        with open(seg_path, 'ab') as seg:
+            base = seg.tell()
+            written = []
+            for key, records in blocks:
+                header, payload = _encode_block(key, records)
+                offset = base + len(seg_data)
+                seg_data += header + payload
+                idx_data += INDEX_OFFSET.pack(offset) + header
+                written.append((offset, header))
+            seg.write(seg_data)
+        with open(idx_path, 'ab') as idx:
+            idx.write(idx_data)
+        # 已经加载的当天索引同步更新
+        with self.lock:
+            index = self._day_indexes.get(day)
+            if index is not None:
+                for offset, header in written:
+                    block = self._block_from_header(header, 0, seg_path, offset)[0]
+                    index.setdefault(block.key, []).append(block)
+
+    @staticmethod
+    def _day_of(ts):
+        return datetime.date.fromtimestamp(ts).isoformat()
+
+    @staticmethod
+    def _block_from_header(data, offset, seg_path, seg_offset):
+        fields, key, end = _parse_header(data, offset)
+        _, _, count, length, t_min, t_max, c_min, c_max, c_sum, m_min, m_max, m_sum = fields
+        block = Block(key, count, t_min, t_max,
+                      {'cpu': (c_min, c_max, c_sum), 'memory': (m_min, m_max, m_sum)},
+                      seg_path, seg_offset + (end - offset), length)
+        return block, end
+
+    def _day_index(self, day):
+        with self.lock:
+            index = self._day_indexes.get(day)
+            if index is not None:
+                self._day_indexes.move_to_end(day)
+                return index
+            index = {}
+            seg_path = os.path.join(self.directory, f'{day}.seg')
+            try:
+                with open(os.path.join(self.directory, f'{day}.idx'), 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                data = b''
+            offset = 0
+            while offset < len(data):
+                (seg_offset,) = INDEX_OFFSET.unpack_from(data, offset)
+                block, offset = self._block_from_header(data, offset + INDEX_OFFSET.size,
+                                                        seg_path, seg_offset)
+                index.setdefault(block.key, []).append(block)
+            self._day_indexes[day] = index
+            while len(self._day_indexes) > self.index_cache_days:
+                self._day_indexes.popitem(last=False)
+            return index
+
+    def _read_block(self, block):
+        with open(block.path, 'rb') as f:
+            f.seek(block.offset)
+            return _decode_payload(block, f.read(block.length))
+
+    def _disk_blocks(self, key, start, end):
+        # 与 [start, end) 有交集的磁盘块；块按首条记录的日期存放，向前多看一天
+        day = datetime.date.fromtimestamp(start) - datetime.timedelta(days=1)
+        last = datetime.date.fromtimestamp(end)
+        while day <= last:
+            for block in self._day_index(day.isoformat()).get(key, ()):
+                if block.t_max >= start and block.t_min < end:
+                    yield block
+            day += datetime.timedelta(days=1)
+
+    # ---- 查询 ----
+
+    def keys(self):
+        return list(self.rings)
+
+    def latest(self, key):
+        # 返回 (时间戳, CPU%, 内存%)，没有数据时返回 None
+        ring = self.rings.get(key)
+        return ring.latest() if ring else None
+
+    def window_stats(self, key, metric='cpu', start=None, end=None):
+        """
+        返回 [start, end] 时间窗口内指定指标的 {'count', 'min', 'max', 'avg'}，没有数据时返回 None。
+        环形缓冲区覆盖的部分直接在内存中计算，更早的部分读取磁盘块。
+        """
+        end = time.time() if end is None else end
+        start = 0 if start is None else start
+        count, total, low, high = 0, 0.0, None, None
+        with self.lock:
+            ring = self.rings.get(key)
+            ring_start = ring.oldest() if ring else None
+            if ring:
+                values = ring.values[metric]
+                for lo, hi in ring.ranges(max(start, ring_start), end):
+                    part = values[lo:hi]
+                    count += len(part)
+                    total += sum(part)
+                    low = min(part) if low is None else min(low, min(part))
+                    high = max(part) if high is None else max(high, max(part))
+        disk_end = end + 1e-6 if ring_start is None else min(ring_start, end + 1e-6)
+        if start < disk_end:
+            for block in self._disk_blocks(key, start, disk_end):
+                if block.t_min >= start and block.t_max < disk_end:
+                    b_min, b_max, b_sum = block.stats[metric]
+                    count += block.count
+                    total += b_sum / 10
+                    b_min, b_max = b_min / 10, b_max / 10
+                else:
+                    timestamps, columns = self._read_block(block)
+                    lo = bisect.bisect_left(timestamps, start)
+                    hi = bisect.bisect_left(timestamps, disk_end)
+                    if lo >= hi:
+                        continue
+                    part = columns[metric][lo:hi]
+                    count += len(part)
+                    total += sum(part) / 10
+                    b_min, b_max = min(part) / 10, max(part) / 10
+                low = b_min if low is None else min(low, b_min)
+                high = b_max if high is None else max(high, b_max)
+        if count == 0:
+            return None
+        return {'count': count, 'min': round(low, 1), 'max': round(high, 1), 'avg': round(total / count, 1)}
+
+    def series(self, key, metric='cpu', start=None, end=None, step=300):
+        """
+        按 step 秒分桶降采样，返回 [(桶起始时间, 平均值)]
+        """
+        end = time.time() if end is None else end
+        start = end - 86400 if start is None else start
+        buckets = collections.defaultdict(lambda: [0.0, 0])
+
+        def add(ts, value):
+            bucket = buckets[int((ts - start) // step)]
+            bucket[0] += value
+            bucket[1] += 1
+
+        with self.lock:
+            ring = self.rings.get(key)
+            ring_start = ring.oldest() if ring else None
+            if ring:
+                values = ring.values[metric]
+                for lo, hi in ring.ranges(max(start, ring_start), end):
+                    for i in range(lo, hi):
+                        add(ring.ts[i], values[i])
+        disk_end = end + 1e-6 if ring_start is None else min(ring_start, end + 1e-6)
+        if start < disk_end:
+            for block in self._disk_blocks(key, start, disk_end):
+                first = int((block.t_min - start) // step)
+                if (block.t_min >= start and block.t_max < disk_end
+                        and first == int((block.t_max - start) // step)):
+                    # 整块落在同一个桶内，直接使用块头汇总
+                    buckets[first][0] += block.stats[metric][2] / 10
+                    buckets[first][1] += block.count
+                    continue
+                timestamps, columns = self._read_block(block)
+                for ts, value in zip(timestamps, columns[metric]):
+                    if start <= ts < disk_end:
+                        add(ts, value / 10)
+        return [(start + index * step, round(total / count, 1))
+                for index, (total, count) in sorted(buckets.items())]
+
+    def top_n(self, n=10, metric='cpu', window=300, now=None):
+        """
+        最近 window 秒内平均值最高的 n 个客户端，返回 [(key, 平均值)]
+        """
+        now = time.time() if now is None else now
+        start = now - window
+        averages = []
+        with self.lock:
+            for key, ring in self.rings.items():
+                values = ring.values[metric]
+                count, total = 0, 0.0
+                for lo, hi in ring.ranges(start, now):
+                    count += hi - lo
+                    total += sum(values[lo:hi])
+                if count:
+                    averages.append((total / count, key))
+        return [(key, round(avg, 1)) for avg, key in heapq.nlargest(n, averages)]
@@ -0,0 +1,64 @@
+import time
+
+from commands import NO_REPLY, CommandTracker
+from power import PowerScheduler
+
+
+class StubServer:
+    # send_command 与 ControlServer.send_command 相同：帧协议客户端等待带编号的回复，旧版客户端等待或记为已发送
+    def __init__(self, framed, legacy):
+        self.commands = CommandTracker(timeout=30)
+        self.framed = set(framed)
+        self.legacy = set(legacy)
+        self.sent = []
+
+    def send_command(self, command, targets, timeout=None):
+        pending = self.commands.issue(command, timeout)
+        for ip in targets:
+            self.sent.append((command, ip))
+            if ip in self.framed:
+                pending.expect(ip)
+            elif not self.commands.expect_legacy(pending, ip):
+                pending.finish(ip, NO_REPLY)
+        return pending
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_cancel_closes_outstanding_commands():
+    framed = [f'10.0.0.{i}' for i in range(1, 5)]
+    server = StubServer(framed, legacy=['10.0.1.1'])
+    scheduler = PowerScheduler(server, wave_size=2, interval=10, retries=0)
+    scheduler.start()
+    try:
+        operation = scheduler.begin('shutdown', framed + ['10.0.1.1'])
+        wait_for(lambda: server.sent)
+        assert server.commands.pending
+        assert scheduler.cancel()
+        assert server.commands.pending == {}
+        assert server.commands.legacy == {}
+        assert operation.commands == []
+        assert operation.pending() == 0
+    finally:
+        scheduler.stop()
+
+
+def test_cancel_closes_legacy_waits():
+    # test 指令旧版客户端会回复 OK，取消后不应留下等待记录
+    server = StubServer([], legacy=['10.0.1.1', '10.0.1.2'])
+    scheduler = PowerScheduler(server, wave_size=1, interval=10, retries=0)
+    scheduler.start()
+    try:
+        scheduler.begin('test', ['10.0.1.1', '10.0.1.2'])
+        wait_for(lambda: server.sent)
+        assert server.commands.legacy
+        scheduler.cancel()
+        assert server.commands.pending == {}
+        assert server.commands.legacy == {}
+    finally:
+        scheduler.stop()
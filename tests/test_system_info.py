@@ -0,0 +1,86 @@
+from protocol import encode_status, format_status
+from system_info import Collector, MemoryCollector, MetricsCollector, get_system_status
+
+
+class FlakyMemory(MemoryCollector):
+    def __init__(self, fail):
+        super().__init__()
+        self.fail = fail
+
+    def collect(self, now):
+        if self.fail:
+            self.fail -= 1
+            raise OSError("读取内存失败")
+        return {'memory': 42.0}
+
+
+class Fixed(Collector):
+    name = 'fixed'
+
+    def __init__(self, value):
+        super().__init__()
+        self.value = value
+
+    def collect(self, now):
+        return dict(self.value)
+
+
+def test_failing_collector_without_previous_value_uses_defaults():
+    metrics = MetricsCollector([Fixed({'cpu': 5.0, 'boot_time': 1000.0}), FlakyMemory(fail=1)])
+    status = get_system_status('10.0.0.1', '展品', metrics)
+    assert 'memory' in metrics.errors
+    assert status['memory'] == 0.0
+    encode_status(status)
+    format_status(status)
+
+
+def test_failing_collector_keeps_previous_value():
+    flaky = FlakyMemory(fail=0)
+    metrics = MetricsCollector([Fixed({'cpu': 5.0, 'boot_time': 1000.0}), flaky])
+    assert metrics.sample(now=1)['memory'] == 42.0
+    flaky.fail = 1
+    status = get_system_status('10.0.0.1', '展品', metrics)
+    assert status['memory'] == 42.0
+    encode_status(status)
+
+
+def test_all_required_collectors_failing():
+    status = get_system_status('10.0.0.1', '展品', MetricsCollector([FlakyMemory(fail=1)]))
+    assert status['cpu'] == 0.0 and status['uptime'] >= 0
+    encode_status(status)
+
+
+class FakeProcess:
+    def __init__(self, pid, name):
+        self.pid = pid
+        self.info = {'name': name}
+        self.running = True
+
+    def is_running(self):
+        return self.running
+
+    def cpu_percent(self):
+        return 1.0
+
+    def memory_info(self):
+        class Info:
+            rss = 1048576
+        return Info()
+
+
+def test_process_collector_picks_up_new_processes(monkeypatch):
+    import psutil
+    from system_info import ProcessCollector
+    first = FakeProcess(1, 'Player.exe')
+    table = [first, FakeProcess(2, 'other.exe')]
+    monkeypatch.setattr(psutil, 'process_iter', lambda attrs=None: list(table))
+    collector = ProcessCollector(names=['player.exe'])
+    assert collector.collect(0)['app_running'] == 1
+    # 旧进程仍在运行时新启动的进程也要统计到
+    table.append(FakeProcess(3, 'player.exe'))
+    assert collector.collect(30)['app_running'] == 2
+    assert collector.processes[0] is first
+    # 其中一个退出后不再计入
+    first.running = False
+    table.remove(first)
+    assert collector.collect(60) == {'app_running': 1, 'app_cpu': 1.0, 'app_memory': 1.0}